@@ -1,21 +1,37 @@
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox, filedialog
+import queue
 import threading
 import sys
 from io import StringIO
 import os
+from time import sleep
+from playlist_downloader import core
+from playlist_downloader.cli import ENV_PREFIX
+from playlist_downloader.core import MAX_CONCURRENT_DOWNLOADS, get_playlist_videos_info, process_videos
+from playlist_downloader.daemon import (DAEMON_PORT, DAEMON_TOKEN_FILE, FINISHED_STATUSES, JOB_COMPLETED,
+                                        JOB_FAILED, JOB_PAUSED, JOB_QUEUED, JobError, api_request, read_token)
+from playlist_downloader.download_state import STATE_DB, DownloadState
+from playlist_downloader.integrity import is_intact
+from playlist_downloader.progress import format_eta, format_size
+
+# Event queue settings - worker threads post events, the Tk main loop applies them
+EVENT_POLL_MS = 50  # How often the main loop drains the event queue
+MAX_EVENTS_PER_TICK = 2000  # Events handled per drain, so a flood of logs can't freeze the window
+MAX_LOG_LINES = 5000  # Oldest lines are dropped from the console/log widgets past this
+DAEMON_POLL_SECONDS = 1  # How often a job handed to the daemon is checked on
 
 class RedirectText(object):
-    """Class to redirect stdout to a text widget"""
-    def __init__(self, text_widget, tag):
-        self.text_widget = text_widget
+    """Class to redirect stdout to a text widget, through the app's event queue"""
+    def __init__(self, post, widget_name, tag):
+        self.post = post
+        self.widget_name = widget_name
         self.tag = tag
         
     def write(self, string):
-        self.text_widget.configure(state="normal")
-        self.text_widget.insert(tk.END, string, (self.tag,))
-        self.text_widget.see(tk.END)
-        self.text_widget.configure(state="disabled")
+        # Called from any thread - the widget itself is only touched by the main loop
+        if string:
+            self.post("log", self.widget_name, self.tag, string)
         
     def flush(self):
         pass
@@ -45,6 +61,7 @@ class VideoDownloaderApp:
         self.video_quality = tk.StringVar(value="720")
         self.audio_format = tk.StringVar(value="mp3")
         self.filename_style = tk.StringVar(value="pretty")
+        self.parallel_downloads = tk.IntVar(value=MAX_CONCURRENT_DOWNLOADS)
         
         # Set up UI components
         self.setup_settings_frame()
@@ -52,13 +69,132 @@ class VideoDownloaderApp:
         self.setup_console_frame()
         self.setup_log_frame()
         
+        # Events posted by worker threads, applied to the widgets by the Tk main loop
+        self.events = queue.Queue()
+
         # Redirect stdout
-        sys.stdout = RedirectText(self.console_output, "console")
-        sys.stderr = RedirectText(self.log_output, "error")
+        sys.stdout = RedirectText(self.post, "console_output", "console")
+        sys.stderr = RedirectText(self.post, "log_output", "error")
         
         # Download control
         self.download_thread = None
-        self.stop_flag = False
+        self.daemon_job = None  # ID of the job the daemon is running for us, if one is
+        self.cancel_event = threading.Event()
+        self.download_rows = {}  # Download name -> row id in the downloads view
+        self.finished_downloads = 0
+
+        # Per-download progress comes from the engine's reporter thread, through the event queue
+        core.progress_tracker.render = False  # The console widget can't redraw a line
+        core.progress_tracker.add_listener(lambda snapshot: self.post("downloads", snapshot))
+
+        self.root.after(EVENT_POLL_MS, self.drain_events)
+
+    def post(self, kind, *payload):
+        """Queue an event for the main loop. Safe to call from any thread.
+
+        Events:
+            ("log", widget_name, tag, text) - append text to console_output/log_output
+            ("progress", value, maximum, status, percent) - update the progress widgets
+            ("downloads", snapshot) - per-download progress sampled by the engine
+            ("settled",) - a video was downloaded, skipped or failed
+        """
+        self.events.put((kind, payload))
+
+    def drain_events(self):
+        """Apply queued events in a batch (runs on the Tk main loop via after())"""
+        pending_logs = []  # [(widget_name, tag, [text, ...])], consecutive writes merged
+        progress = None
+        snapshots = []
+        settled = 0
+        try:
+            for _ in range(MAX_EVENTS_PER_TICK):
+                kind, payload = self.events.get_nowait()
+                if kind == "log":
+                    widget_name, tag, text = payload
+                    if pending_logs and pending_logs[-1][:2] == (widget_name, tag):
+                        pending_logs[-1][2].append(text)
+                    else:
+                        pending_logs.append((widget_name, tag, [text]))
+                elif kind == "progress":
+                    # Only the latest value of each field matters
+                    progress = [new if new is not None else old
+                                for new, old in zip(payload, progress or (None,) * len(payload))]
+                elif kind == "downloads":
+                    snapshots.append(payload[0])
+                elif kind == "settled":
+                    settled += 1
+        except queue.Empty:
+            pass
+
+        touched = set()
+        for widget_name, tag, texts in pending_logs:
+            widget = getattr(self, widget_name)
+            if widget_name not in touched:
+                widget.configure(state="normal")
+                touched.add(widget_name)
+            widget.insert(tk.END, "".join(texts), (tag,))
+        for widget_name in touched:
+            widget = getattr(self, widget_name)
+            self.trim_widget(widget)
+            widget.see(tk.END)
+            widget.configure(state="disabled")
+
+        if progress:
+            value, maximum, status, percent = progress
+            if maximum is not None:
+                self.progress_bar["maximum"] = maximum
+            if value is not None:
+                self.progress_bar["value"] = value
+            if status is not None:
+                self.progress_status.config(text=status)
+            if percent is not None:
+                self.progress_percent.config(text=percent)
+
+        for snapshot in snapshots:
+            self.update_download_rows(snapshot)
+        if settled:
+            # Failures count too - the bar shows how much of the playlist is done with
+            self.finished_downloads += settled
+            maximum = self.progress_bar["maximum"] or 1
+            done = min(self.finished_downloads, maximum)
+            self.progress_bar["value"] = done
+            self.progress_percent.config(text=f"{done / maximum * 100:.1f}%")
+
+        # Come back sooner while there is a backlog
+        self.root.after(1 if not self.events.empty() else EVENT_POLL_MS, self.drain_events)
+
+    def update_download_rows(self, snapshot):
+        """Show one row per active download"""
+        names = {download['name'] for download in snapshot}
+        for name in [name for name in self.download_rows if name not in names]:
+            self.downloads_view.delete(self.download_rows.pop(name))  # Finished between two samples
+        for download in snapshot:
+            name = download['name']
+            row = self.download_rows.get(name)
+            if download['finished']:
+                if row:
+                    self.downloads_view.delete(row)
+                    del self.download_rows[name]
+                continue
+
+            total = download['total']
+            percent = f"{download['downloaded'] / total * 100:.1f}%" if total else "-"
+            values = (
+                percent,
+                format_size(download['downloaded']) + (f" / {format_size(total)}" if total else ""),
+                f"{format_size(download['speed'])}/s",
+                format_eta(download['eta'])
+            )
+            if row:
+                self.downloads_view.item(row, values=values)
+            else:
+                self.download_rows[name] = self.downloads_view.insert("", tk.END, text=name, values=values)
+
+    def trim_widget(self, widget):
+        """Drop the oldest lines of a text widget beyond MAX_LOG_LINES"""
+        lines = int(widget.index("end-1c").split(".")[0])
+        if lines > MAX_LOG_LINES:
+            widget.delete("1.0", f"{lines - MAX_LOG_LINES + 1}.0")
         
     def create_frames(self):
         """Create main application frames"""
@@ -107,10 +243,16 @@ class VideoDownloaderApp:
         filename_combo = ttk.Combobox(self.settings_frame, textvariable=self.filename_style, 
                                      values=["pretty", "basic", "nerdy"], width=8)
         filename_combo.grid(row=4, column=1, padx=5, pady=2, sticky=tk.W)
+
+        # Parallel downloads
+        ttk.Label(self.settings_frame, text="Parallel Downloads:").grid(row=5, column=0, sticky=tk.W, padx=5, pady=2)
+        parallel_spin = ttk.Spinbox(self.settings_frame, textvariable=self.parallel_downloads,
+                                    from_=1, to=16, width=6)
+        parallel_spin.grid(row=5, column=1, padx=5, pady=2, sticky=tk.W)
         
         # Button frame
         button_frame = ttk.Frame(self.settings_frame)
-        button_frame.grid(row=0, column=2, rowspan=5, padx=10, sticky=tk.NSEW)
+        button_frame.grid(row=0, column=2, rowspan=6, padx=10, sticky=tk.NSEW)
         
         # Action buttons
         ttk.Button(button_frame, text="Start Download", command=self.start_download).pack(side=tk.LEFT, padx=5)
@@ -142,6 +284,22 @@ class VideoDownloaderApp:
         
         self.progress_percent = ttk.Label(progress_text_frame, text="0%")
         self.progress_percent.pack(side=tk.RIGHT)
+
+        # One row per running download
+        self.downloads_view = ttk.Treeview(
+            self.progress_frame,
+            columns=("progress", "downloaded", "speed", "eta"),
+            height=4
+        )
+        self.downloads_view.heading("#0", text="Video")
+        self.downloads_view.heading("progress", text="Progress")
+        self.downloads_view.heading("downloaded", text="Downloaded")
+        self.downloads_view.heading("speed", text="Speed")
+        self.downloads_view.heading("eta", text="ETA")
+        self.downloads_view.column("#0", width=380)
+        for column, width in (("progress", 80), ("downloaded", 160), ("speed", 100), ("eta", 80)):
+            self.downloads_view.column(column, width=width, anchor=tk.E)
+        self.downloads_view.pack(fill=tk.X, pady=(5, 0))
         
     def setup_console_frame(self):
         """Configure console output frame"""
@@ -185,7 +343,7 @@ class VideoDownloaderApp:
             messagebox.showwarning("Already Running", "Download is already in progress!")
             return
             
-        self.stop_flag = False
+        self.cancel_event = threading.Event()
         self.clear_console()
         print("Starting download process...")
         
@@ -193,69 +351,137 @@ class VideoDownloaderApp:
         self.progress_bar["value"] = 0
         self.progress_status.config(text="Preparing download...")
         self.progress_percent.config(text="0%")
+        self.downloads_view.delete(*self.downloads_view.get_children())
+        self.download_rows = {}
+        self.finished_downloads = 0
+        self.daemon_job = None
+
+        # Tk variables are read here, on the main thread, and handed to the worker
+        settings = {
+            'api_key': self.api_key.get(),
+            'playlist_url': self.playlist_url.get(),
+            'workers': max(int(self.parallel_downloads.get()), 1),
+            'cobalt_options': {
+                'videoQuality': self.video_quality.get(),
+                'audioFormat': self.audio_format.get(),
+                'filenameStyle': self.filename_style.get()
+            }
+        }
         
         # Start download in separate thread
-        self.download_thread = threading.Thread(target=self.run_download, daemon=True)
+        self.download_thread = threading.Thread(target=self.run_download, args=(settings,), daemon=True)
         self.download_thread.start()
         
-    def run_download(self):
+    def find_daemon(self):
+        """Returns (port, token) of a daemon serving this directory, or None to download here"""
+        if not os.path.exists(DAEMON_TOKEN_FILE):
+            print("No download daemon serves this directory - downloading in this window")
+            return None
+        port = int(os.environ.get(ENV_PREFIX + 'DAEMON_PORT') or DAEMON_PORT)
+        try:
+            token = read_token(DAEMON_TOKEN_FILE)
+            api_request('GET', '/status', port, token=token)
+        except JobError as e:
+            print(f"⚠️ Found {DAEMON_TOKEN_FILE} but no daemon answers ({e}) - downloading in this window")
+            return None
+        return port, token
+
+    def run_daemon_job(self, settings, port, token):
+        """Hands the playlist to the daemon as a job and follows it until it ends"""
+        job = api_request('POST', '/jobs', port, body={'url': settings['playlist_url']}, token=token)
+        self.daemon_job = job['id']
+        print(f"📨 Sent to the download daemon on port {port} as job {job['id']} - "
+              f"its own quality, format and worker settings apply")
+        self.post("progress", 0, 1, f"Job {job['id']} queued in the daemon", "0%")
+
+        while job['status'] not in FINISHED_STATUSES:
+            if self.cancel_event.is_set():
+                try:
+                    job = api_request('POST', f"/jobs/{job['id']}/cancel", port, token=token)
+                except JobError as e:
+                    print(f"⚠️ Could not cancel job {job['id']}: {e}")
+                break
+            sleep(DAEMON_POLL_SECONDS)
+            status = api_request('GET', '/status', port, token=token)
+            running = status['running_job']
+            if running and running['id'] == job['id']:
+                job, progress = running, status['progress'] or {}
+                listed, settled = progress.get('listed', 0), progress.get('settled', 0)
+                self.post("progress", settled, max(listed, 1),
+                          f"Job {job['id']}: {settled} of {listed} videos done",
+                          f"{settled / listed * 100:.1f}%" if listed else "0%")
+                self.post("downloads", status['downloads'])
+            else:
+                job = api_request('GET', f"/jobs/{job['id']}", port, token=token)
+                if job['status'] in (JOB_QUEUED, JOB_PAUSED):
+                    self.post("progress", None, None, f"Job {job['id']} is {job['status']} in the daemon", None)
+
+        self.post("downloads", [])
+        if job['status'] == JOB_COMPLETED:
+            self.post("progress", 1, 1, "Download completed!", "100%")
+        elif job['status'] == JOB_FAILED:
+            self.post("progress", None, None, f"Completed with {job['failed']} failures", None)
+            self.post("log", "log_output", "error", f"FAILED: job {job['id']} - {job['error']}\n")
+        else:
+            self.post("progress", None, None, "Download stopped", None)
+
+    def run_download(self, settings):
         """Main download process (to be run in thread)"""
         try:
+            # With a daemon running for this directory it does the downloading, not this window
+            daemon = self.find_daemon()
+            if daemon:
+                self.run_daemon_job(settings, *daemon)
+                return
+
             # Get playlist data
-            print(f"Retrieving playlist data from: {self.playlist_url.get()}")
-            video_data = get_playlist_videos_info(
-                self.api_key.get(), 
-                self.playlist_url.get()
-            )
+            print(f"Retrieving playlist data from: {settings['playlist_url']}")
+            video_data = get_playlist_videos_info(settings['api_key'], settings['playlist_url'])
             
             # Process videos
             if not isinstance(video_data, dict) or 'videos' not in video_data:
-                print("❌ Invalid playlist data received", "error")
+                print("❌ Invalid playlist data received", file=sys.stderr)
+                self.post("progress", None, None, "Failed to load playlist", None)
                 return
-                
-            videos = video_data['videos']
-            total_videos = len(videos)
-            print(f"Found {total_videos} videos in playlist")
-            
-            # Update progress bar maximum
-            self.progress_bar["maximum"] = total_videos
-            
-            # Process each video
-            for i, video in enumerate(videos):
-                if self.stop_flag:
-                    print("Download stopped by user")
-                    return
-                    
-                # Update progress
-                progress = (i + 1) / total_videos * 100
-                self.progress_bar["value"] = i + 1
-                self.progress_status.config(text=f"Downloading video {i+1} of {total_videos}")
-                self.progress_percent.config(text=f"{progress:.1f}%")
-                
-                # Download video
-                title = video.get('title', 'Untitled')
-                url = video.get('url', '')
-                
-                if not title or not url:
-                    print(f"Skipping invalid video entry")
-                    continue
-                    
-                print(f"\nProcessing: {title}")
-                fn_getVid(title, url)
-                
+
+            # Videos finished in an earlier run are skipped up front, so the bar counts real work
+            state = DownloadState(STATE_DB)
+            try:
+                completed = state.completed_videos()
+                videos = [
+                    video for video in video_data['videos']
+                    if not (video['id'] in completed and is_intact(completed[video['id']]))
+                ]
+                print(f"Found {len(video_data['videos'])} videos in playlist, {len(videos)} to download")
+                self.post("progress", 0, len(videos) or 1,
+                          f"Downloading {len(videos)} videos, {settings['workers']} at a time", "0%")
+
+                core.COBALT_OPTIONS.update(settings['cobalt_options'])
+                failures = process_videos({'videos': videos}, settings['workers'], state=state,
+                                          cancel_event=self.cancel_event,
+                                          on_settled=lambda video, failure: self.post("settled"))
+            finally:
+                state.close()
+
             # Final update
-            self.progress_status.config(text="Download completed!")
-            print("\n✅ All videos downloaded successfully!")
+            if self.cancel_event.is_set():
+                self.post("progress", None, None, "Download stopped", None)
+            elif failures:
+                self.post("progress", None, None, f"Completed with {len(failures)} failures", None)
+                for item in failures:
+                    self.post("log", "log_output", "error", f"FAILED: {item['title']} ({item['url']})\n")
+            else:
+                self.post("progress", None, None, "Download completed!", None)
             
         except Exception as e:
-            print(f"❌ Download failed: {str(e)}", "error")
-            self.log_output.insert(tk.END, f"ERROR: {str(e)}\n", "error")
+            print(f"❌ Download failed: {str(e)}")
+            self.post("log", "log_output", "error", f"ERROR: {str(e)}\n")
             
     def stop_download(self):
-        """Stop the current download process"""
+        """Stop the current download process, aborting the transfers in flight"""
         if self.download_thread and self.download_thread.is_alive():
-            self.stop_flag = True
-            print("Stopping download after current video...")
+            self.cancel_event.set()
+            print("Stopping downloads...")
             self.progress_status.config(text="Stopping...")
         else:
             messagebox.showinfo("Info", "No active download to stop")
@@ -291,32 +517,15 @@ class VideoDownloaderApp:
             
     def on_closing(self):
         """Handle window closing event"""
-        if self.download_thread and self.download_thread.is_alive():
+        if self.daemon_job is not None and self.download_thread and self.download_thread.is_alive():
+            self.root.destroy()  # The daemon carries on with the job without us
+        elif self.download_thread and self.download_thread.is_alive():
             if messagebox.askyesno("Confirm", "Download is in progress. Are you sure you want to quit?"):
-                self.stop_flag = True
+                self.cancel_event.set()
                 self.root.destroy()
         else:
             self.root.destroy()
 
-# Replace with your actual functions
-def get_playlist_videos_info(api_key, playlist_url):
-    """Mock function - replace with your actual implementation"""
-    return {
-        'videos': [
-            {'title': 'Video 1', 'url': 'https://youtube.com/video1'},
-            {'title': 'Video 2', 'url': 'https://youtube.com/video2'},
-            {'title': 'Video 3', 'url': 'https://youtube.com/video3'},
-        ]
-    }
-
-def fn_getVid(title, url):
-    """Mock function - replace with your actual implementation"""
-    print(f"Downloading {title} from {url}")
-    # Simulate download progress
-    for i in range(5):
-        print(f"Progress: {i*20}%")
-    print(f"✅ Finished downloading {title}")
-
 if __name__ == "__main__":
     root = tk.Tk()
     app = VideoDownloaderApp(root)
@@ -0,0 +1,55 @@
+"""
+YouTube playlist downloader - lists playlists through the YouTube Data API and downloads
+every video through a cobalt instance.
+
+    from playlist_downloader import get_playlist_videos_info, process_videos
+
+    videos = get_playlist_videos_info(api_key, playlist_url)
+    failures = process_videos(videos, max_workers=4)
+
+Submodules are imported on first use, so `import playlist_downloader` (and the CLI's
+argument parsing) does not pay for requests and googleapiclient up front.
+"""
+from importlib import import_module
+
+# Public name -> submodule it lives in
+_EXPORTS = {
+    'COBALT_OPTIONS': 'core',
+    'MAX_CONCURRENT_DOWNLOADS': 'core',
+    'DownloadCancelled': 'core',
+    'enrich_videos': 'core',
+    'fn_getVid': 'core',
+    'get_playlist_id_from_url': 'core',
+    'get_playlist_videos_info': 'core',
+    'get_video_id_from_url': 'core',
+    'iter_batch_videos': 'core',
+    'iter_playlist_videos': 'core',
+    'iter_synced_pages': 'core',
+    'process_tunnel_download': 'core',
+    'process_videos': 'core',
+    'resolve_playlist_url': 'core',
+    'resolve_tunnel': 'core',
+    'sync_playlist_videos': 'core',
+    'BandwidthScheduler': 'bandwidth',
+    'TokenBucket': 'bandwidth',
+    'ContentStore': 'content_store',
+    'Daemon': 'daemon',
+    'DownloadState': 'download_state',
+    'EventLog': 'events',
+    'JobQueue': 'daemon',
+    'PlaylistCache': 'playlist_cache',
+    'PostProcessor': 'postprocess',
+    'ProgressTracker': 'progress',
+}
+
+__all__ = sorted(_EXPORTS)
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(f'.{_EXPORTS[name]}', __name__), name)
+    globals()[name] = value  # Later lookups skip __getattr__
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
@@ -0,0 +1,175 @@
+import threading
+from datetime import datetime
+from time import monotonic, sleep
+
+
+def check_rate(rate):
+    """Raises ValueError unless `rate` is None (unlimited) or a positive, finite number of bytes per second."""
+    if rate is not None and not 0 < rate < float('inf'):
+        raise ValueError(f"Invalid bandwidth rate {rate!r} - it must be above 0 (None for unlimited)")
+    return rate
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiting throughput to `rate` bytes per second.
+    One bucket can be shared by any number of downloads, which then split the rate
+    between them. A rate of None means unlimited.
+    """
+    def __init__(self, rate=None, burst=None):
+        """
+        Args:
+            rate (float): Bytes per second, or None for no limit.
+            burst (float): Most bytes that can be consumed at once after an idle period.
+                           Defaults to one second's worth of `rate`.
+
+        Raises:
+            ValueError: If `rate` is 0 or negative.
+        """
+        self.lock = threading.Lock()
+        self.rate = check_rate(rate)
+        self.burst = burst if burst is not None else rate
+        self.tokens = self.burst or 0
+        self.last = monotonic()
+
+    def consume(self, amount):
+        """
+        Takes `amount` bytes out of the bucket, sleeping until the rate allows it.
+        The bucket is allowed to go into debt so a chunk bigger than the burst still passes;
+        whoever comes next waits for the debt to be paid off.
+        """
+        with self.lock:
+            if not self.rate:
+                return
+            now = monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            sleep(wait)
+
+    def set_rate(self, rate, burst=None):
+        """
+        Changes the rate (bytes per second, None for unlimited) while downloads are running.
+        Downloads pick the new rate up with their next chunk.
+        Raises:
+            ValueError: If `rate` is 0 or negative.
+        """
+        check_rate(rate)
+        with self.lock:
+            now = monotonic()
+            if self.rate:
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.rate = rate
+            self.burst = burst if burst is not None else rate
+            if self.burst is None:
+                self.tokens = 0
+            else:
+                self.tokens = min(self.tokens, self.burst)
+
+
+class DownloadThrottle:
+    """
+    Throttle for a single download: its own optional cap on top of the shared bucket,
+    so one download can be held below its share of the global limit.
+    """
+    def __init__(self, shared_bucket, rate=None):
+        """
+        Args:
+            shared_bucket (TokenBucket): The global bucket shared by every download.
+            rate (float): Cap for this download in bytes per second, or None.
+        """
+        self.shared_bucket = shared_bucket
+        self.bucket = TokenBucket(rate)
+
+    def consume(self, amount):
+        self.bucket.consume(amount)
+        self.shared_bucket.consume(amount)
+
+
+def parse_schedule(spec):
+    """
+    Parses a bandwidth schedule such as '23:00-07:00=unlimited,07:00-23:00=2'.
+    Each entry is a time window (local time, may wrap past midnight) and a rate in MB/s,
+    or 'unlimited' to lift the limit. A rate of 0 is refused rather than read as either.
+    Args:
+        spec (str): The schedule.
+
+    Returns:
+        list: (start_minute, end_minute, bytes_per_second or None) tuples.
+
+    Raises:
+        ValueError: If an entry is malformed or its rate isn't positive.
+    """
+    schedule = []
+    for entry in filter(None, (part.strip() for part in spec.split(','))):
+        try:
+            window, rate = entry.split('=')
+            start, end = (datetime.strptime(t.strip(), '%H:%M') for t in window.split('-'))
+        except ValueError:
+            raise ValueError(f"Invalid bandwidth schedule entry '{entry}', expected HH:MM-HH:MM=MBPS")
+        rate = rate.strip().lower()
+        if rate in ('unlimited', 'none'):
+            bytes_per_second = None
+        else:
+            try:
+                bytes_per_second = float(rate) * 1024 * 1024
+            except ValueError:
+                raise ValueError(f"Invalid rate '{rate}' in bandwidth schedule entry '{entry}', "
+                                 f"expected MB/s or 'unlimited'")
+            if not 0 < bytes_per_second < float('inf'):
+                raise ValueError(f"Bandwidth schedule entry '{entry}' needs a positive rate - "
+                                 f"write 'unlimited' to lift the limit")
+        schedule.append((start.hour * 60 + start.minute, end.hour * 60 + end.minute, bytes_per_second))
+    return schedule
+
+
+def scheduled_rate(schedule, default_rate=None, now=None):
+    """
+    Returns:
+        The rate of the first schedule window containing `now` (default: the current local
+        time), or `default_rate` when no window matches.
+    """
+    now = now or datetime.now()
+    minute = now.hour * 60 + now.minute
+    for start, end, rate in schedule:
+        if start <= end:
+            if start <= minute < end:
+                return rate
+        elif minute >= start or minute < end:  # Window wraps past midnight
+            return rate
+    return default_rate
+
+
+class BandwidthScheduler(threading.Thread):
+    """Background thread that moves a bucket's rate along a schedule (see parse_schedule)."""
+    def __init__(self, bucket, schedule, default_rate=None, interval=30):
+        """
+        Args:
+            bucket (TokenBucket): The bucket to adjust, usually the global one.
+            schedule (list): Parsed schedule.
+            default_rate (float): Rate used outside every window (None = unlimited).
+            interval (float): Seconds between checks of the clock.
+        """
+        super().__init__(daemon=True)
+        self.bucket = bucket
+        self.schedule = schedule
+        self.default_rate = default_rate
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        current = object()
+        while not self.stopped.is_set():
+            rate = scheduled_rate(self.schedule, self.default_rate)
+            if rate != current:
+                self.bucket.set_rate(rate)
+                limit = f"{rate / (1024 * 1024):.1f} MB/s" if rate else "unlimited"
+                print(f"\n🚦 Bandwidth limit is now {limit}")
+                current = rate
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,352 @@
+"""
+Offline benchmark of the download pipeline. A local stand-in for cobalt (the JSON API
+answering `status: tunnel`) and for its tunnels (byte streams with Range support) runs in a
+child process, and process_videos downloads from it - no YouTube, no cobalt container.
+
+    python -m playlist_downloader.benchmark                     # every scenario
+    python -m playlist_downloader.benchmark flaky segmented -o results.json
+    python -m playlist_downloader.benchmark --baseline results.json   # exit 1 on a regression
+
+Each scenario runs in a process of its own and reports throughput, CPU time and the
+peak memory of that process.
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import re
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import monotonic, process_time, sleep, time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+MB = 1024 * 1024
+BLOCK = bytes(range(256)) * 256  # 64 KB pattern the fake tunnels repeat as video data
+REGRESSION_TOLERANCE = 0.15  # Throughput drop (15%) that --baseline reports as a regression
+REPEAT = 3  # Runs per scenario; the median one is reported, since single runs are noisy
+
+# Options of the fake server, with their defaults
+SERVER_DEFAULTS = {
+    'size': 20 * MB,  # Bytes served per tunnel
+    'resolve_latency': 0.0,  # Seconds before cobalt answers
+    'latency': 0.0,  # Seconds before a tunnel sends its headers
+    'bandwidth': None,  # Bytes per second per connection (None = as fast as possible)
+    'content_length': True,  # False sends no Content-Length and closes the connection at the end
+    'ranges': True,  # Honour Range requests (206) - False always sends the whole file
+    'fail_rate': 0.0,  # Share of tunnel responses cut off part way through
+    'seed': 1,  # Makes the failures repeatable
+}
+
+# Scenario name -> (description, fake server options, videos, workers, core setting overrides)
+SCENARIOS = {
+    'baseline': ("8 x 20 MB, no limits", {}, 8, 4, {}),
+    'sequential': ("8 x 20 MB, one worker", {}, 8, 1, {}),
+    'segmented': ("2 x 64 MB split into 4 ranges", {'size': 64 * MB}, 2, 2,
+                  {'SEGMENT_COUNT': 4, 'SEGMENT_MIN_SIZE': 32 * MB}),
+    'latency': ("8 x 5 MB, 300 ms cobalt, 100 ms first byte, 5 MB/s per connection",
+                {'size': 5 * MB, 'resolve_latency': 0.3, 'latency': 0.1, 'bandwidth': 5 * MB}, 8, 4, {}),
+    'no_content_length': ("4 x 20 MB without Content-Length", {'content_length': False}, 4, 4, {}),
+    'flaky': ("8 x 10 MB, 30% of streams cut off mid-way", {'size': 10 * MB, 'fail_rate': 0.3}, 8, 4, {}),
+}
+
+
+def fake_mp4_header(size):
+    """ftyp and moov boxes plus the header of an mdat box filling the rest of a `size` byte file."""
+    ftyp = struct.pack(">I4s4sI8s", 24, b'ftyp', b'isom', 512, b'isomiso2')
+    moov = struct.pack(">I4s", 8, b'moov')
+    mdat_size = size - len(ftyp) - len(moov)
+    return ftyp + moov + struct.pack(">I4s", mdat_size, b'mdat')
+
+
+class FakeCobaltHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like a real server, so connection pooling is exercised
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        # cobalt API - every video gets a tunnel on this same server
+        options = self.server.options
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        if options['resolve_latency']:
+            sleep(options['resolve_latency'])
+        video = re.sub(r'\W', '', request.get('url', '').rsplit('=', 1)[-1]) or 'video'
+        expiry = int((time() + 3600) * 1000)
+        body = json.dumps({
+            'status': 'tunnel',
+            'url': f"http://{self.headers.get('Host')}/tunnel/{video}?exp={expiry}",
+            'filename': f"{video}.mp4"
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        options = self.server.options
+        if self.path == '/':
+            # Instance info, which the cobalt pool's health probe asks for
+            body = json.dumps({'cobalt': {'version': 'fake'}}).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if not self.path.startswith('/tunnel/'):
+            self.send_error(404)
+            return
+        if options['latency']:
+            sleep(options['latency'])
+
+        size = options['size']
+        start, end = 0, size - 1
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if match and options['ranges']:
+            start = int(match.group(1))
+            end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            if start >= size:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'video/mp4')
+        if options['content_length']:
+            self.send_header('Content-Length', str(end + 1 - start))
+        else:
+            self.send_header('Connection', 'close')  # The end of the body is the end of the connection
+            self.close_connection = True
+        self.end_headers()
+
+        with self.server.random_lock:
+            cut = self.server.random.random() < options['fail_rate']
+            cut_at = start + int((end + 1 - start) * self.server.random.uniform(0.1, 0.9))
+        self.send_body(start, cut_at if cut else end + 1, options['bandwidth'], fake_mp4_header(size))
+        if cut:
+            self.close_connection = True  # Drop the connection with the body unfinished
+
+    def send_body(self, start, stop, bandwidth, header):
+        position = start
+        began = monotonic()
+        try:
+            while position < stop:
+                if position < len(header):
+                    chunk = header[position:stop]
+                else:
+                    offset = position % len(BLOCK)
+                    chunk = BLOCK[offset:offset + min(len(BLOCK) - offset, stop - position)]
+                self.wfile.write(chunk)
+                position += len(chunk)
+                if bandwidth:
+                    ahead = (position - start) / bandwidth - (monotonic() - began)
+                    if ahead > 0:
+                        sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # The client gave up on this stream
+
+
+def serve_fake_cobalt(options, ready):
+    """Runs the fake cobalt/tunnel server until the process is terminated (child process target)."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeCobaltHandler)
+    server.daemon_threads = True
+    server.options = dict(SERVER_DEFAULTS, **options)
+    server.random = random.Random(server.options['seed'])
+    server.random_lock = threading.Lock()
+    ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+@contextlib.contextmanager
+def fake_cobalt(**options):
+    """
+    Starts the fake server in a child process, so its CPU time doesn't count against the
+    downloader, and yields its base URL.
+    """
+    context = multiprocessing.get_context('spawn')
+    ready = context.Queue()
+    process = context.Process(target=serve_fake_cobalt, args=(options, ready), daemon=True)
+    process.start()
+    try:
+        yield f"http://127.0.0.1:{ready.get(timeout=30)}/"
+    finally:
+        process.terminate()
+        process.join()
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / MB if sys.platform == 'darwin' else peak / 1024  # Bytes on macOS, KB elsewhere
+
+
+def run_scenario(name, verbose=False):
+    """
+    Downloads a scenario's videos from a fresh fake server into a temporary directory.
+
+    Returns:
+        dict: The scenario's results - files, failures, bytes, seconds, throughput (MB/s),
+              cpu_seconds, cpu_percent, peak_rss_mb and retries.
+    """
+    from . import core
+    from .bandwidth import TokenBucket
+    from .cobalt_pool import CobaltPool
+    from .retry import RetryPolicy
+
+    description, server_options, video_count, workers, overrides = SCENARIOS[name]
+    saved = {setting: getattr(core, setting) for setting in overrides}
+    saved_pool = core.cobalt_pool
+    saved_policy = core.retry_policy
+    saved_limiter = core.bandwidth_limiter
+    saved_render = core.progress_tracker.render
+    work_dir = tempfile.mkdtemp(prefix=f"bench-{name}-")
+    cwd = os.getcwd()
+    videos = [{'id': f"bench{num:06d}", 'title': f"Video {num}",
+               'url': f"https://www.youtube.com/watch?v=bench{num:06d}"} for num in range(video_count)]
+
+    with fake_cobalt(**server_options) as endpoint:
+        try:
+            os.chdir(work_dir)
+            for setting, value in overrides.items():
+                setattr(core, setting, value)
+            core.cobalt_pool = CobaltPool([endpoint])
+            core.retry_policy = RetryPolicy()  # Fresh budget and breakers per scenario
+            core.bandwidth_limiter = TokenBucket(None)
+            core.progress_tracker.render = False
+
+            output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+            started, cpu_started = monotonic(), process_time()
+            with output:
+                failures = core.process_videos({'videos': videos}, workers)
+            elapsed, cpu = monotonic() - started, process_time() - cpu_started
+
+            downloaded = sum(os.path.getsize(f) for f in os.listdir('.') if f.endswith('.mp4'))
+            return {
+                'scenario': name,
+                'description': description,
+                'files': video_count - len(failures),
+                'failures': len(failures),
+                'bytes': downloaded,
+                'seconds': elapsed,
+                'throughput': downloaded / MB / elapsed if elapsed else 0.0,
+                'cpu_seconds': cpu,
+                'cpu_percent': cpu / elapsed * 100 if elapsed else 0.0,
+                'peak_rss_mb': peak_rss_mb(),
+                'retries': core.retry_policy.snapshot()['retries']
+            }
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(work_dir, ignore_errors=True)
+            for setting, value in saved.items():
+                setattr(core, setting, value)
+            core.cobalt_pool = saved_pool
+            core.retry_policy = saved_policy
+            core.bandwidth_limiter = saved_limiter
+            core.progress_tracker.render = saved_render
+
+
+def run_scenario_isolated(name, verbose=False):
+    """
+    Runs run_scenario in a fresh child process: ru_maxrss only ever grows within a process,
+    so that is the only way peak_rss_mb is the scenario's own and not the largest so far.
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(run_scenario, name, verbose).result()
+
+
+def benchmark_scenario(name, repeat=REPEAT, verbose=False):
+    """Runs a scenario `repeat` times and returns the run with the median throughput."""
+    runs = sorted((run_scenario_isolated(name, verbose) for _ in range(max(repeat, 1))), key=lambda r: r['throughput'])
+    result = runs[len(runs) // 2]
+    result['runs'] = [r['throughput'] for r in runs]
+    return result
+
+
+def format_results(results):
+    lines = [f"{'scenario':<18} {'files':>7} {'MB':>8} {'secs':>7} {'MB/s':>8} {'CPU s':>7} {'CPU%':>6} "
+             f"{'RSS MB':>7} {'retries':>7}"]
+    for r in results:
+        rss = f"{r['peak_rss_mb']:.0f}" if r['peak_rss_mb'] is not None else "-"
+        lines.append(f"{r['scenario']:<18} {r['files']:>3}/{r['files'] + r['failures']:<3} "
+                     f"{r['bytes'] / MB:>8.1f} {r['seconds']:>7.2f} {r['throughput']:>8.1f} "
+                     f"{r['cpu_seconds']:>7.2f} {r['cpu_percent']:>6.0f} {rss:>7} {r['retries']:>7}")
+    return "\n".join(lines)
+
+
+def find_regressions(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    """
+    Compares results with an earlier run.
+    Returns:
+        list: One message per scenario whose throughput dropped by more than `tolerance`
+              or that failed downloads the baseline completed.
+    """
+    previous = {r['scenario']: r for r in baseline}
+    regressions = []
+    for r in results:
+        before = previous.get(r['scenario'])
+        if not before:
+            continue
+        if before['throughput'] and r['throughput'] < before['throughput'] * (1 - tolerance):
+            regressions.append(f"{r['scenario']}: {r['throughput']:.1f} MB/s, was {before['throughput']:.1f} MB/s")
+        if r['failures'] > before['failures']:
+            regressions.append(f"{r['scenario']}: {r['failures']} failed downloads, was {before['failures']}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='playlist_downloader.benchmark',
+                                     description="Benchmark the downloader against a local fake cobalt.")
+    parser.add_argument('scenarios', nargs='*', help=f"Scenarios to run (default all: {', '.join(SCENARIOS)})")
+    parser.add_argument('-o', '--output', help="Write the results as JSON to this file")
+    parser.add_argument('--baseline', help="JSON results of an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE,
+                        help="Throughput drop reported as a regression (default 0.15 = 15%%)")
+    parser.add_argument('-n', '--repeat', type=int, default=REPEAT,
+                        help=f"Runs per scenario, the median is reported (default {REPEAT})")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Show the downloader's output")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario {', '.join(unknown)} (choose from {', '.join(SCENARIOS)})")
+
+    results = []
+    for name in args.scenarios or SCENARIOS:
+        print(f"▶️ {name}: {SCENARIOS[name][0]}", flush=True)
+        results.append(benchmark_scenario(name, args.repeat, args.verbose))
+    print()
+    print(format_results(results))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        for message in regressions:
+            print(f"❌ Regression - {message}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,645 @@
+"""
+Non-interactive command line for the playlist downloader, for cron jobs and systemd units.
+
+    python -m playlist_downloader --api-key KEY https://www.youtube.com/playlist?list=...
+
+Every option can also be set through an environment variable named after it
+(PLAYLIST_DOWNLOADER_WORKERS=8, PLAYLIST_DOWNLOADER_PROGRESS=0 for --no-progress) or a
+JSON config file with the same keys ({"workers": 8, "playlists": [...]}). Arguments win
+over the environment, which wins over the config file. The API key may also come from
+YOUTUBE_API_KEY.
+
+Exit status: 0 when every video was downloaded, 1 when some failed, 2 on a usage or
+configuration error.
+"""
+import argparse
+import json
+import os
+import re
+import signal
+import sqlite3
+import sys
+import threading
+
+ENV_PREFIX = 'PLAYLIST_DOWNLOADER_'
+CONFIG_ENV = ENV_PREFIX + 'CONFIG'
+# Read, first one found, when neither --config nor PLAYLIST_DOWNLOADER_CONFIG is given
+CONFIG_PATHS = (
+    os.path.join(os.path.expanduser('~'), '.config', 'playlist-downloader', 'config.json'),
+    '/etc/playlist-downloader/config.json'
+)
+
+EXIT_OK = 0
+EXIT_FAILURES = 1
+EXIT_USAGE = 2
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in ('1', 'true', 'yes', 'on'):
+        return True
+    if value in ('0', 'false', 'no', 'off', ''):
+        return False
+    raise ValueError(f"not a boolean: {value!r}")
+
+def parse_list(value):
+    # Environment variables hold the URLs separated by spaces or commas
+    if isinstance(value, list):
+        return [str(item) for item in value]
+    return [item for item in re.split(r'[\s,]+', str(value)) if item]
+
+# Setting name -> converter, shared by the environment and the config file
+SETTINGS = {
+    'api_key': str,
+    'playlists': parse_list,
+    'batch_file': str,
+    'output_dir': str,
+    'workers': int,
+    'cobalt_endpoint': parse_list,
+    'video_quality': str,
+    'audio_format': str,
+    'filename_style': str,
+    'max_bandwidth': float,
+    'max_bandwidth_per_download': float,
+    'bandwidth_schedule': str,
+    'state_db': str,
+    'cache_dir': str,
+    'playlist_cache': parse_bool,
+    'progress': parse_bool,
+    'metrics_port': int,
+    'metrics_summary': str,
+    'probe_container': parse_bool,
+    'write_buffer': int,
+    'enrich': parse_bool,
+    'order': str,
+    'quota_limit': int,
+    'postprocess': parse_list,
+    'postprocess_workers': int,
+    'postprocess_queue': int,
+    'store': str,
+    'store_link': str,
+    'daemon_port': int,
+    'event_log': str,
+}
+ENV_ALIASES = {'api_key': ('YOUTUBE_API_KEY',)}
+# Settings naming files or directories; relative ones are relative to where we were started,
+# not to the output directory main() switches to
+PATH_SETTINGS = ('batch_file', 'state_db', 'cache_dir', 'metrics_summary', 'store', 'event_log')
+DEFAULTS = {'playlists': [], 'progress': True}
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='playlist_downloader',
+        description="Download YouTube playlists through cobalt, without prompting.",
+        epilog=f"Options can also be set as {ENV_PREFIX}<OPTION> environment variables or in a "
+               f"JSON config file (--config, ${CONFIG_ENV} or {CONFIG_PATHS[0]})."
+    )
+    parser.add_argument('playlists', nargs='*', help="Playlist or channel URLs to download")
+    parser.add_argument('-c', '--config', help="JSON config file")
+    parser.add_argument('-k', '--api-key', help="YouTube Data API v3 key")
+    parser.add_argument('-f', '--batch-file', help="File with one playlist or channel URL per line")
+    parser.add_argument('-o', '--output-dir',
+                        help="Directory the videos, download state and failure log are written to")
+    parser.add_argument('-w', '--workers', type=int, help="Videos downloaded at the same time")
+    parser.add_argument('--cobalt-endpoint', action='append',
+                        help="URL of the cobalt API; repeat it (or separate URLs with commas) to balance "
+                             "the requests over several instances")
+    parser.add_argument('--video-quality', help="Video quality requested from cobalt, e.g. 1080")
+    parser.add_argument('--audio-format', help="Audio format requested from cobalt, e.g. mp3")
+    parser.add_argument('--filename-style', help="cobalt filename style (classic, pretty, basic, nerdy)")
+    parser.add_argument('--max-bandwidth', type=float,
+                        help="Total download speed limit shared by every download, in MB/s")
+    parser.add_argument('--max-bandwidth-per-download', type=float,
+                        help="Download speed limit for each single download, in MB/s")
+    parser.add_argument('--bandwidth-schedule',
+                        help="Time windows for the total limit, e.g. '23:00-07:00=unlimited,07:00-23:00=2' (MB/s, "
+                             "above 0); --max-bandwidth applies outside the windows")
+    parser.add_argument('--state-db', help="SQLite database recording finished downloads")
+    parser.add_argument('--cache-dir', help="Directory of the cached playlist listings")
+    parser.add_argument('--playlist-cache', action=argparse.BooleanOptionalAction, default=None,
+                        help="Sync playlists through the listing cache (default USE_PLAYLIST_CACHE)")
+    parser.add_argument('--enrich', action=argparse.BooleanOptionalAction, default=None,
+                        help="Look the videos up (1 API unit per 50) to skip private, deleted and live ones "
+                             "and learn their duration and size (default ENRICH_VIDEOS)")
+    parser.add_argument('--order', metavar='ORDER',
+                        help="Download order of the enriched videos: playlist (default), shortest, longest, "
+                             "smallest, largest, oldest or newest; anything but playlist lists every "
+                             "playlist before the first download")
+    parser.add_argument('--quota-limit', type=int,
+                        help="Most YouTube API quota units this run may spend (a day has 10000 by default)")
+    parser.add_argument('--progress', action=argparse.BooleanOptionalAction, default=None,
+                        help="Show download progress (default on)")
+    parser.add_argument('--metrics-port', type=int,
+                        help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics while running")
+    parser.add_argument('--metrics-summary', help="Write a JSON summary of the run's metrics to this file")
+    parser.add_argument('--probe-container', action=argparse.BooleanOptionalAction, default=None,
+                        help="Check the MP4 structure of every finished download (default PROBE_CONTAINER)")
+    parser.add_argument('--write-buffer', type=int,
+                        help="KB read from the connection and written to disk at a time (default 256)")
+    parser.add_argument('--postprocess', nargs='+', metavar='STEP',
+                        help="Post-process every download in worker processes, in this order: remux[=mkv], "
+                             "transcode[=libx265], extract-audio[=m4a|mp3|opus|flac], tag, thumbnail "
+                             "(ffmpeg), or your own module:function[=arg]")
+    parser.add_argument('--postprocess-workers', type=int,
+                        help="Processes running post-processing steps at the same time (default half the CPUs)")
+    parser.add_argument('--postprocess-queue', type=int,
+                        help="Files queued for post-processing before downloads wait for it "
+                             "(default twice the workers)")
+    parser.add_argument('--store', metavar='DIR',
+                        help="Content store shared between output directories: videos already in it are "
+                             "linked instead of downloaded again")
+    parser.add_argument('--store-link',
+                        help="How videos go into the store and back out: hardlink (default, no space used "
+                             "twice), reflink (copy-on-write, copies where the filesystem can't) or copy")
+    parser.add_argument('--store-gc', action='store_true',
+                        help="Only delete the stored videos no output directory links to any more, and exit")
+    parser.add_argument('--event-log', metavar='PATH',
+                        help="JSON-lines log of every video's events, kept across runs (default events.jsonl "
+                             "in the output directory)")
+    parser.add_argument('--retry-from-log', action='store_true',
+                        help="Download only the videos whose last attempt in the event log failed")
+    parser.add_argument('--analyze-log', action='store_true',
+                        help="Only report throughput and failure hotspots across the runs in the event log, and exit")
+    parser.add_argument('--daemon', action='store_true',
+                        help="Keep running and download the playlists queued through the local job API "
+                             "(the playlists given are queued first)")
+    parser.add_argument('--daemon-port', type=int, help="Port of the daemon's job API (default 8765)")
+    parser.add_argument('--submit', action='store_true',
+                        help="Only queue the playlists on the running daemon and exit")
+    parser.add_argument('--priority', type=int, default=0,
+                        help="Priority of the submitted playlists; higher runs first (default 0)")
+    parser.add_argument('--jobs', action='store_true', help="Only list the running daemon's jobs and exit")
+    parser.add_argument('--verify', action='store_true',
+                        help="Only check the files in the output directory against their manifest "
+                             "(size, SHA-256, MP4 structure) and exit; nothing is downloaded")
+    return parser
+
+def convert_settings(values, source):
+    """
+    Args:
+        values (dict): Raw setting values, keyed by setting name.
+        source (str): Where they came from, for error messages.
+
+    Returns:
+        dict: The values converted to their setting's type.
+
+    Raises:
+        ValueError: On an unknown setting or a value that doesn't convert.
+    """
+    settings = {}
+    for name, value in values.items():
+        if name not in SETTINGS:
+            raise ValueError(f"{source}: unknown setting '{name}'")
+        try:
+            settings[name] = SETTINGS[name](value)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"{source}: invalid value for '{name}': {e}")
+    return settings
+
+def load_config(path):
+    """Reads a JSON config file holding an object of settings."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            values = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        raise ValueError(f"Could not read config file {path}: {e}")
+    if not isinstance(values, dict):
+        raise ValueError(f"{path}: the config file must hold a JSON object")
+    return convert_settings(values, path)
+
+def env_settings(environ):
+    values = {}
+    for name in SETTINGS:
+        for key in (ENV_PREFIX + name.upper(),) + ENV_ALIASES.get(name, ()):
+            if environ.get(key):
+                values[name] = environ[key]
+                break
+    return convert_settings(values, "environment")
+
+def resolve_settings(args, environ=os.environ):
+    """
+    Merges the defaults, the config file, the environment and the arguments, in that order
+    of precedence (later wins).
+
+    Returns:
+        dict: Every setting in SETTINGS; None where nothing set it.
+    """
+    config_path = args.config or environ.get(CONFIG_ENV)
+    if config_path:
+        config = load_config(config_path)
+    else:
+        config = next((load_config(path) for path in CONFIG_PATHS if os.path.exists(path)), {})
+
+    settings = dict.fromkeys(SETTINGS)
+    settings.update(DEFAULTS)
+    settings.update(config)
+    settings.update(env_settings(environ))
+    settings.update({
+        name: value for name, value in vars(args).items()
+        if name in SETTINGS and value is not None and value != []
+    })
+    return settings
+
+def download_playlists(api_key, playlist_urls, max_workers, state, cache=None,
+                       enrich=True, order=None, cancel_event=None):
+    """
+    Downloads every playlist through one pipeline.
+
+    Returns:
+        list: The videos that still failed.
+    """
+    from .core import enrich_videos, iter_batch_videos
+    from .enrichment import order_videos
+
+    # Every playlist feeds the same download pipeline, so the concurrency and bandwidth
+    # limits apply to the whole batch. The playlists are streamed page by page either way;
+    # with the cache only the pages changed since the last run cost a full fetch.
+    videos = iter_batch_videos(api_key, playlist_urls, state, cache)
+    if enrich:
+        videos = enrich_videos(api_key, videos)
+        if order:
+            videos = order_videos(videos, order)
+    return download_videos(videos, max_workers, state, cancel_event)
+
+def download_videos(videos, max_workers, state, cancel_event=None):
+    """
+    Downloads the videos through one pipeline. Every download and cobalt request is already
+    retried by core.retry_policy, so a video that fails here is one the policy gave up on
+    (a non-retryable error, its attempts or the batch's retry budget used up) and is left
+    for --retry-from-log instead of being downloaded again straight away.
+    Setting `cancel_event` stops it (see process_videos).
+
+    Returns:
+        list: The videos that failed.
+    """
+    from .core import process_videos
+
+    failures = process_videos({'videos': videos}, max_workers, state=state, cancel_event=cancel_event)
+    if cancel_event is not None and cancel_event.is_set():
+        return failures
+    if not failures:
+        print("\n" + "✅" * 50)
+        print("All videos downloaded successfully!")
+        print("✅" * 50)
+        if os.path.exists("failed_downloads.txt"):
+            os.remove("failed_downloads.txt")  # Left by an earlier run whose failures are now done
+        return []
+
+    print("\n" + "❌" * 50)
+    print(f"Could not download {len(failures)} videos:")
+    for i, item in enumerate(failures, 1):
+        print(f"{i}. {item['title']}")
+    print("Failures saved in 'failed_downloads.txt' - run again with --retry-from-log to retry them")
+    print("❌" * 50)
+    return failures
+
+def verify_downloads(directory):
+    """
+    Checks every file recorded in the manifest of `directory`.
+
+    Returns:
+        int: EXIT_OK when all of them are intact, otherwise EXIT_FAILURES.
+    """
+    from .integrity import MANIFEST_FILE, verify_directory
+
+    if not os.path.exists(os.path.join(directory, MANIFEST_FILE)):
+        print(f"No {MANIFEST_FILE} in {os.path.abspath(directory)} - nothing to verify")
+        return EXIT_OK
+    problems = verify_directory(directory)
+    for name, reason in problems:
+        print(f"❌ {name}: {reason}")
+    if problems:
+        print(f"{len(problems)} damaged files - the next run downloads them again")
+        return EXIT_FAILURES
+    print("✅ Every file matches its manifest record")
+    return EXIT_OK
+
+def analyze_event_log(path):
+    """
+    Prints throughput and failure hotspots across every run in the event log.
+
+    Returns:
+        int: EXIT_OK.
+    """
+    from datetime import datetime
+    from .events import analyze, read_events
+    from .progress import format_size
+
+    def rate(throughput):
+        return f"{format_size(throughput)}/s" if throughput else "-"
+
+    report = analyze(read_events(path))
+    if not report['runs']:
+        print(f"No events in {os.path.abspath(path)}")
+        return EXIT_OK
+    totals = report['totals']
+    print(f"📊 {len(report['runs'])} runs: {totals['success']} videos downloaded ({format_size(totals['bytes'])} "
+          f"at {rate(totals['throughput'])} per download), {totals['failure']} failed, {totals['skip']} skipped, "
+          f"{totals['retry']} retries")
+    for run in report['runs']:
+        started = datetime.fromtimestamp(run['started']).strftime('%Y-%m-%d %H:%M')
+        print(f"  {started}  {run['success']:>5} ok  {run['failure']:>4} failed  {format_size(run['bytes']):>9}  "
+              f"{rate(run['throughput'])}")
+    if report['stages']:
+        print("Failures by stage: " + ", ".join(f"{stage} {count}" for stage, count in report['stages'].items()))
+    if report['errors']:
+        print("Most common errors:")
+        for error, count in report['errors']:
+            print(f"  {count:>5}× {error}")
+    if report['videos']:
+        print("Videos failing in the most runs:")
+        for video in report['videos']:
+            print(f"  {video['runs']:>5} runs  {video['title']} ({video['id']})")
+    return EXIT_OK
+
+def collect_store_garbage(directory):
+    """
+    Deletes the blobs of a content store that no downloaded file links to any more.
+
+    Returns:
+        int: EXIT_OK.
+    """
+    from .content_store import ContentStore
+
+    store = ContentStore(directory)
+    try:
+        blobs, freed, stale = store.gc()
+    finally:
+        store.close()
+    print(f"🧹 Removed {blobs} unused videos from the store ({freed / (1024 * 1024):.1f} MB freed, "
+          f"{stale} deleted or replaced links forgotten)")
+    return EXIT_OK
+
+def control_daemon(playlist_urls, port, submit, priority=0, directory="."):
+    """
+    Queues playlists on a running daemon (`submit`), or lists its jobs. The daemon's token
+    is read from `directory`, its output directory.
+
+    Returns:
+        int: EXIT_OK, or EXIT_FAILURES if the daemon refused or could not be reached.
+    """
+    from .daemon import DAEMON_HOST, DAEMON_PORT, DAEMON_TOKEN_FILE, JobError, api_request, read_token
+
+    port = port or DAEMON_PORT
+    try:
+        token = read_token(os.path.join(directory, DAEMON_TOKEN_FILE))
+        if submit:
+            for url in playlist_urls:
+                job = api_request('POST', "/jobs", port, DAEMON_HOST, {'url': url, 'priority': priority}, token)
+                print(f"📥 Queued job {job['id']}: {url} (priority {job['priority']})")
+            return EXIT_OK
+        jobs = api_request('GET', "/jobs", port, token=token)
+    except JobError as e:
+        print(f"❌ {e}")
+        return EXIT_FAILURES
+    if not jobs:
+        print("No jobs")
+    for job in jobs:
+        failed = f", {job['failed']} failed" if job['failed'] else ""
+        print(f"{job['id']:>5}  {job['status']:<9}  priority {job['priority']:<3}  "
+              f"{job['videos']} videos{failed}  {job['url']}")
+    return EXIT_OK
+
+def stop_on_signals(cancel_event):
+    """
+    Makes Ctrl+C and SIGTERM set `cancel_event`, so the workers abort their downloads (the
+    .part files are kept) and the run ends; a second Ctrl+C quits without waiting.
+    """
+    def handler(signum, frame):
+        if cancel_event.is_set():
+            raise KeyboardInterrupt
+        print("\n⏹️ Stopping - running downloads are aborted and resume on the next run (Ctrl+C again to quit now)")
+        cancel_event.set()
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, handler)
+
+def run_daemon(daemon, port):
+    """
+    Serves the job API and runs the queued jobs until SIGTERM or Ctrl+C.
+
+    Raises:
+        OSError: If the API port can't be bound.
+    """
+    from .daemon import DAEMON_HOST, DAEMON_TOKEN_FILE, start_api, write_token
+
+    server = start_api(daemon, port, token=write_token(DAEMON_TOKEN_FILE))
+    daemon.start()
+    print(f"🛰️ Daemon running - job API on http://{DAEMON_HOST}:{port}/jobs "
+          f"(token in {os.path.abspath(DAEMON_TOKEN_FILE)})")
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.set())
+    try:
+        while not stopped.wait(1):
+            pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("\n⏹️ Stopping the daemon - an unfinished job carries on at the next start")
+        server.shutdown()
+        daemon.stop()
+        if os.path.exists(DAEMON_TOKEN_FILE):
+            os.remove(DAEMON_TOKEN_FILE)
+    return EXIT_OK
+
+def main(argv=None, environ=os.environ):
+    """
+    Runs the downloader from command-line arguments; never reads stdin.
+
+    Returns:
+        int: The exit status (EXIT_OK, EXIT_FAILURES or EXIT_USAGE).
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        settings = resolve_settings(args, environ)
+    except ValueError as e:
+        parser.error(str(e))
+    for name in PATH_SETTINGS:
+        if settings[name]:
+            settings[name] = os.path.abspath(settings[name])
+
+    if args.verify:
+        return verify_downloads(settings['output_dir'] or ".")
+    if args.analyze_log:
+        from .events import EVENT_LOG
+        return analyze_event_log(os.path.join(settings['output_dir'] or ".", settings['event_log'] or EVENT_LOG))
+    if args.store_gc:
+        if not settings['store']:
+            parser.error("--store-gc needs --store")
+        return collect_store_garbage(settings['store'])
+    if settings['daemon_port'] is not None and not 0 < settings['daemon_port'] < 65536:
+        parser.error("daemon port must be between 1 and 65535")
+    if args.jobs:
+        return control_daemon([], settings['daemon_port'], False, directory=settings['output_dir'] or ".")
+
+    # Cheap modules only until the settings are known to be usable
+    from .bandwidth import BandwidthScheduler, parse_schedule
+    from .enrichment import ORDERS
+    from .storage import LINK_METHODS
+
+    playlist_urls = list(settings['playlists'])
+    if settings['batch_file']:
+        try:
+            from .core import read_playlist_urls
+            playlist_urls += read_playlist_urls(settings['batch_file'])
+        except OSError as e:
+            parser.error(f"Could not read batch file: {e}")
+    if args.submit:
+        if not playlist_urls:
+            parser.error("--submit needs the playlists to queue")
+        return control_daemon(playlist_urls, settings['daemon_port'], True, args.priority,
+                              settings['output_dir'] or ".")
+    if not playlist_urls and not args.daemon and not args.retry_from_log:
+        parser.error("no playlist given (pass URLs, --batch-file, or set them in the environment or config file)")
+    if not settings['api_key'] and not args.retry_from_log:
+        parser.error(f"no YouTube API key given (--api-key, {ENV_PREFIX}API_KEY or YOUTUBE_API_KEY)")
+    if settings['workers'] is not None and settings['workers'] < 1:
+        parser.error("workers must be at least 1")
+    if settings['write_buffer'] is not None and settings['write_buffer'] < 1:
+        parser.error("write buffer must be at least 1 KB")
+    if settings['order'] and settings['order'] not in ORDERS:
+        parser.error(f"unknown order '{settings['order']}' (one of {', '.join(ORDERS)})")
+    if settings['quota_limit'] is not None and settings['quota_limit'] < 1:
+        parser.error("quota limit must be at least 1")
+    for name in ('max_bandwidth', 'max_bandwidth_per_download'):
+        if settings[name] is not None and not 0 < settings[name] < float('inf'):
+            parser.error(f"{name.replace('_', ' ')} must be above 0 MB/s (leave it out for no limit)")
+    for name in ('postprocess_workers', 'postprocess_queue'):
+        if settings[name] is not None and settings[name] < 1:
+            parser.error(f"{name.replace('_', ' ')} must be at least 1")
+    if settings['store_link'] and settings['store_link'] not in LINK_METHODS:
+        parser.error(f"unknown store link method '{settings['store_link']}' (one of {', '.join(LINK_METHODS)})")
+    store_dir = settings['store']
+    post_processor = None
+    if settings['postprocess']:
+        from .postprocess import POSTPROCESS_WORKERS, PostProcessor, parse_steps
+        try:
+            steps = parse_steps(settings['postprocess'])
+        except ValueError as e:
+            parser.error(str(e))
+        post_processor = PostProcessor(steps, settings['postprocess_workers'] or POSTPROCESS_WORKERS,
+                                       settings['postprocess_queue'])
+    try:
+        schedule = parse_schedule(settings['bandwidth_schedule']) if settings['bandwidth_schedule'] else None
+    except ValueError as e:
+        parser.error(str(e))
+
+    if settings['output_dir']:
+        # The state database, cache and event log default to relative paths, so they follow
+        os.makedirs(settings['output_dir'], exist_ok=True)
+        os.chdir(settings['output_dir'])
+
+    from . import core, metrics
+    from .download_state import STATE_DB, DownloadState
+    from .events import EVENT_LOG, EventLog, failed_videos, read_events
+    from .http_client import connection_stats
+    from .playlist_cache import PLAYLIST_CACHE_DIR, PlaylistCache
+
+    if settings['cobalt_endpoint']:
+        core.cobalt_pool.set_endpoints(
+            [url for value in parse_list(settings['cobalt_endpoint']) for url in parse_list(value)])
+    for name, option in (('video_quality', 'videoQuality'), ('audio_format', 'audioFormat'),
+                         ('filename_style', 'filenameStyle')):
+        if settings[name]:
+            core.COBALT_OPTIONS[option] = settings[name]
+    if settings['max_bandwidth'] is not None:
+        core.bandwidth_limiter.set_rate(settings['max_bandwidth'] * 1024 * 1024)
+    if settings['max_bandwidth_per_download'] is not None:
+        core.MAX_BANDWIDTH_PER_DOWNLOAD = settings['max_bandwidth_per_download'] * 1024 * 1024
+    if schedule:
+        # Adjusts the shared limit as the day goes on, without restarting the batch
+        BandwidthScheduler(core.bandwidth_limiter, schedule, core.bandwidth_limiter.rate).start()
+    core.progress_tracker.render = settings['progress']
+    if settings['probe_container'] is not None:
+        core.PROBE_CONTAINER = settings['probe_container']
+    if settings['write_buffer']:
+        core.WRITE_BUFFER_SIZE = settings['write_buffer'] * 1024
+    core.post_processor = post_processor
+    if store_dir:
+        from .content_store import STORE_LINK, ContentStore
+        try:
+            core.content_store = ContentStore(store_dir, settings['store_link'] or STORE_LINK)
+        except (OSError, sqlite3.Error) as e:
+            parser.error(f"Could not open the content store {store_dir}: {e}")
+    core.api_quota.limit = settings['quota_limit']
+    enrich = core.ENRICH_VIDEOS if settings['enrich'] is None else settings['enrich']
+    event_log_path = settings['event_log'] or EVENT_LOG
+    retry_videos = failed_videos(read_events(event_log_path)) if args.retry_from_log else None
+    if settings['order'] not in (None, 'playlist') and not enrich:
+        parser.error("--order needs the video details --enrich looks up")
+    if settings['metrics_port'] is not None:
+        try:
+            metrics.start_server(settings['metrics_port'])
+        except OSError as e:
+            parser.error(f"Could not serve metrics on port {settings['metrics_port']}: {e}")
+        print(f"📈 Metrics on http://{metrics.METRICS_HOST}:{settings['metrics_port']}/metrics")
+
+    # Record of finished downloads, so videos already on disk are not fetched again
+    state = DownloadState(settings['state_db'] or STATE_DB)
+    use_cache = core.USE_PLAYLIST_CACHE if settings['playlist_cache'] is None else settings['playlist_cache']
+    cache = PlaylistCache(settings['cache_dir'] or PLAYLIST_CACHE_DIR) if use_cache else None
+    core.event_log = EventLog(event_log_path)
+    core.progress_tracker.add_listener(core.event_log.on_progress)
+    core.event_log.emit('run_start', playlists=playlist_urls or None, retry_from_log=args.retry_from_log or None,
+                        daemon=args.daemon or None, workers=settings['workers'] or core.MAX_CONCURRENT_DOWNLOADS)
+    failures = None
+    cancel_event = threading.Event()
+    if not args.daemon:
+        stop_on_signals(cancel_event)
+    try:
+        if args.retry_from_log:
+            if not retry_videos:
+                print(f"No failed videos in {event_log_path} - nothing to retry")
+                failures = []
+                return EXIT_OK
+            print(f"🔁 Retrying {len(retry_videos)} videos that failed in earlier runs")
+            failures = download_videos(retry_videos, settings['workers'] or core.MAX_CONCURRENT_DOWNLOADS,
+                                       state, cancel_event)
+        elif args.daemon:
+            from .daemon import DAEMON_PORT, JOBS_DB, Daemon, JobQueue
+            jobs = JobQueue(JOBS_DB)
+            daemon = Daemon(settings['api_key'], jobs, state, settings['workers'] or core.MAX_CONCURRENT_DOWNLOADS,
+                            cache, enrich, settings['order'])
+            for url in playlist_urls:
+                daemon.submit(url, args.priority)
+            try:
+                return run_daemon(daemon, settings['daemon_port'] or DAEMON_PORT)
+            except OSError as e:
+                parser.error(f"Could not serve the job API: {e}")
+            finally:
+                jobs.close()
+        else:
+            failures = download_playlists(settings['api_key'], playlist_urls,
+                                          settings['workers'] or core.MAX_CONCURRENT_DOWNLOADS,
+                                          state, cache, enrich, settings['order'],
+                                          cancel_event)
+    finally:
+        if post_processor:
+            post_processor.close()  # Before the state goes - finished files are recorded in it
+        state.close()
+        if core.content_store is not None:
+            core.content_store.close()
+        core.progress_tracker.remove_listener(core.event_log.on_progress)
+        core.event_log.emit('run_end', failures=None if failures is None else len(failures),
+                            postprocess_failures=len(post_processor.failures) if post_processor else None)
+        core.event_log.close()
+        if settings['metrics_summary']:
+            metrics.registry.write_summary(settings['metrics_summary'], playlists=playlist_urls,
+                                           failures=None if failures is None else len(failures),
+                                           api_units=core.api_quota.spent,
+                                           postprocess_failures=len(post_processor.failures) if post_processor else 0)
+            print(f"📈 Metrics summary written to {settings['metrics_summary']}")
+
+    connections = connection_stats()
+    print(f"\n🔌 {connections['requests']} HTTP requests over {connections['new_connections']} connections "
+          f"({connections['reused_connections']} reused)")
+    print(f"🎟️ YouTube API quota used: {core.api_quota.summary()}")
+    if post_processor and post_processor.failures:
+        print(f"⚠️ {len(post_processor.failures)} downloads could not be post-processed (kept as downloaded)")
+        return EXIT_FAILURES
+    return EXIT_FAILURES if failures or cancel_event.is_set() else EXIT_OK
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,217 @@
+import threading
+from time import monotonic, sleep
+import requests
+from .http_client import get_session
+
+# Cobalt pool settings
+HEALTH_INTERVAL = 30  # Seconds between two health probes of every instance
+HEALTH_TIMEOUT = 5  # Seconds an instance gets to answer a probe
+EJECT_AFTER_FAILURES = 3  # Consecutive failures that take an instance out of rotation
+EJECT_SECONDS = 60  # How long the first ejection lasts; doubled for each ejection in a row
+EJECT_MAX_SECONDS = 900  # Cap on the ejection time
+
+# cobalt error codes meaning the instance itself is blocked or throttled (by YouTube or by its
+# own rate limit) - the instance is ejected right away and the video tried on another one
+RATE_LIMIT_ERRORS = ('error.api.rate_exceeded', 'error.api.fetch.rate', 'error.api.youtube.login',
+                     'error.api.youtube.token_expired')
+# Codes about the video itself (private, removed, age-restricted...) - no instance will do better
+VIDEO_ERROR_PREFIX = 'error.api.content.'
+# Statuses whose url is the file itself. The others (picker, local-processing) mean the video
+# can't be fetched as one file - that is down to the video, not the instance
+FILE_STATUSES = ('tunnel', 'redirect')
+
+
+class CobaltError(Exception):
+    """
+    A cobalt instance didn't hand back a tunnel.
+    Attributes:
+        node_fault (bool): False when the video is the problem, so other instances aren't tried.
+        rate_limited (bool): The instance is being throttled and should be ejected at once.
+    """
+    def __init__(self, message, node_fault=True, rate_limited=False):
+        super().__init__(message)
+        self.node_fault = node_fault
+        self.rate_limited = rate_limited
+
+
+class CobaltNode:
+    def __init__(self, url):
+        self.url = url
+        self.outstanding = 0  # Requests in flight
+        self.failures = 0  # Consecutive failures
+        self.ejections = 0  # Ejections in a row, for the growing ejection time
+        self.ejected_until = 0.0
+        self.healthy = True  # Result of the last health probe
+        self.last_error = None
+        self.requests = 0
+
+
+class CobaltPool:
+    """
+    Spreads cobalt requests over several instances. Each request goes to the available
+    instance with the fewest requests in flight; a failed request fails over to an instance
+    it hasn't tried yet. Instances that keep failing, get rate-limited or answer with
+    something other than a tunnel are ejected for a while, and a background thread probes
+    every instance so ones that are down are skipped until they come back.
+    """
+    def __init__(self, endpoints, health_interval=HEALTH_INTERVAL):
+        self.lock = threading.Lock()
+        self.health_interval = health_interval
+        self.nodes = []
+        self.prober = None
+        self.set_endpoints(endpoints)
+
+    def set_endpoints(self, endpoints):
+        """Replaces the instances (keeping the state of ones that stay)."""
+        endpoints = [url if url.endswith('/') else url + '/' for url in endpoints]
+        if not endpoints:
+            raise ValueError("At least one cobalt endpoint is needed")
+        with self.lock:
+            existing = {node.url: node for node in self.nodes}
+            self.nodes = [existing.get(url) or CobaltNode(url) for url in dict.fromkeys(endpoints)]
+
+    @property
+    def endpoints(self):
+        with self.lock:
+            return [node.url for node in self.nodes]
+
+    def available(self, node, now):
+        return node.healthy and node.ejected_until <= now
+
+    def acquire(self, exclude=()):
+        """
+        Picks the instance for the next request and counts it as outstanding.
+        Args:
+            exclude (set): Instances already tried for this request; used only when
+                           nothing else is available.
+
+        Returns:
+            tuple: (node, fresh) - `fresh` is False when every available instance was in
+                   `exclude`, i.e. the request has been everywhere and should back off.
+        """
+        self.start_prober()
+        with self.lock:
+            now = monotonic()
+            candidates = ([node for node in self.nodes if self.available(node, now)]
+                          # All failing their probes - a probe can be wrong, so try the ones not ejected
+                          or [node for node in self.nodes if node.ejected_until <= now])
+            fresh = [node for node in candidates if node not in exclude]
+            if fresh:
+                pool, is_fresh = fresh, True
+            elif candidates:
+                pool, is_fresh = candidates, False
+            else:
+                # Everything is ejected or down - use the instance that comes back first rather than stall
+                pool, is_fresh = [min(self.nodes, key=lambda node: node.ejected_until)], not exclude
+            # Fewest in flight; ties go to the instance that has served the fewest requests so far
+            node = min(pool, key=lambda node: (node.outstanding, node.requests))
+            node.outstanding += 1
+            node.requests += 1
+            return node, is_fresh
+
+    def release(self, node, ok, error=None, eject=False):
+        """
+        Records the outcome of a request made through acquire().
+        Args:
+            node (CobaltNode): The instance.
+            ok (bool): Whether the instance did its job (a video-level error counts as ok).
+            error (str): What went wrong.
+            eject (bool): Take the instance out of rotation now, whatever its failure count.
+        """
+        with self.lock:
+            node.outstanding -= 1
+            if ok:
+                node.failures = 0
+                node.ejections = 0
+                return
+            node.failures += 1
+            node.last_error = error
+            if eject or node.failures >= EJECT_AFTER_FAILURES:
+                node.ejections += 1
+                duration = min(EJECT_SECONDS * 2 ** (node.ejections - 1), EJECT_MAX_SECONDS)
+                node.ejected_until = monotonic() + duration
+                node.failures = 0
+                print(f"🚫 cobalt {node.url} ejected for {duration}s ({error})")
+
+    def call(self, request, policy):
+        """
+        Runs `request(endpoint_url)` on the pool, failing over between instances and backing
+        off through `policy` (a RetryPolicy) once every available instance has been tried.
+        Raises:
+            CobaltError: A video-level error, at once.
+            Exception: The last error, once the policy gives up.
+        """
+        tried = set()
+        attempt = 1
+        while True:
+            node, fresh = self.acquire(tried)
+            if not fresh:
+                tried.clear()  # A new round over the instances, after the backoff below
+            policy.wait_for_host(node.url, attempt)
+            try:
+                result = request(node.url)
+            except CobaltError as e:
+                if not e.node_fault:
+                    self.release(node, True)
+                    raise
+                self.release(node, False, str(e), eject=e.rate_limited)
+                error = e
+            except Exception as e:
+                response = getattr(e, 'response', None)
+                rate_limited = response is not None and getattr(response, 'status_code', None) == 429
+                self.release(node, False, str(e), eject=rate_limited)
+                error = e
+            else:
+                self.release(node, True)
+                policy.record_success(node.url)
+                return result
+
+            tried.add(node)
+            with self.lock:
+                now = monotonic()
+                untried = any(self.available(other, now) and other not in tried for other in self.nodes)
+            if untried:
+                print(f"↪️ cobalt {node.url} failed ({error}), trying another instance")
+            else:
+                delay = policy.next_delay(node.url, error, attempt)
+                if delay is None:
+                    raise error
+                print(f"⚠️ No cobalt instance could resolve the video ({error}) - retrying in {delay:.1f}s")
+                sleep(delay)
+                tried.clear()
+            attempt += 1
+
+    def probe(self, node):
+        """Asks an instance for its info document (GET /), which every cobalt serves."""
+        try:
+            response = get_session().get(node.url, timeout=HEALTH_TIMEOUT)
+            healthy = response.status_code == 200 and 'cobalt' in response.json()
+        except (requests.RequestException, ValueError):
+            healthy = False
+        with self.lock:
+            if healthy != node.healthy:
+                print(f"{'💚' if healthy else '💔'} cobalt {node.url} is {'back up' if healthy else 'down'}")
+            node.healthy = healthy
+
+    def start_prober(self):
+        with self.lock:
+            if self.prober is not None or len(self.nodes) < 2:
+                return  # A single instance is used whatever its health, so probing gains nothing
+            self.prober = threading.Thread(target=self.run_prober, daemon=True)
+        self.prober.start()
+
+    def run_prober(self):
+        while True:
+            with self.lock:
+                nodes = list(self.nodes)
+            for node in nodes:
+                self.probe(node)
+            sleep(self.health_interval)
+
+    def snapshot(self):
+        """Returns {url: {'outstanding', 'requests', 'healthy', 'ejected'}} for every instance."""
+        with self.lock:
+            now = monotonic()
+            return {node.url: {'outstanding': node.outstanding, 'requests': node.requests,
+                               'healthy': node.healthy, 'ejected': node.ejected_until > now}
+                    for node in self.nodes}
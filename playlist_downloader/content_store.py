@@ -0,0 +1,207 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from time import time
+from .storage import link_file
+
+STORE_DB = "store.db"  # Inside the store directory, next to the objects
+OBJECTS_DIR = "objects"
+# How downloads go into the store and stored videos into a folder: hardlink (falling back to a
+# reflink, then a copy), reflink (copy-on-write, falling back to a copy) or copy. A hard link
+# costs no space anywhere; post-processing gives a file its own copy (storage.break_link)
+# before changing it in place, so tags and thumbnails don't reach the store
+STORE_LINK = 'hardlink'
+NAME_OPTIONS = ('filenameStyle',)  # cobalt options that only change the file's name, not its bytes
+
+
+def content_key(video_id, options):
+    """
+    The store key of a video: its ID plus every cobalt option that changes the downloaded
+    bytes (quality, codec, audio format...), so the same video at another quality is a
+    different blob while a different filenameStyle is not.
+    """
+    content = {name: value for name, value in options.items() if name not in NAME_OPTIONS}
+    return hashlib.sha256(json.dumps({'id': video_id, 'options': content}, sort_keys=True).encode()).hexdigest()
+
+
+class ContentStore:
+    """
+    Content-addressed store of downloaded videos, shared by every output folder (and every
+    run) that points at it. A video already in the store is hard-linked (or reflinked or
+    copied, if asked for or across filesystems) into the folder that wants it instead of
+    being downloaded again.
+
+    Each blob lives at objects/<key[:2]>/<key>. The SQLite index keeps the blobs, the name
+    cobalt gave each one per filenameStyle, and every file linked from a blob, with the
+    inode it had - a link whose file was deleted or replaced (e.g. by post-processing) no
+    longer counts, and gc() removes the blobs nothing counts on.
+    """
+    def __init__(self, root, link_method=STORE_LINK):
+        self.root = os.path.abspath(root)
+        self.link_method = link_method
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(self.root, OBJECTS_DIR), exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(self.root, STORE_DB), check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock, self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS blobs (
+                    key TEXT PRIMARY KEY,
+                    video_id TEXT NOT NULL,
+                    options TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    sha256 TEXT,
+                    created_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS names (
+                    key TEXT NOT NULL,
+                    filename_style TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    PRIMARY KEY (key, filename_style)
+                );
+                CREATE TABLE IF NOT EXISTS links (
+                    path TEXT PRIMARY KEY,
+                    key TEXT NOT NULL,
+                    method TEXT NOT NULL,
+                    device INTEGER NOT NULL,
+                    inode INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS links_key ON links (key);
+            """)
+
+    def blob_path(self, key):
+        return os.path.join(self.root, OBJECTS_DIR, key[:2], key)
+
+    def find(self, video_id, options):
+        """
+        Looks a video up.
+        Returns:
+            dict: 'key', 'path', 'size', 'sha256' and 'filename' (the name cobalt gives it with
+                  the options' filenameStyle, None if it was never downloaded with that style),
+                  or None if the video isn't stored (or its blob went missing).
+        """
+        key = content_key(video_id, options)
+        style = str(options.get('filenameStyle', ''))
+        with self.lock:
+            blob = self.conn.execute("SELECT * FROM blobs WHERE key = ?", (key,)).fetchone()
+            name = self.conn.execute("SELECT filename FROM names WHERE key = ? AND filename_style = ?",
+                                     (key, style)).fetchone()
+        if blob is None:
+            return None
+        path = self.blob_path(key)
+        try:
+            if os.path.getsize(path) != blob['size']:
+                raise OSError("blob size changed")
+        except OSError:
+            self.drop(key)  # Deleted or damaged behind our back - download it again
+            return None
+        return {'key': key, 'path': path, 'size': blob['size'], 'sha256': blob['sha256'],
+                'filename': name['filename'] if name else None}
+
+    def add(self, video_id, options, filename, sha256=None):
+        """
+        Takes a finished download into the store (as a link to it, so no space is used twice)
+        and records `filename` as linked to it.
+        Returns:
+            str: The store key.
+        """
+        key = content_key(video_id, options)
+        path = self.blob_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        method = link_file(filename, path, self.link_method)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO blobs (key, video_id, options, size, sha256, created_at) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET size = excluded.size, sha256 = excluded.sha256",
+                (key, video_id, json.dumps(options, sort_keys=True), os.path.getsize(path), sha256, time())
+            )
+        self.record_name(key, options, filename)
+        self.record_link(key, filename, method)
+        return key
+
+    def link(self, stored, target, options=None):
+        """
+        Puts a stored video at `target` (replacing whatever is there) and records the link.
+        Args:
+            stored (dict): A find() result.
+            target (str): Where the video should appear.
+            options (dict): The cobalt options, to remember `target`'s name for their filenameStyle.
+
+        Returns:
+            str: How it was linked - 'hardlink', 'reflink' or 'copy'.
+        """
+        method = link_file(stored['path'], target, self.link_method)
+        if options is not None:
+            self.record_name(stored['key'], options, target)
+        self.record_link(stored['key'], target, method)
+        return method
+
+    def record_name(self, key, options, filename):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO names (key, filename_style, filename) VALUES (?, ?, ?)",
+                (key, str(options.get('filenameStyle', '')), os.path.basename(filename))
+            )
+
+    def record_link(self, key, path, method):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO links (path, key, method, device, inode, size, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, key, method, stat.st_dev, stat.st_ino, stat.st_size, time())
+            )
+
+    def drop(self, key):
+        with self.lock, self.conn:
+            for table in ('blobs', 'names', 'links'):
+                self.conn.execute(f"DELETE FROM {table} WHERE key = ?", (key,))
+        try:
+            os.remove(self.blob_path(key))
+            os.rmdir(os.path.dirname(self.blob_path(key)))  # Only goes if it was the last blob in there
+        except OSError:
+            pass
+
+    def gc(self, dry_run=False, min_age=0):
+        """
+        Forgets links whose file is gone or was replaced, then deletes the blobs no link is
+        left for.
+        Args:
+            dry_run (bool): Only report what would be deleted.
+            min_age (float): Keep blobs added less than this many seconds ago.
+
+        Returns:
+            tuple: (blobs removed, bytes freed, stale links forgotten).
+        """
+        with self.lock:
+            links = [dict(row) for row in self.conn.execute("SELECT * FROM links")]
+            blobs = [dict(row) for row in self.conn.execute("SELECT key, size, created_at FROM blobs")]
+
+        stale = []
+        for link in links:
+            try:
+                stat = os.stat(link['path'])
+                if (stat.st_dev, stat.st_ino, stat.st_size) != (link['device'], link['inode'], link['size']):
+                    stale.append(link['path'])
+            except OSError:
+                stale.append(link['path'])
+        stale_paths = set(stale)
+        referenced = {link['key'] for link in links if link['path'] not in stale_paths}
+        cutoff = time() - min_age
+        garbage = [blob for blob in blobs if blob['key'] not in referenced and blob['created_at'] <= cutoff]
+
+        if not dry_run:
+            with self.lock, self.conn:
+                self.conn.executemany("DELETE FROM links WHERE path = ?", [(path,) for path in stale])
+            for blob in garbage:
+                self.drop(blob['key'])
+        return len(garbage), sum(blob['size'] for blob in garbage), len(stale)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,1615 @@
+"""
+Core of the playlist downloader - playlist listing, cobalt tunnel resolution and the
+download pipeline. Shared by the command line (cli.py) and pl-process-gui.py (GUI).
+"""
+import hashlib
+import json
+import os
+import queue
+import re
+import threading
+from collections.abc import Iterable, Sized
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager, nullcontext
+from time import monotonic, time, sleep
+from urllib.parse import parse_qs, urlparse
+from . import metrics
+from .bandwidth import DownloadThrottle, TokenBucket
+from .cobalt_pool import FILE_STATUSES, RATE_LIMIT_ERRORS, VIDEO_ERROR_PREFIX, CobaltError, CobaltPool
+from .enrichment import VIDEOS_PER_REQUEST, unavailable_reason, video_details
+from .http_client import connection_stats, get_session
+from .integrity import TRUNCATED, hash_file, is_intact, is_mp4, manifest_for, probe_mp4
+from .playlist_cache import listing_delta, listing_videos
+from .progress import DownloadProgress, ProgressTracker
+from .quota import QuotaExceeded, QuotaTracker
+from .retry import RetryPolicy
+from .storage import break_link, commit_file, ensure_free_space, preallocate
+
+YOUTUBE_API_SERVICE_NAME = 'youtube'
+YOUTUBE_API_VERSION = 'v3'
+
+# cobalt instances and the options sent with every request (the GUI fills these from its settings).
+# With several instances (see cobalt/docker-compose.yml) requests are balanced and fail over between them
+COBALT_ENDPOINTS = ['http://localhost:9000/']
+COBALT_OPTIONS = {
+    'videoQuality': "1080",
+    'youtubeVideoCodec': "h264",
+    'audioFormat': "best",
+    'filenameStyle': "pretty"
+}
+
+# Concurrency settings
+MAX_CONCURRENT_DOWNLOADS = 4  # Number of videos downloaded at the same time (1 = one after the other)
+MAX_CONNECTIONS_PER_HOST = 4  # Cap on simultaneous transfers from one host, so cobalt on :9000 isn't overwhelmed
+MAX_RESOLVES_PER_HOST = 2  # Separate cap on the cobalt API requests, so the transfers never starve them
+TUNNEL_PREFETCH = 2  # Number of tunnels resolved ahead of the downloads
+TUNNEL_EXPIRY_MARGIN = 15  # Seconds of validity a queued tunnel needs left, otherwise it is resolved again
+
+# Total download speed shared by every download, in bytes per second (None = unlimited)
+MAX_BANDWIDTH = None
+MAX_BANDWIDTH_PER_DOWNLOAD = None  # Cap for each single download, in bytes per second (None = no cap)
+
+# Playlist listing - True syncs through the ETag cache in PLAYLIST_CACHE_DIR (cheap reruns),
+# False always fetches every page. Either way each page is passed on as soon as it is checked,
+# so the first download starts right away
+USE_PLAYLIST_CACHE = True
+# Look the listed videos up with videos.list (1 quota unit per 50) to add their duration, upload
+# date and size estimate, and to leave out private, deleted and live ones before cobalt sees them
+ENRICH_VIDEOS = True
+
+# Unfinished downloads are written to '<filename>.part' and resumed from there
+PART_SUFFIX = ".part"
+WRITE_BUFFER_SIZE = 256 * 1024  # Bytes read from the connection and written to disk at a time
+
+# Segmented downloads - large files are fetched over several connections, one byte range each
+SEGMENT_COUNT = 4  # Connections per file (1 = always a single stream)
+SEGMENT_MIN_SIZE = 50 * 1024 * 1024  # Files smaller than this (50 MB) stay single-stream
+SEGMENT_MAX_RETRIES = 3  # Attempts per byte range before the whole download is retried
+SEGMENT_SUFFIX = ".segments.part"  # Preallocated file the segments are written into
+SEGMENT_STATE_SUFFIX = ".segments.json"  # Byte ranges already in the .segments.part file, for resuming it
+
+# Check the MP4 box structure of finished downloads before accepting them (reads box headers only)
+PROBE_CONTAINER = True
+
+# Post-processing run on every finished download (a postprocess.PostProcessor); None keeps files as downloaded
+post_processor = None
+# Store of downloaded videos shared by every output folder (a content_store.ContentStore); None = off
+content_store = None
+# Append-only JSON-lines log of every video's events, across runs (an events.EventLog); None = off
+event_log = None
+
+_host_semaphores = {}
+_host_semaphores_lock = threading.Lock()
+bandwidth_limiter = TokenBucket(MAX_BANDWIDTH)  # Shared by every download
+progress_tracker = ProgressTracker()  # Samples the download counters and draws the progress line
+retry_policy = RetryPolicy()  # Backoff, circuit breakers and the retry budget shared by the batch
+api_quota = QuotaTracker()  # YouTube Data API units spent by this run (set .limit to cap them)
+cobalt_pool = CobaltPool(COBALT_ENDPOINTS)  # Use cobalt_pool.set_endpoints() to change the instances
+
+# Counters kept elsewhere, read when the metrics are rendered
+metrics.registry.add_collector("retry_events_total", "Retry policy decisions", "counter", "event",
+                               lambda: retry_policy.snapshot())
+metrics.registry.add_collector("http_requests_total", "HTTP requests, by whether they opened a connection",
+                               "counter", "connection",
+                               lambda: {'new': connection_stats()['new_connections'],
+                                        'reused': connection_stats()['reused_connections']})
+metrics.registry.add_collector("youtube_api_units_total", "YouTube Data API quota units spent, by method",
+                               "counter", "method", lambda: api_quota.snapshot())
+metrics.registry.add_collector("cobalt_outstanding_requests", "Requests in flight per cobalt instance",
+                               "gauge", "instance",
+                               lambda: {url: node['outstanding'] for url, node in cobalt_pool.snapshot().items()})
+metrics.registry.add_collector("cobalt_instance_available", "Whether a cobalt instance is in rotation (1) or not (0)",
+                               "gauge", "instance",
+                               lambda: {url: int(node['healthy'] and not node['ejected'])
+                                        for url, node in cobalt_pool.snapshot().items()})
+
+
+class DownloadCancelled(Exception):
+    """Raised inside a download when its cancel event is set."""
+
+
+# 7. Helper to stop a download as soon as it is cancelled
+def check_cancelled(cancel_event):
+    """
+    Args:
+        cancel_event (threading.Event): The event that cancels the download, or None.
+
+    Raises:
+        DownloadCancelled: If the event is set.
+    """
+    if cancel_event is not None and cancel_event.is_set():
+        raise DownloadCancelled("Download cancelled")
+
+# 7b. Helper to write an event to the event log, when there is one
+def log_event(event, **fields):
+    if event_log is not None:
+        event_log.emit(event, **fields)
+
+# 7c. Helper to tie the events the current thread writes to a playlist entry
+def video_events(video):
+    if event_log is None or not isinstance(video, dict):
+        return nullcontext()
+    return event_log.video(video.get('id') or get_video_id_from_url(video.get('url')))
+
+# 6. Helpers to cap the number of simultaneous requests made to the same host
+def host_semaphore(url, resolve=False):
+    """The semaphore capping transfers (or, with `resolve`, cobalt API requests) to the host of `url`."""
+    key = (urlparse(url).netloc, resolve)
+    with _host_semaphores_lock:
+        semaphore = _host_semaphores.get(key)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(MAX_RESOLVES_PER_HOST if resolve else MAX_CONNECTIONS_PER_HOST)
+            _host_semaphores[key] = semaphore
+    return semaphore
+
+@contextmanager
+def host_slot(url, resolve=False):
+    """
+    Context manager that holds one of the MAX_CONNECTIONS_PER_HOST slots for the host of `url`
+    (one of the MAX_RESOLVES_PER_HOST slots with `resolve`). Blocks until a slot is free, so
+    concurrent workers never open more connections to a single host (e.g. the local cobalt
+    instance) than the configured cap. Resolves and transfers are counted apart, so a host
+    busy serving tunnels still answers the next video's API request.
+    Args:
+        url (str): Any URL on the host a request is about to be made to.
+        resolve (bool): The request is a cobalt API call rather than a transfer.
+    """
+    with host_semaphore(url, resolve):
+        yield
+
+@contextmanager
+def host_slots(url, wanted):
+    """
+    Like host_slot, but takes up to `wanted` transfer slots: waits for the first one and
+    then takes only those free right away, so a segmented download splits into as many
+    connections as the cap leaves room for instead of queueing segments behind it.
+    Yields:
+        int: The number of slots held (at least 1).
+    """
+    semaphore = host_semaphore(url)
+    semaphore.acquire()
+    held = 1
+    try:
+        while held < wanted and semaphore.acquire(blocking=False):
+            held += 1
+        yield held
+    finally:
+        for _ in range(held):
+            semaphore.release()
+
+
+# 5b. Function to parse the Content-Range header of a partial (206/416) response
+def parse_content_range(content_range):
+    """
+    Parses a Content-Range header such as 'bytes 1000-1999/5000' or 'bytes */5000'.
+    Args:
+        content_range (str): The header value (may be None).
+
+    Returns:
+        tuple: (start, total) where either can be None when the header doesn't state it.
+    """
+    match = re.match(r'bytes\s+(?:(\d+)-\d+|\*)/(\d+|\*)', content_range or '')
+    if not match:
+        return None, None
+    start = int(match.group(1)) if match.group(1) is not None else None
+    total = int(match.group(2)) if match.group(2) != '*' else None
+    return start, total
+
+# 5c. Function to check whether a tunnel is worth downloading in segments
+def probe_segmented_size(tunnel_url):
+    """
+    Asks for the first byte of the tunnel to learn whether the server honours Range
+    requests and how big the file is.
+    Args:
+        tunnel_url (str): The URL of the tunnel.
+
+    Returns:
+        int: The file size if it should be downloaded in segments, otherwise None
+             (ranges unsupported, size unknown, or smaller than SEGMENT_MIN_SIZE).
+    """
+    if SEGMENT_COUNT <= 1:
+        return None
+    with host_slot(tunnel_url):
+        response = get_session().get(tunnel_url, headers={'Range': 'bytes=0-0'}, stream=True)
+        if response.status_code != 206:
+            response.close()  # Don't pull the whole file just to throw it away
+            return None
+        response.content  # Read the single byte so the connection goes back to the pool
+    _, total = parse_content_range(response.headers.get("content-range"))
+    if not total or total < SEGMENT_MIN_SIZE:
+        return None
+    return total
+
+def write_at(fd, data, offset):
+    """Writes all of `data` at `offset` of the open file descriptor `fd`."""
+    view = memoryview(data)
+    while view:
+        if hasattr(os, 'pwrite'):
+            written = os.pwrite(fd, view, offset)
+        else:  # Windows has no pwrite, but each segment has its own descriptor so seeking is safe
+            os.lseek(fd, offset, os.SEEK_SET)
+            written = os.write(fd, view)
+        view = view[written:]
+        offset += written
+
+# 5f. Helpers to keep track of the byte ranges an interrupted segmented download already has
+def read_segment_state(filename, total):
+    """
+    Returns:
+        list: The (start, end) byte ranges (inclusive, sorted) an earlier segmented download
+              of `filename` left in its .segments.part file, or [] if there is nothing usable.
+    """
+    try:
+        with open(filename + SEGMENT_STATE_SUFFIX, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state['total'] == total and os.path.getsize(filename + SEGMENT_SUFFIX) == total:
+            return merge_ranges((int(start), int(end)) for start, end in state['done'])
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return []
+
+def write_segment_state(filename, total, done):
+    """Records the byte ranges on disk, after flushing them so the record never runs ahead of the data."""
+    with open(filename + SEGMENT_SUFFIX, "rb+") as f:
+        os.fsync(f.fileno())
+    path = filename + SEGMENT_STATE_SUFFIX
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({'total': total, 'done': done}, f)
+    os.replace(path + ".tmp", path)
+
+def discard_segments(filename):
+    """Removes what an interrupted segmented download of `filename` left behind."""
+    for path in (filename + SEGMENT_SUFFIX, filename + SEGMENT_STATE_SUFFIX):
+        if os.path.exists(path):
+            os.remove(path)
+
+def merge_ranges(ranges):
+    """Sorts inclusive (start, end) byte ranges and joins the ones that overlap or touch."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def missing_ranges(total, pieces, done=()):
+    """
+    Splits a file of `total` bytes into `pieces` ranges and returns the parts of them not
+    covered by `done` (merged ranges, see merge_ranges), as inclusive (start, end) tuples.
+    """
+    size = -(-total // pieces)  # Ceiling division so the ranges cover every byte
+    missing = []
+    for start in range(0, total, size):
+        end = min(start + size, total) - 1
+        for done_start, done_end in done:
+            if done_end < start or done_start > end:
+                continue
+            if done_start > start:
+                missing.append((start, done_start - 1))
+            start = done_end + 1
+            if start > end:
+                break
+        if start <= end:
+            missing.append((start, end))
+    return missing
+
+# 5d. Function to download a file over several connections at once
+def download_segmented(tunnel_url, filename, total, progress=None, throttle=None, cancel_event=None):
+    """
+    Splits the file into up to SEGMENT_COUNT byte ranges - as many as there are free
+    connection slots for the host - and fetches them concurrently into a preallocated
+    file, each segment holding its slot and writing at its own offset. Once every byte is in
+    place the file is moved to '<filename>.part' for the usual verification and rename.
+    When it stops short, the ranges that did arrive are recorded in '<filename>.segments.json'
+    and the next attempt (or the next run) only asks for the rest.
+    Args:
+        tunnel_url (str): The URL of the tunnel.
+        filename (str): The name the video will be saved under.
+        total (int): The size of the file, as reported by probe_segmented_size.
+        progress (DownloadProgress): Counters the segments add their bytes to.
+        throttle (DownloadThrottle): Bandwidth limit shared by all the segments.
+        cancel_event (threading.Event): Stops every segment when set.
+
+    Returns:
+        str: SHA-256 of the file. Segments arrive out of order, so unlike the single
+             stream this takes a read pass over the assembled file.
+
+    Raises:
+        ValueError: If a segment keeps failing or the assembled file has the wrong size.
+        DownloadCancelled: If `cancel_event` is set.
+    """
+    mb = 1024 * 1024
+    throttle = throttle or DownloadThrottle(bandwidth_limiter, MAX_BANDWIDTH_PER_DOWNLOAD)
+    segment_file = filename + SEGMENT_SUFFIX
+    done = read_segment_state(filename, total)
+    if not done:
+        discard_segments(filename)  # Whatever is left over doesn't match this file
+    already = sum(end + 1 - start for start, end in done)
+    progress = progress or DownloadProgress(os.path.basename(filename))
+    progress.set_total(total, already)
+    with host_slots(tunnel_url, SEGMENT_COUNT) as slots:
+        ranges = missing_ranges(total, slots, done)
+        if done:
+            print(f"Total size: {total // mb} MB - resuming the last {(total - already) // mb} MB "
+                  f"in {len(ranges)} segments")
+        else:
+            print(f"Total size: {total // mb} MB - downloading in {len(ranges)} segments")
+            ensure_free_space(segment_file, total)
+            with open(segment_file, "wb") as f:
+                preallocate(f.fileno(), 0, total)  # Full size up front so every segment can write straight to its offset
+        reached = {start: start for start, _ in ranges}  # Segment start -> first byte not yet written
+
+        def fetch_segment(start, end):
+            position = start
+            attempt = 1
+            fd = os.open(segment_file, os.O_WRONLY | getattr(os, 'O_BINARY', 0))
+            try:
+                while position <= end:
+                    if not retry_policy.wait_for_host(tunnel_url, attempt, cancel_event):
+                        check_cancelled(cancel_event)
+                    try:
+                        requested = monotonic()
+                        response = get_session().get(tunnel_url, headers={'Range': f'bytes={position}-{end}'}, stream=True)
+                        metrics.first_byte_seconds.observe(monotonic() - requested)
+                        response.raise_for_status()
+                        range_start, _ = parse_content_range(response.headers.get("content-range"))
+                        if response.status_code != 206 or range_start != position:
+                            response.close()
+                            raise ValueError("Server stopped honouring byte ranges")
+                        for chunk in response.iter_content(chunk_size=WRITE_BUFFER_SIZE):
+                            if not chunk:
+                                continue
+                            check_cancelled(cancel_event)
+                            chunk = chunk[:end + 1 - position]  # Never write into the next segment
+                            throttle.consume(len(chunk))
+                            write_at(fd, chunk, position)
+                            position += len(chunk)
+                            reached[start] = position
+                            progress.add(len(chunk))
+                            if position > end:
+                                break
+                        response.close()
+                        if position <= end:
+                            raise ValueError(f"Segment {start}-{end} ended early at byte {position}")
+                        retry_policy.record_success(tunnel_url)
+                    except DownloadCancelled:
+                        raise
+                    except Exception as e:
+                        delay = retry_policy.next_delay(tunnel_url, e, attempt, SEGMENT_MAX_RETRIES)
+                        if delay is None:
+                            raise
+                        attempt += 1
+                        # Wait before resuming the segment where it stopped
+                        if cancel_event is not None:
+                            cancel_event.wait(delay)
+                        else:
+                            sleep(delay)
+            finally:
+                os.close(fd)
+
+        try:
+            with ThreadPoolExecutor(max_workers=max(min(len(ranges), slots), 1)) as executor:
+                futures = [executor.submit(fetch_segment, start, end) for start, end in ranges]
+                wait(futures)
+                for future in futures:
+                    future.result()  # Re-raise the first segment failure, if any
+        except Exception:
+            # Keep every byte that arrived for the next attempt
+            arrived = [(start, reached[start] - 1) for start, _ in ranges if reached[start] > start]
+            try:
+                write_segment_state(filename, total, merge_ranges(done + arrived))
+            except OSError:
+                discard_segments(filename)
+            raise
+
+    # Check the assembled file before handing it over
+    file_size = os.path.getsize(segment_file)
+    if progress.downloaded != total or file_size != total:
+        discard_segments(filename)
+        raise ValueError(f"Assembled file has {progress.downloaded} of {total} bytes")
+    checksum = hash_file(segment_file).hexdigest()
+    os.replace(segment_file, filename + PART_SUFFIX)
+    discard_segments(filename)
+    return checksum
+
+# 5e. Function to stream the tunnel into the .part file over a single connection
+def download_single_stream(tunnel_url, part_file, resume_from=0, progress=None, throttle=None, cancel_event=None):
+    """
+    Streams the tunnel into `part_file`, appending to it when the server honours a
+    Range request for the `resume_from` bytes already on disk.
+    Args:
+        tunnel_url (str): The URL of the tunnel.
+        part_file (str): The partial file to write to.
+        resume_from (int): Size of the existing partial file (0 for a fresh download).
+        progress (DownloadProgress): Counters the loop adds its bytes to.
+        throttle (DownloadThrottle): Bandwidth limit for this download.
+        cancel_event (threading.Event): Stops the download (keeping the .part file) when set.
+
+    Returns:
+        str: SHA-256 of the whole .part file, computed as the bytes are written.
+
+    Raises:
+        ValueError: If fewer bytes arrived than the Content-Length announced.
+    """
+    mb = 1024 * 1024  # 1 MB in bytes
+    throttle = throttle or DownloadThrottle(bandwidth_limiter, MAX_BANDWIDTH_PER_DOWNLOAD)
+    progress = progress or DownloadProgress(os.path.basename(part_file))
+    headers = {'Range': f'bytes={resume_from}-'} if resume_from else {}
+    with host_slot(tunnel_url):
+        requested = monotonic()
+        response = get_session().get(tunnel_url, headers=headers, stream=True)
+        metrics.first_byte_seconds.observe(monotonic() - requested)
+
+        if resume_from and response.status_code == 416:
+            # Nothing left to fetch past our offset - either the .part file is already
+            # complete or it is longer than the file on the server
+            _, server_total = parse_content_range(response.headers.get("content-range"))
+            response.close()
+            if server_total != resume_from:
+                os.remove(part_file)
+                raise ValueError("Partial file doesn't match the server copy, discarded it")
+            print(f"Partial file {part_file} is already complete")
+            return hash_file(part_file).hexdigest()
+        else:
+            response.raise_for_status()  # Will throw HTTPError for bad status
+
+            length = int(response.headers.get("content-length", 0))
+            range_start, _ = parse_content_range(response.headers.get("content-range"))
+            if resume_from and response.status_code == 206 and range_start == resume_from:
+                print(f"↪️ Resuming from {resume_from // mb} MB")
+                mode = "ab"
+                digest = hash_file(part_file)  # Carry on from the bytes already on disk
+            else:
+                if resume_from:
+                    print("⚠️ Server doesn't support resuming, restarting download from the beginning.")
+                resume_from = 0
+                mode = "wb"
+                digest = hashlib.sha256()
+
+            total = resume_from + length if length else None
+            if total is None:
+                print("⚠️ No Content-Length - the size can't be checked, reading until the server ends the stream.")
+            else:
+                print(f"Total size: {total // mb} MB")
+            progress.set_total(total, resume_from)
+            if length:
+                ensure_free_space(part_file, length)
+
+            # Hot loop - drawing the progress is left to the reporter thread; the checksum is
+            # computed here so finished files never need a second read
+            received = 0
+            with open(part_file, mode) as f:
+                if length:
+                    # Reserve the rest of the file without growing it - the .part size must keep
+                    # saying how much arrived, for resuming
+                    preallocate(f.fileno(), resume_from, length, keep_size=True)
+                for chunk in response.iter_content(chunk_size=WRITE_BUFFER_SIZE):
+                    if chunk:
+                        check_cancelled(cancel_event)
+                        throttle.consume(len(chunk))
+                        f.write(chunk)
+                        digest.update(chunk)
+                        received += len(chunk)
+                        progress.add(len(chunk))
+
+            # Content-Length counts encoded bytes, so only compare it for identity transfers
+            if length and received != length and response.headers.get("content-encoding", "identity") == "identity":
+                raise ValueError(f"Transfer ended after {received} of {length} bytes")
+    return digest.hexdigest()
+
+# 5. Function to process the tunnel download (modified with error handling and retries)
+@metrics.instrument(metrics.download_seconds, metrics.downloads, metrics.downloads_active, (DownloadCancelled,))
+def process_tunnel_download(tunnel_url, filename, cancel_event=None, refresh=None):
+    """
+    Processes the tunnel download with retries and file verification: the byte count must
+    match Content-Length when there is one, MP4 files must have a complete box structure
+    (PROBE_CONTAINER), and the size and SHA-256 of the result go into the directory's manifest.
+    Failures are retried as retry_policy decides: network errors and 5xx with backoff,
+    rate limits after their Retry-After delay, other 4xx and a full disk not at all.
+    Data is written to '<filename>.part' and only renamed to `filename` once complete.
+    A leftover .part file (from a failed attempt or an earlier run of the script) is
+    resumed with a Range request; if the server ignores the range the download starts over.
+    Fresh downloads of large files are split across several connections (see download_segmented),
+    and resumed the same way.
+    Args:
+        tunnel_url (str): The URL of the tunnel to download the video.
+        filename (str): The name of the file to save the downloaded video.
+        cancel_event (threading.Event): Optional event that aborts the download right away,
+                                        raising DownloadCancelled. The .part file is kept.
+        refresh (callable): Returns a new tunnel URL (or None); called before any attempt
+                            that would otherwise start on an expired tunnel, since backoff
+                            and Retry-After waits can outlast a tunnel's short life.
+    """
+    attempt = 1
+    download_success = False
+    part_file = filename + PART_SUFFIX
+    throttle = DownloadThrottle(bandwidth_limiter, MAX_BANDWIDTH_PER_DOWNLOAD)
+    progress = progress_tracker.start(os.path.basename(filename))
+
+    def finish(success):
+        progress_tracker.finish(progress, success=success)
+        metrics.bytes_written.inc(progress.written)
+
+    while not download_success:
+        try:
+            if not retry_policy.wait_for_host(tunnel_url, attempt, cancel_event):
+                check_cancelled(cancel_event)
+            if refresh is not None and tunnel_is_stale(tunnel_url):
+                tunnel_url = refresh()
+                if not tunnel_url:
+                    raise ValueError("the tunnel expired and could not be resolved again")
+            print(f"📥 Attempt {attempt}/{retry_policy.max_attempts}: Downloading {filename}")
+            resume_from = os.path.getsize(part_file) if os.path.exists(part_file) else 0
+            start_time = time()
+
+            segmented_size = probe_segmented_size(tunnel_url) if not resume_from else None
+
+            if segmented_size:
+                checksum = download_segmented(tunnel_url, filename, segmented_size, progress, throttle, cancel_event)
+            else:
+                discard_segments(filename)  # An earlier segmented attempt can't be carried on as a single stream
+                checksum = download_single_stream(tunnel_url, part_file, resume_from, progress, throttle, cancel_event)
+
+            # Verify download integrity after completion
+            file_size = os.path.getsize(part_file)
+            if file_size == 0:
+                os.remove(part_file)  # Clean up empty file
+                raise ValueError("Downloaded file is 0 bytes - possibly incomplete")
+            if PROBE_CONTAINER and is_mp4(filename):
+                valid, reason = probe_mp4(part_file)
+                if not valid:
+                    if not reason.startswith(TRUNCATED):
+                        os.remove(part_file)  # Not a cut-off video (e.g. an error page) - resuming can't fix it
+                    raise ValueError(f"Downloaded file is not a valid MP4 ({reason})")
+
+            commit_file(part_file, filename)  # Flushed, then renamed - the real name only ever holds a whole file
+            manifest_for(filename).record(filename, file_size, checksum)
+            download_success = True
+            retry_policy.record_success(tunnel_url)
+            elapsed = time() - start_time
+            if elapsed > 0:
+                metrics.throughput.observe((progress.downloaded - progress.baseline) / elapsed)
+            print(f"\n✅ Download verified! Saved as '{filename}' ({file_size//1024} KB)")
+            print(f"⏱️ Time taken: {int(time() - start_time)} seconds")
+
+        except DownloadCancelled:
+            print(f"\n⏹️ Download of {filename} cancelled")
+            finish(False)
+            raise
+        except Exception as e:
+            # The .part file is kept so the next attempt (or the next run) can resume it
+            delay = retry_policy.next_delay(tunnel_url, e, attempt)
+            log_event('retry', file=filename, attempt=attempt, error=str(e),
+                      delay=None if delay is None else round(delay, 3), gave_up=delay is None)
+            if delay is None:
+                print(f"\n❌ FATAL: Download failed after {attempt} attempts. Last error: {str(e)}")
+                finish(False)
+                return False
+
+            print(f"\n⚠️ Download failed: {str(e)} - Retrying in {delay:.1f}s...")
+            attempt += 1
+            if cancel_event is not None:
+                cancel_event.wait(delay)  # Wait before retrying, unless cancelled meanwhile
+            else:
+                sleep(delay)  # Wait before retrying
+
+    finish(download_success)
+    return download_success
+
+# 4b. Function to ask cobalt for the tunnel url of a video
+@metrics.instrument(metrics.resolve_seconds)
+def resolve_tunnel(title, url):
+    """
+    Sends the video URL to cobalt and returns the tunnel it hands back, without downloading anything.
+    A redirect (the file's own URL) is used like a tunnel; a picker or local-processing answer
+    means the video can't be downloaded as one file and is reported as a failed resolve.
+    Args:
+        title (str): The title of the video.
+        url (str): The URL of the video.
+
+    Returns:
+        dict: {'tunnel_url': str, 'filename': str} on success, or None if cobalt
+              did not return a usable tunnel.
+    """
+    headers = {
+        'Accept': 'application/json',
+        'Content-Type': 'application/json'
+    }
+    payload = {'url': url, **COBALT_OPTIONS}
+
+    def post(endpoint):
+        with host_slot(endpoint, resolve=True):
+            response = get_session().post(endpoint, headers=headers, json=payload)
+        if response.status_code == 429 or response.status_code >= 500:
+            response.raise_for_status()  # Busy or broken - fail over to another instance or back off
+
+        # Handle response  - It should return a JSON with status and URL for the tunnel
+        try:
+            data = response.json()
+        except ValueError:
+            raise CobaltError(f"cobalt returned HTTP {response.status_code} without JSON")
+        if data.get("status") == "error":
+            code = (data.get("error") or {}).get("code", "")
+            raise CobaltError(f"cobalt error {code or 'without a code'}",
+                              node_fault=not code.startswith(VIDEO_ERROR_PREFIX),
+                              rate_limited=code in RATE_LIMIT_ERRORS)
+        if response.status_code != 200:
+            raise CobaltError(f"cobalt returned HTTP {response.status_code}")
+        if data.get("status") not in FILE_STATUSES:
+            # Not the instance's fault - failing over or ejecting it would not help
+            raise CobaltError(f"Unexpected status: {data.get('status')}", node_fault=False)
+        if not data.get("url"):
+            raise CobaltError(f"{data['status'].capitalize()} status received, but no URL provided.")
+        return data
+
+    try:
+        data = cobalt_pool.call(post, retry_policy)
+    except CobaltError as e:
+        print(f"Cobalt could not resolve {url}: {e}")
+        return None
+    print("Yt Tunnel Successfully Obtained:", data)
+    tunnel_url = data["url"]
+
+    return {
+        'tunnel_url': tunnel_url,
+        'filename': data.get("filename", f"{title}.mp4")  # Default to title if no filename provided
+    }
+
+# 4c. Function to read the expiry time cobalt embeds in a tunnel url
+def get_tunnel_expiry(tunnel_url):
+    """
+    Returns the expiry of a tunnel URL, taken from its `exp` query parameter.
+    Args:
+        tunnel_url (str): The tunnel URL returned by cobalt.
+
+    Returns:
+        float: Expiry as a unix timestamp in seconds, or None if the URL carries no expiry.
+    """
+    exp = parse_qs(urlparse(tunnel_url).query).get('exp')
+    if not exp:
+        return None
+    try:
+        return int(exp[0]) / 1000  # cobalt stores it in milliseconds
+    except ValueError:
+        return None
+
+def tunnel_is_stale(tunnel_url, margin=TUNNEL_EXPIRY_MARGIN):
+    """
+    Checks whether a tunnel URL has expired, or will within `margin` seconds.
+    Args:
+        tunnel_url (str): The tunnel URL returned by cobalt.
+        margin (float): Seconds of validity the tunnel must have left to be used.
+    """
+    expiry = get_tunnel_expiry(tunnel_url)
+    return expiry is not None and expiry - time() < margin
+
+# 4. Function to process the tunnel download url for the video
+def fn_getVid(title, url):
+    """
+    Processes the video download by sending a request to the tunnel URL.(cobalt)
+    and calling the download function using the url returned.
+    This function assumes that the tunnel URL is a valid endpoint that can handle
+    Args:
+        title (str): The title of the video.
+        url (str): The URL of the video.
+    """
+    print(f"Processing video: {title} ({url})")
+    tunnel = resolve_tunnel(title, url)
+    if not tunnel:
+        return False
+    return process_tunnel_download(tunnel['tunnel_url'], tunnel['filename'])
+
+# 3b. Function for stage one of the pipeline - validates a playlist entry and resolves its tunnel
+def resolve_video_entry(video, position, total, state=None, completed=None):
+    """
+    Validates one entry of the playlist data and asks cobalt for its tunnel.
+    Args:
+        video (dict): Entry with 'title' and 'url' keys.
+        position (int): 1-based position of the entry in the playlist (for display).
+        total (int): Number of entries in the playlist (for display).
+        state (DownloadState): Optional state store that failures are recorded in.
+        completed (dict): {video_id: filename} of finished downloads, which are skipped
+                          as long as the file is still on disk at its recorded size.
+
+    Returns:
+        tuple: (tunnel, failure). `tunnel` is the resolve_tunnel result ready to be
+               downloaded, `failure` a failure record. Both are None for skipped entries.
+    """
+    print(f"\n{'='*40}")
+    print(f"Processing video {position} of {total}" if total else f"Processing video {position}")
+
+    if not isinstance(video, dict):
+        print("⚠️ Skipping malformed video entry")
+        return None, None  # skip malformed entries
+
+    title = video.get('title')
+    url = video.get('url')
+
+    # Basic checks to ensure valid data
+    if not title or not url:
+        print(f"⚠️ Skipping invalid entry: Title={title}, URL={url}")
+        return None, None
+
+    video_id = video.get('id') or get_video_id_from_url(url)
+    if completed and video_id in completed and is_intact(completed[video_id]):
+        print(f"⏭️ Already downloaded: {title} ({completed[video_id]})")
+        log_event('skip', reason="completed", file=completed[video_id])
+        return None, None
+
+    # In the store under the name cobalt would give it - no need to ask cobalt at all
+    stored = link_from_store(video_id)
+    if stored:
+        filename, checksum = stored
+        log_event('success', title=title, url=url, file=filename, bytes=os.path.getsize(filename), linked=True)
+        if state:
+            state.mark_completed(video_id, title, url, filename, checksum)
+        if post_processor is not None:
+            queue_post_processing(video, filename, state)
+        return None, None
+
+    print(f"Processing video: {title} ({url})")
+    log_event('start', title=title, url=url, position=position)
+    started = monotonic()
+    try:
+        tunnel = resolve_tunnel(title, url)
+    except Exception as e:
+        print(f"🔥 Unexpected error resolving {title}: {str(e)}")
+        failure = {"title": title, "url": url, "error": str(e)}
+    else:
+        if tunnel:
+            log_event('resolve', file=tunnel['filename'], seconds=round(monotonic() - started, 3))
+            return tunnel, None
+        print(f"❌ Download failed for: {title}")
+        failure = {"title": title, "url": url}
+
+    log_event('failure', title=title, url=url, stage="resolve",
+              error=failure.get('error') or (event_log and event_log.last_error()) or "no tunnel")
+    if state and video_id:
+        state.mark_failed(video_id, title, url, failure.get('error'))
+    return None, failure
+
+# 3d. Function for stage two of the pipeline - downloads a resolved entry
+@metrics.instrument(metrics.video_seconds, cancelled=(DownloadCancelled,), succeeded=lambda failure: failure is None)
+def download_resolved_entry(video, tunnel, state=None, cancel_event=None):
+    """
+    Downloads an entry resolved by resolve_video_entry, re-resolving the tunnel first
+    if it sat in the queue long enough to expire.
+    Args:
+        video (dict): The playlist entry.
+        tunnel (dict): Its resolve_tunnel result.
+        state (DownloadState): Optional state store the outcome is recorded in.
+        cancel_event (threading.Event): Passed through to process_tunnel_download.
+
+    Returns:
+        dict: A failure record if the download failed, or None if it succeeded.
+
+    Raises:
+        DownloadCancelled: If the download was cancelled (recorded as failed so it is redone).
+    """
+    title = video['title']
+    url = video['url']
+    video_id = video.get('id') or get_video_id_from_url(url)
+    track = state is not None and video_id is not None
+    failure = None
+    linked = False
+
+    started = monotonic()
+    try:
+        if track:
+            state.mark_downloading(video_id, title, url)
+        if tunnel_is_stale(tunnel['tunnel_url']):
+            print(f"⏳ Tunnel for {title} expired while queued, resolving it again...")
+            tunnel = resolve_tunnel(title, url)
+
+        def refresh_tunnel():
+            print(f"⏳ Tunnel for {title} expired between attempts, resolving it again...")
+            fresh = resolve_tunnel(title, url)
+            return fresh['tunnel_url'] if fresh else None
+
+        # Stored under another filenameStyle's name - the tunnel told us this style's name
+        linked = bool(tunnel and link_from_store(video_id, tunnel['filename']))
+        if not linked and (not tunnel or not process_tunnel_download(tunnel['tunnel_url'], tunnel['filename'],
+                                                                       cancel_event, refresh_tunnel)):
+            print(f"❌ Download failed for: {title}")
+            failure = {"title": title, "url": url}
+    except DownloadCancelled:
+        log_event('cancelled', file=tunnel['filename'] if tunnel else None)
+        if track:
+            state.mark_failed(video_id, title, url, "Cancelled")
+        raise
+    except Exception as e:
+        print(f"🔥 Unexpected error downloading {title}: {str(e)}")
+        failure = {"title": title, "url": url, "error": str(e)}
+
+    if failure:
+        log_event('failure', title=title, url=url, file=tunnel['filename'] if tunnel else None,
+                  stage="download" if tunnel else "resolve",
+                  error=failure.get('error') or (event_log and event_log.last_error()) or "download failed")
+    else:
+        log_event('success', title=title, url=url, file=tunnel['filename'],
+                  bytes=os.path.getsize(tunnel['filename']), seconds=round(monotonic() - started, 3),
+                  linked=linked or None)
+    if track:
+        if failure:
+            state.mark_failed(video_id, title, url, failure.get('error'))
+        else:
+            filename = tunnel['filename']
+            entry = manifest_for(filename).get(filename)  # Hashed while downloading
+            state.mark_completed(video_id, title, url, filename,
+                                 entry['sha256'] if entry else hash_file(filename).hexdigest())
+    if not failure and not linked and content_store is not None and video_id:
+        add_to_store(video_id, tunnel['filename'])
+    if not failure and post_processor is not None:
+        queue_post_processing(video, tunnel['filename'], state if track else None)
+    return failure
+
+# 3f. Function to put a video that is already in the content store in place of a download
+def link_from_store(video_id, filename=None):
+    """
+    Links a stored copy of the video (same ID and content options) to `filename` and records
+    it in the manifest like a finished download.
+    Args:
+        video_id (str): The video.
+        filename (str): Where it goes; by default the name it was stored under for the current
+                        filenameStyle (nothing is linked if it was never stored with that style).
+
+    Returns:
+        tuple: (filename, sha256) if the video was linked, otherwise None.
+    """
+    if content_store is None or not video_id:
+        return None
+    stored = content_store.find(video_id, COBALT_OPTIONS)
+    filename = filename or (stored and stored['filename'])
+    if not stored or not filename:
+        return None
+    try:
+        method = content_store.link(stored, filename, COBALT_OPTIONS)
+    except OSError as e:
+        print(f"⚠️ Could not link {filename} from the store ({e}) - downloading it instead")
+        return None
+    checksum = stored['sha256'] or hash_file(filename).hexdigest()
+    manifest_for(filename).record(filename, stored['size'], checksum)
+    metrics.store_links.labels(method).inc()
+    metrics.store_bytes_saved.inc(stored['size'])
+    print(f"🔗 Already in the store: '{filename}' ({method}, {stored['size'] // 1024} KB not downloaded)")
+    return filename, checksum
+
+# 3g. Function to take a finished download into the content store
+def add_to_store(video_id, filename):
+    entry = manifest_for(filename).get(filename)
+    try:
+        content_store.add(video_id, COBALT_OPTIONS, filename, entry['sha256'] if entry else None)
+    except OSError as e:
+        print(f"⚠️ Could not add {filename} to the store: {e}")
+
+# 3e. Function to hand a finished download to the post-processing stage
+def queue_post_processing(video, filename, state=None):
+    """
+    Queues a downloaded file for post_processor, blocking while its queue is full.
+    Once processed, the state records the file the steps ended with (e.g. the .mkv a remux
+    made), so the next run still recognises the video as done.
+    """
+    video_id = video.get('id') or get_video_id_from_url(video['url'])
+
+    def done(final_path, checksum):
+        if state is not None:
+            state.mark_completed(video_id, video['title'], video['url'], final_path, checksum)
+
+    try:
+        # Steps may change the file in place - not through a hard link into the content store
+        break_link(filename)
+        post_processor.submit(video, filename, done)
+    except Exception as e:  # E.g. a broken worker pool - the download itself is fine
+        print(f"🔥 Could not queue {filename} for post-processing: {str(e)}")
+
+# 3c. Function to write the failed downloads to the failure log
+def save_failed_downloads(failed_downloads, failed_log="failed_downloads.txt"):
+    """
+    Writes the failed downloads to a human-readable log so they can be retried later.
+    Args:
+        failed_downloads (list): Failure records as returned by download_video_entry.
+        failed_log (str): Path of the log file.
+    """
+    print(f"\n{'⚠️'*10} FAILURES DETECTED {'⚠️'*10}")
+    print(f"{len(failed_downloads)} videos failed to download. Saving to {failed_log}")
+
+    with open(failed_log, "w", encoding="utf-8") as f:
+        f.write("Failed Video Downloads:\n\n")
+        for item in failed_downloads:
+            f.write(f"Title: {item['title']}\n")
+            f.write(f"URL: {item['url']}\n")
+            if 'error' in item:
+                f.write(f"Error: {item['error']}\n")
+            f.write("-"*50 + "\n")
+
+    print("✅ Failure log saved. You can retry these later")
+
+# 3. Function to process the videos data - calls above function for each video from the playlist data list dictionary provided
+def process_videos(data, max_workers=1, prefetch=TUNNEL_PREFETCH, state=None, cancel_event=None, on_settled=None):
+    """
+    Downloads every video in the playlist data, optionally several at a time.
+    Tunnels are resolved by a separate stage running up to `prefetch` videos ahead
+    of the downloads. With a state store, videos it records as completed (and whose
+    file still exists) are skipped, and every outcome is recorded for the next run.
+
+    Args:
+        data (dict): Playlist data as returned by get_playlist_videos_info. 'videos' may
+                     also be a generator such as iter_playlist_videos.
+        max_workers (int): Number of videos downloaded concurrently. 1 keeps the
+                           original one-after-the-other behaviour.
+        prefetch (int): Maximum number of resolved tunnels waiting to be downloaded.
+        state (DownloadState): Optional persistent download state (see download_state.py).
+        cancel_event (threading.Event): Setting it stops resolving new videos and aborts the
+                                        running downloads. Cancelled videos are not reported
+                                        as failures; their .part files are kept for next time.
+        on_settled (callable): Called with (video, failure) as each entry is done with -
+                               `failure` is None for a download or a skip - from the resolver
+                               or a worker thread. Cancelled entries aren't reported.
+
+    Returns:
+        list: Failure records for the videos that could not be downloaded, in playlist order.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Input must be a dictionary")
+
+    videos = data.get('videos', [])
+    if isinstance(videos, (str, bytes, dict)) or not isinstance(videos, Iterable):
+        raise ValueError("'videos' key must contain a list or an iterable of videos")
+
+    # Generators (e.g. iter_playlist_videos) are consumed as they produce entries
+    total = len(videos) if isinstance(videos, Sized) else None
+    if total is None:
+        print("Processing videos as the playlist is fetched...")
+    else:
+        print(f"Processing {total} videos...")
+
+     # Track failed downloads - only failures are kept, keyed by position, so memory stays flat
+    failed_log = "failed_downloads.txt"
+    results = {}
+    results_lock = threading.Lock()
+    max_workers = max(max_workers, 1)
+
+    # Two stage pipeline: a resolver thread fills a bounded queue with tunnels ahead of time
+    # while the download workers drain it, so no download waits on a cobalt round-trip.
+    tunnel_queue = queue.Queue(maxsize=max(prefetch, 1))
+    completed = state.completed_videos() if state else None
+    workers_alive = [max_workers]
+
+    def put(item):
+        # Never blocks for good: with every worker gone nothing would ever take the item
+        while True:
+            try:
+                tunnel_queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                with results_lock:
+                    if not workers_alive[0]:
+                        return False
+                if item is not None and cancel_event is not None and cancel_event.is_set():
+                    return False
+
+    def settle(num, video, failure):
+        if failure:
+            with results_lock:
+                results[num] = failure
+        if on_settled is not None:
+            on_settled(video, failure)
+
+    def resolver():
+        try:
+            for num, video in enumerate(videos, 1):
+                if cancel_event is not None and cancel_event.is_set():
+                    print("⏹️ Download cancelled")
+                    break
+                with video_events(video):
+                    tunnel, failure = resolve_video_entry(video, num, total, state, completed)
+                if not tunnel:
+                    settle(num, video, failure)
+                elif not put((num, video, tunnel)):
+                    break
+        except Exception as e:
+            print(f"🔥 Stopped reading the playlist: {str(e)}")
+        finally:
+            for _ in range(max_workers):
+                if not put(None):  # One stop marker per download worker
+                    break
+
+    def downloader():
+        try:
+            while True:
+                item = tunnel_queue.get()
+                if item is None:
+                    break
+                num, video, tunnel = item
+                if cancel_event is not None and cancel_event.is_set():
+                    continue  # Drain the queue without starting anything new
+                try:
+                    with video_events(video):
+                        failure = download_resolved_entry(video, tunnel, state, cancel_event)
+                except DownloadCancelled:
+                    continue
+                except Exception as e:
+                    # A state, store or manifest error must not take the worker down with it
+                    print(f"🔥 Unexpected error downloading {video.get('title')}: {str(e)}")
+                    failure = {"title": video.get('title'), "url": video.get('url'), "error": str(e)}
+                settle(num, video, failure)
+        finally:
+            with results_lock:
+                workers_alive[0] -= 1
+
+    if max_workers > 1:
+        print(f"Downloading with {max_workers} concurrent workers "
+              f"(max {MAX_CONNECTIONS_PER_HOST} transfers and {MAX_RESOLVES_PER_HOST} resolves per host)")
+
+    resolver_thread = threading.Thread(target=resolver, daemon=True)
+    resolver_thread.start()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        workers = [executor.submit(downloader) for _ in range(max_workers)]
+    resolver_thread.join()
+    for worker in workers:
+        worker.result()  # Re-raises whatever a worker died of
+    if post_processor is not None:
+        post_processor.join(cancel_event)
+
+    failed_downloads = [results[num] for num in sorted(results)]
+
+    # Save failed downloads if any
+    if failed_downloads:
+        save_failed_downloads(failed_downloads, failed_log)
+    elif cancel_event and cancel_event.is_set():
+        print("\n⏹️ Downloads stopped before the playlist was finished")
+    else:
+        print("\n🎉 All videos downloaded successfully!")
+
+    return failed_downloads
+
+# 2d. Function to find the uploads playlist of a YouTube channel
+def get_channel_uploads_playlist_id(api_key, channel_url):
+    """
+    Finds the playlist holding every upload of a channel.
+    Handles URLs like:
+    https://www.youtube.com/channel/UCxxxxxxxxxxxxxxxxxxxxxx
+    https://www.youtube.com/@handle
+    https://www.youtube.com/user/username
+
+    Args:
+        api_key (str): Your YouTube Data API v3 key.
+        channel_url (str): The URL of the channel.
+
+    Returns:
+        str: The uploads playlist ID, or None if the channel could not be found.
+
+    Raises:
+        QuotaExceeded: If the lookup would take the run past its API quota limit.
+    """
+    from googleapiclient.errors import HttpError
+    match = re.search(r'youtube\.com\/channel\/(UC[a-zA-Z0-9_-]{22})', channel_url)
+    if match:
+        # A channel's uploads playlist is its ID with the UC prefix swapped for UU
+        return 'UU' + match.group(1)[2:]
+
+    handle = re.search(r'youtube\.com\/(@[a-zA-Z0-9_.-]+)', channel_url)
+    username = re.search(r'youtube\.com\/user\/([a-zA-Z0-9_-]+)', channel_url)
+    if not handle and not username:
+        return None
+
+    try:
+        youtube = youtube_client(api_key)
+        lookup = {'forHandle': handle.group(1)} if handle else {'forUsername': username.group(1)}
+        api_quota.spend('channels.list')
+        response = youtube.channels().list(part='contentDetails', **lookup).execute()
+    except HttpError as e:
+        report_api_error(e)
+        return None
+
+    items = response.get('items')
+    if not items:
+        print(f"Error: Channel not found: {channel_url}")
+        return None
+    return items[0]['contentDetails']['relatedPlaylists']['uploads']
+
+# 2c. Function to turn a playlist or channel URL into a playlist URL
+def resolve_playlist_url(api_key, url):
+    """
+    Args:
+        api_key (str): Your YouTube Data API v3 key.
+        url (str): A playlist URL, or a channel URL (for the channel's uploads).
+
+    Returns:
+        str: A playlist URL, or None if `url` is a channel that could not be found.
+    """
+    if re.search(r'youtube\.com\/(?:channel\/|user\/|@)', url):
+        uploads_id = get_channel_uploads_playlist_id(api_key, url)
+        if not uploads_id:
+            return None
+        return f'https://www.youtube.com/playlist?list={uploads_id}'
+    return url
+
+# 2b. Function to extract the video ID from a YouTube video URL
+def get_video_id_from_url(video_url):
+    """
+    Extracts the video ID from watch, youtu.be, shorts and embed URLs.
+
+    Args:
+        video_url (str): The URL of the YouTube video.
+
+    Returns:
+        str: The video ID, or None if not found.
+    """
+    match = re.search(r'(?:[?&]v=|youtu\.be\/|\/shorts\/|\/embed\/)([a-zA-Z0-9_-]{11})', video_url or '')
+    return match.group(1) if match else None
+
+# 2. Function to extract playlist ID from various YouTube playlist URL formats
+def get_playlist_id_from_url(playlist_url):
+    """
+    Extracts the playlist ID from various YouTube playlist URL formats.
+
+    Args:
+        playlist_url (str): The URL of the YouTube playlist.
+
+    Returns:
+        str: The playlist ID, or None if not found.
+    """
+    # Regex to find playlist ID in a URL
+    # Handles URLs like:
+    # https://www.youtube.com/playlist?list=PLxxxxxxxxxxxxxxxxx
+    # https://www.youtube.com/watch?v=VIDEO_ID&list=PLxxxxxxxxxxxxxxxxx
+    # https://music.youtube.com/playlist?list=PLxxxxxxxxxxxxxxxxx
+    patterns = [
+        r'(?:https?:\/\/)?(?:www\.)?(?:youtube\.com|music\.youtube\.com)\/(?:playlist|watch)\?(?:.*&)?list=([a-zA-Z0-9_-]+)',
+        r'(?:https?:\/\/)?(?:www\.)?(?:youtube\.com|music\.youtube\.com)\/embed\/videoseries\?list=([a-zA-Z0-9_-]+)'
+    ]
+    for pattern in patterns:
+        match = re.search(pattern, playlist_url)
+        if match:
+            return match.group(1)
+    print("Error: Could not extract playlist ID from the URL.")
+    return None
+
+# 1e. Function to create a YouTube Data API client
+def youtube_client(api_key):
+    """
+    googleapiclient takes a while to import, so it is only loaded once the API is needed -
+    importing the package, or running --help, stays quick.
+    """
+    from googleapiclient.discovery import build
+    return build(YOUTUBE_API_SERVICE_NAME, YOUTUBE_API_VERSION, developerKey=api_key)
+
+# 1c. Function to turn a playlistItems resource into a video entry
+def parse_playlist_item(item):
+    """
+    Args:
+        item (dict): One element of a playlistItems().list response's 'items'.
+
+    Returns:
+        dict: {'id', 'title', 'url'} entry as used by process_videos.
+    """
+    title = item['snippet']['title']
+    video_id = item['snippet']['resourceId']['videoId']
+    video_url = f'https://www.youtube.com/watch?v={video_id}' # Standard video URL
+    return {'id': video_id, 'title': title, 'url': video_url}
+
+# 1d. Function to print a readable explanation of a YouTube API error
+def report_api_error(e):
+    """
+    Args:
+        e (HttpError): The error raised by the API client.
+    """
+    print(f'An HTTP error {e.resp.status} occurred: {e.content.decode("utf-8") if e.content else "No content"}')
+    if e.resp.status == 403:
+        print("This might be due to an invalid API key, or API quota exceeded, or the API not being enabled.")
+    elif e.resp.status == 404:
+        print("Playlist not found. Please check the playlist URL or ID.")
+
+# 1a. Generator that yields the videos of a YouTube playlist page by page
+def iter_playlist_videos(api_key, playlist_url, strict=False):
+    """
+    Yields the videos of a YouTube playlist as each page of results arrives, so downloads
+    can start after the first page and memory stays flat however long the playlist is.
+    Errors are reported and end the iteration early.
+
+    Args:
+        api_key (str): Your YouTube Data API v3 key.
+        playlist_url (str): The URL of the YouTube playlist.
+        strict (bool): Re-raise errors after reporting them instead of just stopping.
+
+    Yields:
+        dict: {'id', 'title', 'url'} for each video, in playlist order.
+    """
+    from googleapiclient.errors import HttpError
+    if api_key == 'YOUR_API_KEY':
+        print("Error: Please replace 'YOUR_API_KEY' with your actual API key in the script.")
+        if strict:
+            raise ValueError("API key not configured")
+        return
+
+    playlist_id = get_playlist_id_from_url(playlist_url)
+    if not playlist_id:
+        if strict:
+            raise ValueError(f"Not a playlist URL: {playlist_url}")
+        return # Playlist ID could not be extracted
+
+    video_count = 0
+    next_page_token = None
+    fetching = 0.0  # Seconds spent on the API, not with the consumer between pages
+    result = 'error'
+
+    try:
+        youtube = youtube_client(api_key)
+        print(f"Fetching videos for playlist ID: {playlist_id}...") # Keep some feedback
+
+        while True:
+            # Request to get playlist items
+            playlist_items_request = youtube.playlistItems().list(
+                part='snippet,contentDetails',  # snippet contains title, resourceId (for videoId)
+                                              # contentDetails contains videoId directly as well
+                playlistId=playlist_id,
+                maxResults=50,  # API allows max 50 results per page
+                pageToken=next_page_token
+            )
+            api_quota.spend('playlistItems.list')
+            requested = monotonic()
+            playlist_items_response = playlist_items_request.execute()
+            fetching += monotonic() - requested
+            metrics.api_pages.labels('fetched').inc()
+
+            if not playlist_items_response.get('items'):
+                if video_count == 0: # Only print if no items were ever found
+                    print("No videos found in this playlist or the playlist is private/deleted.")
+                break # Exit loop if no items on this page (or playlist empty)
+
+            for item in playlist_items_response['items']:
+                video_count += 1
+                yield parse_playlist_item(item)
+
+            next_page_token = playlist_items_response.get('nextPageToken')
+            if not next_page_token:
+                break  # No more pages
+
+        if video_count > 0:
+            print(f"Finished fetching. Total videos found: {video_count}\n")
+        result = 'success' if video_count else 'failed'
+
+    except GeneratorExit:
+        result = 'cancelled'  # The consumer stopped before the last page
+        raise
+    except HttpError as e:
+        report_api_error(e)
+        if strict:
+            raise
+    except QuotaExceeded as e:
+        print(f"⚠️ {e} - the listing stops here")
+        if strict:
+            raise
+    except Exception as e:
+        print(f'An unexpected error occurred: {e}')
+        if strict:
+            raise
+    finally:
+        metrics.playlist_seconds.labels(result).observe(fetching)
+
+# 1f. Generator that adds videos.list details to playlist entries and drops unavailable ones
+def enrich_videos(api_key, videos, quality=None):
+    """
+    Looks the videos up VIDEOS_PER_REQUEST at a time with videos.list, adding 'duration',
+    'published_at', 'channel', 'definition' and 'estimated_size' to each entry, and leaves out
+    the ones cobalt can't download: private, deleted, still processing, live or upcoming.
+    If the lookup fails, or would go past the run's quota limit, entries pass through as they are.
+
+    Args:
+        api_key (str): Your YouTube Data API v3 key.
+        videos (iterable): {'id', 'title', 'url'} entries, e.g. from iter_batch_videos.
+        quality (str): cobalt videoQuality the size estimate is for (default: the one in COBALT_OPTIONS).
+
+    Yields:
+        dict: The downloadable entries, enriched, in their original order.
+    """
+    from googleapiclient.errors import HttpError
+    quality = quality or COBALT_OPTIONS.get('videoQuality', '1080')
+    youtube = None
+    skipped_lookups = 0
+
+    def lookup(batch):
+        nonlocal youtube, skipped_lookups
+        if not api_quota.can_spend('videos.list'):
+            skipped_lookups += 1
+            if skipped_lookups == 1:
+                print("⚠️ Quota limit reached - the remaining videos are downloaded without looking them up")
+            return batch
+        try:
+            youtube = youtube or youtube_client(api_key)
+            api_quota.spend('videos.list')
+            response = youtube.videos().list(
+                part='snippet,contentDetails,status',
+                id=','.join(video['id'] for video in batch),
+                maxResults=VIDEOS_PER_REQUEST
+            ).execute()
+        except HttpError as e:
+            report_api_error(e)
+            return batch
+        except Exception as e:
+            print(f'An unexpected error occurred while looking up videos: {e}')
+            return batch
+
+        # Videos that were deleted or made private are missing from the response altogether
+        items = {item['id']: item for item in response.get('items', [])}
+        enriched = []
+        for video in batch:
+            item = items.get(video['id'])
+            reason = unavailable_reason(item) if item else "deleted or private"
+            if reason:
+                print(f"⏭️ Skipping {video['title']}: {reason}")
+                metrics.videos_skipped.labels(reason).inc()
+                continue
+            enriched.append({**video, **video_details(item, quality)})
+        return enriched
+
+    batch = []
+    for video in videos:
+        if not video.get('id'):
+            yield video  # Nothing to look it up by
+            continue
+        batch.append(video)
+        if len(batch) == VIDEOS_PER_REQUEST:
+            yield from lookup(batch)
+            batch = []
+    if batch:
+        yield from lookup(batch)
+
+# 1. Function to fetch and return video titles and URLs from a YouTube playlist
+def get_playlist_videos_info(api_key, playlist_url):
+    """
+    Fetches the title and URL of each video in a YouTube playlist and returns them.
+    Collects everything from iter_playlist_videos; use that directly to start working
+    on the videos before the whole playlist has been fetched.
+
+    Args:
+        api_key (str): Your YouTube Data API v3 key.
+        playlist_url (str): The URL of the YouTube playlist.
+
+    Returns:
+        dict: A dictionary containing 'total_videos' (int) and 'videos' (list of dicts),
+              where each inner dict has 'id', 'title' and 'url'.
+              Returns None if an error occurs (e.g., invalid API key, playlist not found).
+    """
+    try:
+        videos_data = list(iter_playlist_videos(api_key, playlist_url, strict=True))
+    except Exception:
+        return None # Already reported by the generator
+
+    return {
+        'total_videos': len(videos_data),
+        'videos': videos_data
+    }
+
+# 1g. Generator that syncs a playlist against its cached listing, page by page
+def iter_synced_pages(api_key, playlist_id, cache, cached=None, full_check=False, strict=False):
+    """
+    Yields the pages of a playlist as each one is validated against its cached copy:
+    every page is requested with the ETag of the cached one (If-None-Match), and a page
+    YouTube answers with 304 Not Modified is taken from the cache. Adding or removing a
+    video changes the playlist's totalResults, which is part of every page, so a 304 on
+    the first page means nothing changed and the rest comes straight from the cache unless
+    `full_check` is set (use it to also pick up reordering further down the playlist).
+    The listing is saved to the cache once the last page is through; errors are reported
+    and end the iteration early, leaving the cached copy as it was.
+
+    Args:
+        api_key (str): Your YouTube Data API v3 key.
+        playlist_id (str): The ID of the YouTube playlist.
+        cache (PlaylistCache): Where the listings and their ETags are kept.
+        cached (dict): The playlist's cached listing, as cache.load returned it.
+        full_check (bool): Walk every page even if the first one is unchanged.
+        strict (bool): Re-raise errors after reporting them instead of just stopping.
+
+    Yields:
+        dict: The pages, with 'page_token', 'etag', 'next_page_token' and 'items'.
+    """
+    from googleapiclient.errors import HttpError
+    cached_pages = cached['pages'] if cached else []
+    pages = []
+    next_page_token = None
+    fetching = 0.0  # Seconds spent on the API, not with the consumer between pages
+    result = 'error'
+
+    try:
+        youtube = youtube_client(api_key)
+        print(f"Syncing videos for playlist ID: {playlist_id}...")
+
+        while True:
+            index = len(pages)
+            cached_page = cached_pages[index] if index < len(cached_pages) else None
+            if cached_page and cached_page['page_token'] != next_page_token:
+                cached_page = None  # Pages shifted, the cached copy is for a different token
+
+            playlist_items_request = youtube.playlistItems().list(
+                part='snippet,contentDetails',
+                playlistId=playlist_id,
+                maxResults=50,  # API allows max 50 results per page
+                pageToken=next_page_token
+            )
+            if cached_page:
+                playlist_items_request.headers['If-None-Match'] = cached_page['etag']
+
+            api_quota.spend('playlistItems.list')
+            requested = monotonic()
+            try:
+                response = playlist_items_request.execute()
+                metrics.api_pages.labels('fetched').inc()
+                page = {
+                    'page_token': next_page_token,
+                    'etag': response.get('etag'),
+                    'next_page_token': response.get('nextPageToken'),
+                    'items': [parse_playlist_item(item) for item in response.get('items', [])]
+                }
+            except HttpError as e:
+                if e.resp.status != 304 or not cached_page:
+                    raise
+                metrics.api_pages.labels('not_modified').inc()
+                page = cached_page  # Not modified - reuse the cached copy
+            fetching += monotonic() - requested
+
+            pages.append(page)
+            yield page
+            if page is cached_page and index == 0 and not full_check:
+                print("Playlist unchanged since the last sync.")
+                yield from cached_pages[1:]
+                pages = cached_pages
+                break
+
+            next_page_token = page['next_page_token']
+            if not next_page_token or not page['items']:
+                break  # No more pages
+
+        added, removed = listing_delta(listing_videos(cached_pages), listing_videos(pages))
+        cache.save(playlist_id, pages)
+        print(f"Finished syncing. Total videos: {len(listing_videos(pages))} "
+              f"({len(added)} new, {len(removed)} removed)\n")
+        result = 'success'
+
+    except GeneratorExit:
+        result = 'cancelled'  # The consumer stopped before the last page
+        raise
+    except HttpError as e:
+        report_api_error(e)
+        if strict:
+            raise
+    except QuotaExceeded as e:
+        print(f"⚠️ {e} - the listing stops here")
+        if strict:
+            raise
+    except Exception as e:
+        print(f'An unexpected error occurred: {e}')
+        if strict:
+            raise
+    finally:
+        metrics.playlist_seconds.labels(result).observe(fetching)
+
+# 1b. Function to sync a playlist against its cached listing using ETags
+def sync_playlist_videos(api_key, playlist_url, cache, full_check=False):
+    """
+    Fetches a playlist like get_playlist_videos_info, but through a PlaylistCache, so only
+    the pages that changed since the last sync are fetched again (see iter_synced_pages,
+    which yields the pages as they arrive instead of collecting them).
+
+    Args:
+        api_key (str): Your YouTube Data API v3 key.
+        playlist_url (str): The URL of the YouTube playlist.
+        cache (PlaylistCache): Where the listings and their ETags are kept.
+        full_check (bool): Walk every page even if the first one is unchanged.
+
+    Returns:
+        dict: 'total_videos' and 'videos' like get_playlist_videos_info, plus 'added' and
+              'removed' (entries that changed since the last sync) and 'unchanged' (bool).
+              Returns None if an error occurs.
+    """
+    playlist_id = get_playlist_id_from_url(playlist_url)
+    if not playlist_id:
+        return None # Playlist ID could not be extracted
+
+    cached = cache.load(playlist_id)
+    try:
+        pages = list(iter_synced_pages(api_key, playlist_id, cache, cached, full_check, strict=True))
+    except Exception:
+        return None # Already reported by the generator
+
+    videos = listing_videos(pages)
+    added, removed = listing_delta(listing_videos(cached['pages']) if cached else [], videos)
+    return {
+        'total_videos': len(videos),
+        'videos': videos,
+        'added': added,
+        'removed': removed,
+        'unchanged': not added and not removed
+    }
+# 0c. Function to read playlist URLs for batch mode
+def read_playlist_urls(path):
+    """
+    Reads one playlist (or channel) URL per line, ignoring blank lines and '#' comments.
+
+    Args:
+        path (str): The batch file.
+
+    Returns:
+        list: The URLs, in file order.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
+
+# 0b. Generator that lists the videos of one playlist that still need downloading
+def pending_playlist_videos(api_key, playlist_url, cache, completed):
+    """
+    Syncs a playlist through the cache and yields, page by page as the sync checks them,
+    the new videos plus any from earlier syncs that never finished, or whose file has
+    since gone missing or been damaged.
+
+    Args:
+        api_key (str): Your YouTube Data API v3 key.
+        playlist_url (str): The URL of the YouTube playlist.
+        cache (PlaylistCache): The playlist listing cache.
+        completed (dict): {video_id: filename} of finished downloads.
+
+    Yields:
+        dict: The entries to download; the iteration ends early if the sync fails.
+    """
+    playlist_id = get_playlist_id_from_url(playlist_url)
+    if not playlist_id:
+        return # Playlist ID could not be extracted
+
+    cached = cache.load(playlist_id)
+    known_ids = {video['id'] for video in listing_videos(cached['pages'])} if cached else set()
+    for page in iter_synced_pages(api_key, playlist_id, cache, cached):
+        for video in page['items']:
+            if video['id'] not in known_ids or video['id'] not in completed or not is_intact(completed[video['id']]):
+                yield video
+
+# 0a. Generator that merges the videos of several playlists into one deduplicated stream
+def iter_batch_videos(api_key, playlist_urls, state=None, cache=None):
+    """
+    Yields the videos of every playlist (or channel uploads playlist) in turn, skipping
+    videos already yielded for an earlier playlist so each one is downloaded once.
+    Once the run's API quota limit is reached no further playlist is listed; the videos
+    yielded so far are still downloaded.
+
+    Args:
+        api_key (str): Your YouTube Data API v3 key.
+        playlist_urls (list): Playlist and/or channel URLs.
+        state (DownloadState): Used with `cache` to leave out finished videos.
+        cache (PlaylistCache): Sync the playlists through the listing cache, which leaves
+                               out finished videos and refetches only changed pages.
+
+    Yields:
+        dict: {'id', 'title', 'url'} for each distinct video.
+    """
+    seen = set()
+    completed = state.completed_videos() if state and cache else {}
+
+    for num, url in enumerate(playlist_urls, 1):
+        left = len(playlist_urls) - num + 1
+        if not api_quota.can_spend('playlistItems.list'):
+            print(f"⚠️ YouTube API quota limit reached - not listing the last {left} playlists")
+            break
+        print(f"\n📃 Playlist {num} of {len(playlist_urls)}: {url}")
+        try:
+            playlist_url = resolve_playlist_url(api_key, url)
+        except QuotaExceeded as e:
+            print(f"⚠️ {e} - not listing the last {left} playlists")
+            break
+        if not playlist_url:
+            continue
+
+        if cache:
+            videos = pending_playlist_videos(api_key, playlist_url, cache, completed)
+        else:
+            videos = iter_playlist_videos(api_key, playlist_url)
+
+        duplicates = 0
+        for video in videos:
+            if video['id'] in seen:
+                duplicates += 1
+                continue
+            seen.add(video['id'])
+            yield video
+        if duplicates:
+            print(f"Skipped {duplicates} videos already queued from an earlier playlist")
@@ -0,0 +1,466 @@
+"""
+Daemon mode - one long-running downloader that takes playlists from a job queue on disk and
+is controlled over a local HTTP/JSON API, so the CLI, the GUI and cron jobs all share one
+download pool instead of starting processes that compete for the bandwidth and cobalt.
+
+    python -m playlist_downloader --daemon -o ~/Videos
+    python -m playlist_downloader --submit --priority 5 https://www.youtube.com/playlist?list=...
+
+    GET    /status                 the daemon, the job it is running with its progress, and the
+                                   downloads in flight
+    GET    /jobs[?status=queued]   every job, next to run first
+    POST   /jobs                   {"url": "...", "priority": 0} -> the new job (201)
+    GET    /jobs/<id>
+    PATCH  /jobs/<id>              {"priority": 10}
+    POST   /jobs/<id>/pause        stops a running job after its current downloads (.part files kept)
+    POST   /jobs/<id>/resume
+    POST   /jobs/<id>/cancel
+
+Every request must carry the daemon's token (written to daemon.token in the output
+directory when it starts) as 'Authorization: Bearer <token>', name a local Host, and send
+its body - {} when there is nothing to say - as application/json. A web page the user
+happens to open can do none of that, so it can't queue downloads behind their back.
+
+Jobs run one at a time, highest priority first, each through process_videos with the
+daemon's workers. A job still running when the daemon stops is queued again and picks up
+where it was on the next start - finished videos are in the download state.
+"""
+import hmac
+import json
+import os
+import secrets
+import sqlite3
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import time
+from urllib.parse import parse_qs, urlsplit
+from . import metrics
+
+DAEMON_HOST = "127.0.0.1"  # Nothing but this machine can control the daemon
+DAEMON_PORT = 8765
+JOBS_DB = "jobs.db"  # Next to the download state, in the output directory
+DAEMON_TOKEN_FILE = "daemon.token"  # Likewise; readable by the user only, new on every start
+LOCAL_HOSTS = ('127.0.0.1', 'localhost', '::1')  # Host headers accepted - anything else is DNS rebinding
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_PAUSED = "paused"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+JOB_STATUSES = (JOB_QUEUED, JOB_RUNNING, JOB_PAUSED, JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+FINISHED_STATUSES = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+
+
+class JobError(Exception):
+    pass
+
+
+class JobQueue:
+    """
+    Persistent queue of playlist jobs, backed by SQLite like the download state. Every status
+    change is a single conditional UPDATE, so the API threads and the runner can't undo each
+    other's changes (a job paused while it finishes stays paused).
+    """
+    def __init__(self, path=JOBS_DB):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock, self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    url TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL,
+                    videos INTEGER NOT NULL DEFAULT 0,
+                    failed INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+            """)
+
+    def _update(self, job_id, allowed, **fields):
+        """Sets `fields` on the job if its status is one of `allowed`; returns whether it did."""
+        fields['updated_at'] = time()
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        placeholders = ", ".join("?" for _ in allowed)
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ? AND status IN ({placeholders})",
+                (*fields.values(), job_id, *allowed)
+            )
+        return cursor.rowcount == 1
+
+    def _change(self, job_id, allowed, action, **fields):
+        if not self._update(job_id, allowed, **fields):
+            job = self.get(job_id)
+            if job is None:
+                raise KeyError(job_id)
+            raise JobError(f"job {job_id} is {job['status']} and can't be {action}")
+        return self.get(job_id)
+
+    def submit(self, url, priority=0):
+        now = time()
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO jobs (url, priority, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (url, priority, JOB_QUEUED, now, now)
+            )
+        return self.get(cursor.lastrowid)
+
+    def get(self, job_id):
+        """Returns the job as a dict, or None if there is no such job."""
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def list(self, status=None):
+        """Returns the jobs (with `status` only, if given) in the order they run."""
+        query = "SELECT * FROM jobs" + (" WHERE status = ?" if status else "") + " ORDER BY priority DESC, id"
+        with self.lock:
+            rows = self.conn.execute(query, (status,) if status else ()).fetchall()
+        return [dict(row) for row in rows]
+
+    def counts(self):
+        """Returns {status: number of jobs} for every status."""
+        with self.lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) AS jobs FROM jobs GROUP BY status").fetchall()
+        return {**dict.fromkeys(JOB_STATUSES, 0), **{row['status']: row['jobs'] for row in rows}}
+
+    def claim(self):
+        """Marks the next queued job running and returns it, or None if nothing is queued."""
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY priority DESC, id LIMIT 1", (JOB_QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            now = time()
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ?, updated_at = ?, error = NULL WHERE id = ?",
+                (JOB_RUNNING, now, now, row['id'])
+            )
+        return self.get(row['id'])
+
+    def progress(self, job_id, videos, failed=None):
+        fields = {'videos': videos} if failed is None else {'videos': videos, 'failed': failed}
+        self._update(job_id, (JOB_RUNNING, JOB_PAUSED, JOB_CANCELLED), **fields)
+
+    def finish(self, job_id, status, error=None):
+        """Ends a running job; a job paused or cancelled meanwhile keeps that status."""
+        finished_at = time() if status in FINISHED_STATUSES else None
+        return self._update(job_id, (JOB_RUNNING,), status=status, error=error, finished_at=finished_at)
+
+    def requeue_running(self):
+        """Queues the jobs a stopped daemon left running again; returns how many there were."""
+        with self.lock, self.conn:
+            cursor = self.conn.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE status = ?",
+                                       (JOB_QUEUED, time(), JOB_RUNNING))
+        return cursor.rowcount
+
+    def pause(self, job_id):
+        return self._change(job_id, (JOB_QUEUED, JOB_RUNNING), "paused", status=JOB_PAUSED)
+
+    def resume(self, job_id):
+        return self._change(job_id, (JOB_PAUSED,), "resumed", status=JOB_QUEUED)
+
+    def cancel(self, job_id):
+        return self._change(job_id, (JOB_QUEUED, JOB_RUNNING, JOB_PAUSED), "cancelled",
+                            status=JOB_CANCELLED, finished_at=time())
+
+    def set_priority(self, job_id, priority):
+        return self._change(job_id, (JOB_QUEUED, JOB_RUNNING, JOB_PAUSED), "reprioritized", priority=priority)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class Daemon:
+    """
+    Runs the queued jobs one after the other in a background thread. Each job lists its
+    playlist, downloads it through process_videos with the shared `max_workers` (and the
+    core's bandwidth, cobalt and post-processing settings); its failures are left to the
+    core's retry policy, so a job whose videos fail ends up failed.
+    """
+    def __init__(self, api_key, jobs, state, max_workers, cache=None, enrich=True, order=None):
+        self.api_key = api_key
+        self.jobs = jobs
+        self.state = state
+        self.max_workers = max_workers
+        self.cache = cache
+        self.enrich = enrich
+        self.order = order
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopping = threading.Event()
+        self.current = None  # (job id, cancel event) of the running job
+        self.progress = None  # Videos listed, settled and failed so far in the running job
+        self.downloads = []  # The running downloads, as the core's progress tracker last saw them
+        self.started_at = time()
+        self.thread = None
+
+    def start(self):
+        requeued = self.jobs.requeue_running()
+        if requeued:
+            print(f"🔁 {requeued} jobs were interrupted by the last shutdown - queued again")
+        metrics.registry.add_collector("daemon_jobs", "Jobs in the daemon's queue, by status", "gauge", "status",
+                                       self.jobs.counts)
+        from .core import progress_tracker
+        progress_tracker.add_listener(self.on_progress)
+        self.thread = threading.Thread(target=self.run, name="daemon-jobs", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stopping.is_set():
+            job = self.jobs.claim()
+            if job is None:
+                self.wake.wait(5)
+                self.wake.clear()
+                continue
+            cancel_event = threading.Event()
+            with self.lock:
+                self.current = (job['id'], cancel_event)
+            try:
+                self.run_job(job, cancel_event)
+            finally:
+                with self.lock:
+                    self.current = None
+                    self.progress = None
+
+    def on_progress(self, snapshot):
+        """ProgressTracker listener keeping the downloads still running for status()."""
+        self.downloads = [download for download in snapshot if not download['finished']]
+
+    def run_job(self, job, cancel_event):
+        from .core import enrich_videos, iter_batch_videos, process_videos
+        from .enrichment import order_videos
+
+        print(f"\n📥 Job {job['id']}: {job['url']} (priority {job['priority']})")
+        counted = [0]
+        progress = {'listed': 0, 'settled': 0, 'failed': 0}
+        with self.lock:
+            self.progress = progress
+
+        def counting(videos):
+            for video in videos:
+                counted[0] += 1
+                progress['listed'] = counted[0]
+                if counted[0] % 50 == 0:
+                    self.jobs.progress(job['id'], counted[0])
+                yield video
+
+        def settled(video, failure):
+            with self.lock:
+                progress['settled'] += 1
+                progress['failed'] += bool(failure)
+
+        try:
+            videos = iter_batch_videos(self.api_key, [job['url']], self.state, self.cache)
+            if self.enrich:
+                videos = enrich_videos(self.api_key, videos)
+                if self.order:
+                    videos = order_videos(videos, self.order)
+            failures = process_videos({'videos': counting(videos)}, self.max_workers, state=self.state,
+                                      cancel_event=cancel_event, on_settled=settled)
+        except Exception as e:
+            print(f"🔥 Job {job['id']} failed: {e}")
+            self.jobs.finish(job['id'], JOB_QUEUED if self.stopping.is_set() else JOB_FAILED, str(e))
+            return
+        self.jobs.progress(job['id'], counted[0], len(failures))
+        if self.stopping.is_set():
+            self.jobs.finish(job['id'], JOB_QUEUED)  # Carries on after the restart
+        elif failures:
+            self.jobs.finish(job['id'], JOB_FAILED, f"{len(failures)} videos could not be downloaded")
+        else:
+            self.jobs.finish(job['id'], JOB_COMPLETED)
+
+    def interrupt(self, job_id=None):
+        """Stops the running job (only if it is `job_id`, when given); its downloads are aborted."""
+        with self.lock:
+            if self.current and job_id in (None, self.current[0]):
+                self.current[1].set()
+
+    def submit(self, url, priority=0):
+        job = self.jobs.submit(url, priority)
+        self.wake.set()
+        return job
+
+    def pause(self, job_id):
+        job = self.jobs.pause(job_id)
+        self.interrupt(job_id)
+        return job
+
+    def resume(self, job_id):
+        job = self.jobs.resume(job_id)
+        self.wake.set()
+        return job
+
+    def cancel(self, job_id):
+        job = self.jobs.cancel(job_id)
+        self.interrupt(job_id)
+        return job
+
+    def status(self):
+        with self.lock:
+            running = self.current[0] if self.current else None
+            progress = dict(self.progress) if self.progress else None
+        return {'running_job': self.jobs.get(running) if running else None, 'progress': progress,
+                'downloads': self.downloads if running else [], 'jobs': self.jobs.counts(),
+                'workers': self.max_workers, 'uptime': round(time() - self.started_at, 1)}
+
+    def stop(self, timeout=None):
+        """Stops after aborting the running job, which is queued again for the next start."""
+        self.stopping.set()
+        self.wake.set()
+        self.interrupt()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+
+def write_token(path=DAEMON_TOKEN_FILE):
+    """Writes a new random API token to `path` (mode 0600) and returns it."""
+    token = secrets.token_urlsafe(32)
+    temp = path + ".tmp"
+    fd = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(token)
+    os.replace(temp, path)
+    return token
+
+
+def read_token(path=DAEMON_TOKEN_FILE):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError as e:
+        raise JobError(f"Could not read the daemon token ({e}) - is a daemon running for this output directory?")
+
+
+def start_api(daemon, port=DAEMON_PORT, host=DAEMON_HOST, token=None):
+    """
+    Serves the job API (see the module docstring) from a daemon thread. Requests must name a
+    local Host and send JSON bodies; with a `token`, they must also carry it.
+
+    Returns:
+        ThreadingHTTPServer: The running server (call shutdown() to stop it).
+    """
+    class JobsHandler(BaseHTTPRequestHandler):
+        def send_json(self, status, body):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def read_json(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length) or b'{}') if length else {}
+            if not isinstance(body, dict):
+                raise ValueError("the request body must be a JSON object")
+            return body
+
+        def refusal(self, method):
+            """Returns (status, error) when the request must be turned away, else None."""
+            if urlsplit("//" + (self.headers.get('Host') or '')).hostname not in LOCAL_HOSTS:
+                return 403, "the job API only answers to local host names"
+            if token and not hmac.compare_digest(self.headers.get('Authorization') or '', f"Bearer {token}"):
+                return 401, "missing or wrong daemon token"
+            content_type = (self.headers.get('Content-Type') or '').split(';', 1)[0].strip().lower()
+            if method in ('POST', 'PATCH') and content_type != 'application/json':
+                return 415, "the request body must be application/json"
+            return None
+
+        def handle_request(self, method):
+            url = urlsplit(self.path)
+            parts = [part for part in url.path.split('/') if part]
+            refused = self.refusal(method)
+            if refused:
+                return self.send_json(refused[0], {'error': refused[1]})
+            try:
+                if parts == ['status'] and method == 'GET':
+                    return self.send_json(200, daemon.status())
+                if parts == ['jobs'] and method == 'GET':
+                    status = parse_qs(url.query).get('status', [None])[0]
+                    return self.send_json(200, daemon.jobs.list(status))
+                if parts == ['jobs'] and method == 'POST':
+                    body = self.read_json()
+                    if not isinstance(body.get('url'), str) or not body['url'].strip():
+                        raise ValueError("'url' must be a playlist or channel URL")
+                    return self.send_json(201, daemon.submit(body['url'].strip(), int(body.get('priority', 0))))
+                if len(parts) >= 2 and parts[0] == 'jobs' and parts[1].isdigit():
+                    job_id = int(parts[1])
+                    if len(parts) == 2 and method == 'GET':
+                        job = daemon.jobs.get(job_id)
+                        return self.send_json(200, job) if job else self.send_json(404, {'error': "no such job"})
+                    if len(parts) == 2 and method == 'PATCH':
+                        body = self.read_json()
+                        if 'priority' not in body:
+                            raise ValueError("only 'priority' can be changed")
+                        return self.send_json(200, daemon.jobs.set_priority(job_id, int(body['priority'])))
+                    actions = {'pause': daemon.pause, 'resume': daemon.resume, 'cancel': daemon.cancel}
+                    if len(parts) == 3 and method == 'POST' and parts[2] in actions:
+                        return self.send_json(200, actions[parts[2]](job_id))
+                self.send_json(404, {'error': f"no {method} {url.path}"})
+            except KeyError:
+                self.send_json(404, {'error': "no such job"})
+            except JobError as e:
+                self.send_json(409, {'error': str(e)})
+            except (TypeError, ValueError) as e:
+                self.send_json(400, {'error': str(e)})
+
+        def do_GET(self):
+            self.handle_request('GET')
+
+        def do_POST(self):
+            self.handle_request('POST')
+
+        def do_PATCH(self):
+            self.handle_request('PATCH')
+
+        def log_message(self, format, *args):
+            pass  # The job output is what matters in the daemon's log
+
+    server = ThreadingHTTPServer((host, port), JobsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def api_request(method, path, port=DAEMON_PORT, host=DAEMON_HOST, body=None, token=None):
+    """
+    Calls a running daemon's API, for clients.
+
+    Returns:
+        The decoded JSON response.
+
+    Raises:
+        JobError: If the daemon refused the request or could not be reached.
+    """
+    import requests
+    from .http_client import create_session
+
+    try:
+        headers = {'Authorization': f"Bearer {token}"} if token else {}
+        if body is None and method in ('POST', 'PATCH'):
+            body = {}  # The API only takes JSON bodies
+        # A session of its own without connect retries - a daemon that isn't running is reported at once
+        with create_session(read_timeout=10, max_retries=0) as session:
+            response = session.request(method, f"http://{host}:{port}{path}", json=body, headers=headers)
+    except requests.ConnectionError:
+        raise JobError(f"no daemon answering on {host}:{port}")
+    except requests.RequestException as e:
+        raise JobError(f"{method} {path}: {e}")
+    if response.status_code >= 400:
+        try:
+            error = response.json().get('error')
+        except ValueError:
+            error = response.text
+        raise JobError(f"{method} {path}: {error or response.status_code}")
+    return response.json()
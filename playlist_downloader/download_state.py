@@ -0,0 +1,94 @@
+import os
+import sqlite3
+import threading
+from time import time
+
+# Default location of the download state database (next to where the script is run)
+STATE_DB = "download_state.db"
+
+STATUS_PENDING = "pending"
+STATUS_DOWNLOADING = "downloading"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+
+
+class DownloadState:
+    """
+    Persistent record of every video the downloader has handled, keyed by YouTube video ID.
+    Backed by SQLite so reruns of a playlist only fetch new or previously failed videos.
+    Safe to share between the download worker threads.
+    """
+    def __init__(self, path=STATE_DB):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock, self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS videos (
+                    video_id TEXT PRIMARY KEY,
+                    title TEXT,
+                    url TEXT,
+                    status TEXT NOT NULL,
+                    filename TEXT,
+                    size INTEGER,
+                    checksum TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    completed_at REAL
+                )
+            """)
+
+    def _upsert(self, video_id, **fields):
+        now = time()
+        fields['updated_at'] = now
+        columns = ", ".join(fields)
+        placeholders = ", ".join("?" for _ in fields)
+        updates = ", ".join(f"{column} = excluded.{column}" for column in fields)
+        with self.lock, self.conn:
+            self.conn.execute(
+                f"INSERT INTO videos (video_id, created_at, {columns}) VALUES (?, ?, {placeholders}) "
+                f"ON CONFLICT(video_id) DO UPDATE SET {updates}",
+                (video_id, now, *fields.values())
+            )
+
+    def get(self, video_id):
+        """Returns the stored record for `video_id` as a dict, or None if it was never seen."""
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM videos WHERE video_id = ?", (video_id,)).fetchone()
+        return dict(row) if row else None
+
+    def completed_videos(self):
+        """
+        Returns:
+            dict: {video_id: filename} for every completed download, for O(1) skip checks.
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT video_id, filename FROM videos WHERE status = ?", (STATUS_COMPLETED,)
+            ).fetchall()
+        return {row['video_id']: row['filename'] for row in rows}
+
+    def mark_downloading(self, video_id, title, url):
+        """Records that a download of the video has started."""
+        self._upsert(video_id, title=title, url=url, status=STATUS_DOWNLOADING, error=None)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE videos SET attempts = attempts + 1 WHERE video_id = ?", (video_id,)
+            )
+
+    def mark_completed(self, video_id, title, url, filename, checksum=None):
+        """Records a finished download along with its file size and checksum."""
+        size = os.path.getsize(filename) if os.path.exists(filename) else None
+        self._upsert(video_id, title=title, url=url, status=STATUS_COMPLETED, filename=filename,
+                     size=size, checksum=checksum, error=None, completed_at=time())
+
+    def mark_failed(self, video_id, title, url, error=None):
+        """Records a failed download so the next run picks it up again."""
+        self._upsert(video_id, title=title, url=url, status=STATUS_FAILED, error=error)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,107 @@
+import re
+
+VIDEOS_PER_REQUEST = 50  # Most IDs videos.list takes in one call
+
+# Rough average bitrates (bits per second, video and audio) of cobalt's H.264 downloads, by
+# videoQuality - good enough to order the work and check the disk, not to promise a size
+QUALITY_BITRATES = {
+    '144': 150_000,
+    '240': 300_000,
+    '360': 650_000,
+    '480': 1_200_000,
+    '720': 2_600_000,
+    '1080': 4_600_000,
+    '1440': 9_500_000,
+    '2160': 19_000_000
+}
+SD_QUALITY = '480'  # Highest quality of a video YouTube marks as definition 'sd'
+
+# --order values -> (entry key, largest first); entries without the key keep playlist order at the end
+ORDERS = {
+    'playlist': None,
+    'shortest': ('duration', False),
+    'longest': ('duration', True),
+    'smallest': ('estimated_size', False),
+    'largest': ('estimated_size', True),
+    'oldest': ('published_at', False),
+    'newest': ('published_at', True)
+}
+
+_DURATION = re.compile(r'P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$')
+
+
+def parse_duration(value):
+    """Turns an ISO 8601 duration as the API gives it ('PT1H2M3S', 'P1DT2S') into seconds, or None."""
+    match = _DURATION.match(value or '')
+    if not match or not any(match.groups()):
+        return None
+    days, hours, minutes, seconds = (int(group or 0) for group in match.groups())
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
+def unavailable_reason(item):
+    """
+    Args:
+        item (dict): A videos.list resource with the snippet and status parts.
+
+    Returns:
+        str: Why cobalt can't download the video, or None if it can.
+    """
+    status = item.get('status', {})
+    if status.get('privacyStatus') == 'private':
+        return "private"
+    upload_status = status.get('uploadStatus')
+    if upload_status and upload_status != 'processed':
+        return f"upload {upload_status}"  # deleted, failed, rejected, or still processing
+    broadcast = item.get('snippet', {}).get('liveBroadcastContent')
+    if broadcast == 'live':
+        return "live stream in progress"
+    if broadcast == 'upcoming':
+        return "upcoming premiere or stream"
+    return None
+
+
+def estimate_size(duration, quality, definition=None):
+    """Expected download size in bytes of `duration` seconds at a cobalt videoQuality, or None."""
+    if duration is None:
+        return None
+    quality = str(quality)
+    if quality not in QUALITY_BITRATES:
+        quality = '2160' if quality == 'max' else '1080'
+    if definition == 'sd' and int(quality) > int(SD_QUALITY):
+        quality = SD_QUALITY
+    return duration * QUALITY_BITRATES[quality] // 8
+
+
+def video_details(item, quality):
+    """
+    Picks what the downloader uses out of a videos.list resource.
+    Returns:
+        dict: 'duration' (seconds), 'published_at' (ISO 8601), 'channel', 'definition'
+              and 'estimated_size' (bytes).
+    """
+    snippet = item.get('snippet', {})
+    content = item.get('contentDetails', {})
+    duration = parse_duration(content.get('duration'))
+    return {
+        'duration': duration,
+        'published_at': snippet.get('publishedAt'),
+        'channel': snippet.get('channelTitle'),
+        'definition': content.get('definition'),
+        'estimated_size': estimate_size(duration, quality, content.get('definition'))
+    }
+
+
+def order_videos(videos, order):
+    """
+    Sorts enriched entries for download. Largest-first keeps the parallel workers busy to the
+    end (no big file starting last on its own); shortest-first finishes the most videos soonest.
+    Needs the whole list, so the downloads only start once every playlist has been listed.
+    """
+    if not ORDERS.get(order):
+        return videos
+    key, descending = ORDERS[order]
+    videos = list(videos)
+    known = [video for video in videos if video.get(key) is not None]
+    unknown = [video for video in videos if video.get(key) is None]
+    return sorted(known, key=lambda video: video[key], reverse=descending) + unknown
@@ -0,0 +1,207 @@
+"""
+Append-only JSON-lines log of what happened to every video, across runs: one object per
+line with the time, the run it belongs to and the event, e.g.
+
+    {"time": 1760781234.5, "run": "3f2a9c1b7d04", "event": "success", "video_id": "dQw4w9WgXcQ",
+     "file": "Rick Astley - Never Gonna Give You Up.mp4", "bytes": 18305312, "seconds": 4.2}
+
+Events: run_start, start, skip, resolve, first_byte, progress, retry, success, failure,
+cancelled and run_end. The log rotates at EVENT_LOG_MAX_BYTES into events.jsonl.1,
+.2, ... and read_events() reads the rotated files too, oldest first.
+"""
+import glob
+import json
+import os
+import re
+import threading
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from time import time
+
+EVENT_LOG = "events.jsonl"  # In the output directory, next to the download state
+EVENT_LOG_MAX_BYTES = 10 * 1024 * 1024
+EVENT_LOG_BACKUPS = 5  # Rotated files kept besides the current one
+PROGRESS_EVENT_INTERVAL = 30  # Seconds between two progress checkpoints of one download
+OUTCOME_EVENTS = ('success', 'failure', 'skip')  # The events that settle a video for a run
+
+
+class EventLog:
+    """
+    Writes events from any thread. Inside `with log.video(video_id):` every event of the
+    thread carries the video's ID, and events about a file the video was resolved to
+    (progress checkpoints from the reporter thread) are tied back to it.
+    """
+    def __init__(self, path=EVENT_LOG, max_bytes=EVENT_LOG_MAX_BYTES, backups=EVENT_LOG_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.run_id = uuid.uuid4().hex[:12]
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.files = {}  # File name -> video ID, for the events that only know the file
+        self.checkpoints = {}  # File name -> time of its last progress event
+        self.stream = open(path, "a", encoding="utf-8")
+
+    @contextmanager
+    def video(self, video_id):
+        """Ties the events the current thread writes meanwhile to `video_id`."""
+        previous = getattr(self.local, 'video', None)
+        self.local.video = {'video_id': video_id, 'error': None}
+        try:
+            yield
+        finally:
+            self.local.video = previous
+
+    def last_error(self):
+        """The last error written for the current thread's video, or None."""
+        context = getattr(self.local, 'video', None)
+        return context['error'] if context else None
+
+    def emit(self, event, **fields):
+        context = getattr(self.local, 'video', None)
+        if context:
+            fields.setdefault('video_id', context['video_id'])
+            if fields.get('error'):
+                context['error'] = fields['error']
+        name = os.path.basename(fields['file']) if fields.get('file') else None
+        if name and fields.get('video_id'):
+            self.files[name] = fields['video_id']
+        elif name:
+            fields['video_id'] = self.files.get(name)
+        if event in OUTCOME_EVENTS and name:
+            self.files.pop(name, None)
+
+        record = {'time': round(time(), 3), 'run': self.run_id, 'event': event}
+        record.update((key, value) for key, value in fields.items() if value is not None)
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self.lock:
+            if self.stream.closed:
+                return
+            if self.max_bytes and self.stream.tell() + len(line) > self.max_bytes:
+                self.rotate()
+            self.stream.write(line)
+            self.stream.flush()
+
+    def rotate(self):
+        """events.jsonl -> events.jsonl.1 -> .2 ...; the oldest beyond `backups` is dropped."""
+        self.stream.close()
+        if self.backups:
+            for number in range(self.backups - 1, 0, -1):
+                if os.path.exists(f"{self.path}.{number}"):
+                    os.replace(f"{self.path}.{number}", f"{self.path}.{number + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.stream = open(self.path, "a", encoding="utf-8")
+
+    def on_progress(self, snapshot):
+        """ProgressTracker listener writing first_byte and periodic progress events."""
+        now = time()
+        for download in snapshot:
+            name = download['name']
+            if download['finished']:
+                self.checkpoints.pop(name, None)
+                continue
+            if name not in self.checkpoints:
+                if download.get('first_byte') is None:
+                    continue
+                self.emit('first_byte', file=name, seconds=round(download['first_byte'], 3),
+                          bytes=download['downloaded'], total=download['total'])
+                self.checkpoints[name] = now
+            elif now - self.checkpoints[name] >= PROGRESS_EVENT_INTERVAL:
+                self.emit('progress', file=name, bytes=download['downloaded'], total=download['total'],
+                          speed=round(download['speed']))
+                self.checkpoints[name] = now
+
+    def close(self):
+        with self.lock:
+            self.stream.close()
+
+
+def log_files(path=EVENT_LOG):
+    """The log and its rotated files, oldest first."""
+    rotated = [name for name in glob.glob(glob.escape(path) + ".*") if name.rsplit('.', 1)[1].isdigit()]
+    rotated.sort(key=lambda name: int(name.rsplit('.', 1)[1]), reverse=True)
+    return rotated + ([path] if os.path.exists(path) else [])
+
+
+def read_events(path=EVENT_LOG):
+    """Yields every event of the log and its rotated files, oldest first; broken lines are skipped."""
+    for name in log_files(path):
+        with open(name, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue  # A line cut off by a crash
+                if isinstance(event, dict) and 'event' in event:
+                    yield event
+
+
+def failed_videos(events):
+    """
+    Returns:
+        list: {'id', 'title', 'url'} of every video whose latest outcome was a failure, in the
+              order they last failed.
+    """
+    videos = {}
+    for event in events:
+        video_id = event.get('video_id')
+        if not video_id:
+            continue
+        if event['event'] in ('start', 'failure') and event.get('url'):
+            videos.setdefault(video_id, {})['entry'] = {'id': video_id, 'title': event.get('title') or video_id,
+                                                        'url': event['url']}
+        if event['event'] in OUTCOME_EVENTS:
+            videos.setdefault(video_id, {})['outcome'] = (event['event'], event['time'])
+    failed = [(video['outcome'][1], video['entry']) for video in videos.values()
+              if video.get('outcome', ('',))[0] == 'failure' and 'entry' in video]
+    return [entry for _, entry in sorted(failed, key=lambda item: item[0])]
+
+
+def analyze(events, top=10):
+    """
+    Sums the log up per run and across runs.
+    Returns:
+        dict: 'runs' - per run (oldest first) its start, successes, failures, skips, bytes and
+              download seconds; 'totals' - the same across runs; 'errors' - the most common
+              failure and retry errors with their counts; 'stages' - failures per stage;
+              'videos' - the videos that failed in the most runs, with the run count.
+    """
+    runs = {}
+    errors = Counter()
+    stages = Counter()
+    failed_runs = defaultdict(set)
+    titles = {}
+    for event in events:
+        run = runs.setdefault(event.get('run'), {'run': event.get('run'), 'started': event['time'],
+                                                 'success': 0, 'failure': 0, 'skip': 0, 'retry': 0,
+                                                 'bytes': 0, 'seconds': 0.0})
+        kind = event['event']
+        if kind in run:
+            run[kind] += 1
+        if kind == 'success' and not event.get('linked'):
+            run['bytes'] += event.get('bytes') or 0
+            run['seconds'] += event.get('seconds') or 0
+        if kind in ('failure', 'retry') and event.get('error'):
+            errors[re.sub(r'\d+', 'N', event['error'])[:200]] += 1  # Byte counts, ports... would split them up
+        if kind == 'failure':
+            stages[event.get('stage', 'unknown')] += 1
+            if event.get('video_id'):
+                failed_runs[event['video_id']].add(event.get('run'))
+                titles[event['video_id']] = event.get('title')
+
+    for run in runs.values():
+        run['throughput'] = run['bytes'] / run['seconds'] if run['seconds'] else None
+    totals = {key: sum(run[key] for run in runs.values())
+              for key in ('success', 'failure', 'skip', 'retry', 'bytes', 'seconds')}
+    totals['throughput'] = totals['bytes'] / totals['seconds'] if totals['seconds'] else None
+    repeat = sorted(failed_runs.items(), key=lambda item: len(item[1]), reverse=True)[:top]
+    return {
+        'runs': sorted(runs.values(), key=lambda run: run['started']),
+        'totals': totals,
+        'errors': errors.most_common(top),
+        'stages': dict(stages),
+        'videos': [{'id': video_id, 'title': titles[video_id], 'runs': len(run_ids)} for video_id, run_ids in repeat]
+    }
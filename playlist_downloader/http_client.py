@@ -0,0 +1,142 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+# Shared HTTP client settings - every request in the project goes through get_session()
+POOL_CONNECTIONS = 10  # Number of hosts that keep a pool of open connections
+POOL_MAXSIZE = 32  # Open connections kept alive per host (cover workers x segments)
+CONNECT_TIMEOUT = 10  # Seconds to wait for a connection
+READ_TIMEOUT = 60  # Seconds to wait for the next bytes of a response
+MAX_RETRIES = 3  # Retries for failed connects; HTTP errors are left to retry.RetryPolicy
+RETRY_BACKOFF = 0.5  # Seconds, doubled on every retry
+
+
+class ConnectionStats:
+    """Thread-safe counters of requests sent and connections opened by the shared session."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+
+    def count_request(self):
+        with self.lock:
+            self.requests += 1
+
+    def count_new_connection(self):
+        with self.lock:
+            self.new_connections += 1
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: 'requests', 'new_connections' and 'reused_connections' (requests served
+                  over a connection that was already open).
+        """
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'new_connections': self.new_connections,
+                'reused_connections': max(self.requests - self.new_connections, 0)
+            }
+
+
+stats = ConnectionStats()
+
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        stats.count_new_connection()
+        return super()._new_conn()
+
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        stats.count_new_connection()
+        return super()._new_conn()
+
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pools count how often they have to open a new connection."""
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': CountingHTTPConnectionPool,
+            'https': CountingHTTPSConnectionPool
+        }
+
+    def send(self, request, **kwargs):
+        stats.count_request()
+        return super().send(request, **kwargs)
+
+
+class PooledSession(requests.Session):
+    """requests.Session that applies the default timeout to every request."""
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def create_session(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE,
+                   connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                   max_retries=MAX_RETRIES, retry_backoff=RETRY_BACKOFF):
+    """
+    Builds a session with keep-alive connection pools, default timeouts and a retry adapter.
+    Args:
+        pool_connections (int): Number of hosts that keep a connection pool.
+        pool_maxsize (int): Connections kept alive per host.
+        connect_timeout (float): Seconds to wait for a connection.
+        read_timeout (float): Seconds to wait for the next bytes of a response.
+        max_retries (int): Retries for connections that could not be opened.
+        retry_backoff (float): Backoff factor between retries, in seconds.
+
+    Returns:
+        PooledSession: The new session.
+    """
+    retry = Retry(
+        total=max_retries,
+        connect=max_retries,
+        read=0,  # A half-read response is resumed by the downloader, not replayed here
+        status=0,  # Error statuses are classified by the retry policy, which honours Retry-After
+        backoff_factor=retry_backoff,
+        raise_on_status=False
+    )
+    adapter = PooledAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+    session = PooledSession((connect_timeout, read_timeout))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def configure(**settings):
+    """
+    Replaces the shared session with one built from `settings` (see create_session).
+    Connections held by the old session are closed once it is no longer in use.
+    """
+    global _session
+    with _session_lock:
+        _session = create_session(**settings)
+    return _session
+
+
+def get_session():
+    """Returns the shared session, creating it with the default settings on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = create_session()
+        return _session
+
+
+def connection_stats():
+    """Returns the connection counters of the shared session (see ConnectionStats.snapshot)."""
+    return stats.snapshot()
@@ -0,0 +1,197 @@
+import hashlib
+import json
+import os
+import struct
+import threading
+from time import time
+
+MANIFEST_FILE = "manifest.jsonl"  # Kept next to the videos, one JSON record per line
+MP4_EXTENSIONS = (".mp4", ".m4a", ".m4v", ".mov")
+TRUNCATED = "truncated"  # Start of probe_mp4's reason when the file is a valid MP4 cut short
+MP4_TOP_LEVEL_BOXES = {b'ftyp', b'moov', b'mdat', b'free', b'skip', b'wide', b'uuid', b'moof', b'mfra',
+                       b'sidx', b'styp', b'emsg', b'prft', b'meta', b'pdin', b'ssix'}
+
+
+def hash_file(path, digest=None, chunk_size=1024 * 1024):
+    """
+    Feeds the contents of a file into a hash.
+    Args:
+        path (str): The file to hash.
+        digest: A hashlib object to continue (a new SHA-256 by default).
+
+    Returns:
+        The hashlib object, so a download can carry on hashing what it appends.
+    """
+    digest = digest or hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest
+
+
+def probe_mp4(path):
+    """
+    Walks the top-level boxes of an MP4 file, reading only their headers. A download that
+    was cut short leaves a last box that runs past the end of the file; one that isn't
+    an MP4 at all (an error page, say) has no ftyp box.
+    Args:
+        path (str): The file to check.
+
+    Returns:
+        tuple: (ok, reason) - reason explains what is wrong when ok is False.
+    """
+    size = os.path.getsize(path)
+    seen = set()
+    offset = 0
+    with open(path, "rb") as f:
+        while offset < size:
+            f.seek(offset)
+            header = f.read(8)
+            if len(header) < 8:
+                return False, f"{TRUNCATED}: box header at byte {offset} is cut off"
+            box_size, box_type = struct.unpack(">I4s", header)
+            if box_size == 1:  # 64-bit size follows the type
+                extended = f.read(8)
+                if len(extended) < 8:
+                    return False, f"{TRUNCATED}: box header at byte {offset} is cut off"
+                box_size = struct.unpack(">Q", extended)[0]
+            elif box_size == 0:  # Box runs to the end of the file
+                box_size = size - offset
+            if offset == 0 and box_type not in (b'ftyp', b'styp'):
+                return False, "no ftyp box at the start"
+            if box_type not in MP4_TOP_LEVEL_BOXES or box_size < 8:
+                return False, f"unexpected box {box_type!r} at byte {offset}"
+            if offset + box_size > size:
+                return False, f"{TRUNCATED}: '{box_type.decode('latin-1')}' box ends {offset + box_size - size} bytes past the end of the file"
+            seen.add(box_type)
+            offset += box_size
+    if b'moov' not in seen and b'moof' not in seen:
+        return False, "no moov box"
+    return True, None
+
+
+def is_mp4(filename):
+    return filename.lower().endswith(MP4_EXTENSIONS)
+
+
+class Manifest:
+    """
+    Append-only record of the size and SHA-256 of every file downloaded into a directory,
+    so later runs can tell a complete file from a corrupt or truncated one by its size (cheap)
+    or its checksum (full read) without downloading it again. Later records override earlier
+    ones for the same file.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.offset = 0  # How much of the file has been read into `entries`
+
+    def refresh(self):
+        """Reads records appended since the last call (by this or another process)."""
+        with self.lock:
+            if not os.path.exists(self.path):
+                return
+            with open(self.path, "rb") as f:
+                f.seek(self.offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # A record still being written
+                    self.offset += len(line)
+                    try:
+                        entry = json.loads(line)
+                        if entry.get('removed'):
+                            self.entries.pop(entry['file'], None)
+                        else:
+                            self.entries[entry['file']] = entry
+                    except (ValueError, KeyError):
+                        continue  # Damaged line, e.g. from a crash mid-write
+
+    def append(self, entry):
+        line = (json.dumps(entry) + "\n").encode("utf-8")
+        with self.lock:
+            with open(self.path, "ab") as f:
+                f.write(line)
+            if entry.get('removed'):
+                self.entries.pop(entry['file'], None)
+            else:
+                self.entries[entry['file']] = entry
+
+    def record(self, filename, size, sha256):
+        self.append({'file': os.path.basename(filename), 'size': size, 'sha256': sha256, 'recorded_at': time()})
+
+    def forget(self, filename):
+        """Records that a file was deliberately removed (e.g. replaced by post-processing)."""
+        self.append({'file': os.path.basename(filename), 'removed': True, 'recorded_at': time()})
+
+    def get(self, filename):
+        self.refresh()
+        with self.lock:
+            return self.entries.get(os.path.basename(filename))
+
+    def check(self, filename, full=False):
+        """
+        Checks a file against its record.
+        Args:
+            filename (str): The file.
+            full (bool): Also recompute the checksum (reads the whole file).
+
+        Returns:
+            tuple: (ok, reason). A file without a record passes if it exists.
+        """
+        if not os.path.exists(filename):
+            return False, "missing"
+        entry = self.get(filename)
+        if not entry:
+            return True, None
+        size = os.path.getsize(filename)
+        if size != entry['size']:
+            return False, f"size is {size} bytes, expected {entry['size']}"
+        if full and hash_file(filename).hexdigest() != entry['sha256']:
+            return False, "checksum mismatch"
+        return True, None
+
+    def files(self):
+        self.refresh()
+        with self.lock:
+            return list(self.entries)
+
+
+_manifests = {}
+_manifests_lock = threading.Lock()
+
+
+def manifest_for(filename):
+    """Returns the (shared) manifest of the directory `filename` is in."""
+    path = os.path.join(os.path.dirname(os.path.abspath(filename)), MANIFEST_FILE)
+    with _manifests_lock:
+        manifest = _manifests.get(path)
+        if manifest is None:
+            manifest = _manifests[path] = Manifest(path)
+        return manifest
+
+
+def is_intact(filename):
+    """Quick check (existence and recorded size) used to decide whether a finished download is still good."""
+    ok, reason = manifest_for(filename).check(filename)
+    if not ok and reason != "missing":
+        print(f"⚠️ {filename} is damaged ({reason}), it will be downloaded again")
+    return ok
+
+
+def verify_directory(directory=".", full=True):
+    """
+    Checks every file recorded in a directory's manifest.
+    Returns:
+        list: (filename, reason) for each file that failed.
+    """
+    manifest = manifest_for(os.path.join(directory, MANIFEST_FILE))
+    problems = []
+    for name in manifest.files():
+        path = os.path.join(directory, name)
+        ok, reason = manifest.check(path, full)
+        if ok and full and is_mp4(path):
+            ok, reason = probe_mp4(path)
+        if not ok:
+            problems.append((name, reason))
+    return problems
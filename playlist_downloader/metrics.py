@@ -0,0 +1,348 @@
+import functools
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import monotonic, time
+
+METRICS_PREFIX = "playlist_downloader_"
+METRICS_HOST = "127.0.0.1"  # The endpoint is for a local Prometheus / curl, not the network
+
+# Histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # Seconds
+DURATION_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)  # Seconds
+THROUGHPUT_BUCKETS = tuple(mb * 1024 * 1024 for mb in (0.25, 0.5, 1, 2, 5, 10, 25, 50, 100))  # Bytes per second
+
+
+class _CounterValue:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        with self.lock:
+            self.value = value
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self.lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)  # Per bucket, not cumulative
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        with self.lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+            self.count += 1
+            self.sum += value
+
+    def state(self):
+        with self.lock:
+            return list(self.counts), self.count, self.sum
+
+
+class Metric:
+    """
+    One named metric with optional labels. Without labels it is used directly
+    (`metric.inc()`), with labels through a child per label value (`metric.labels('ok').inc()`).
+    """
+    kind = None
+
+    def __init__(self, name, help, labels=(), buckets=None):
+        self.name = METRICS_PREFIX + name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.children = {}
+
+    def new_value(self):
+        return _HistogramValue(self.buckets) if self.kind == "histogram" else _CounterValue()
+
+    def labels(self, *values):
+        if len(values) != len(self.label_names):
+            raise ValueError(f"{self.name} takes labels {self.label_names}")
+        key = tuple(str(value) for value in values)
+        with self.lock:
+            child = self.children.get(key)
+            if child is None:
+                child = self.children[key] = self.new_value()
+            return child
+
+    def __getattr__(self, name):
+        # inc / dec / set / observe on a metric without labels
+        if name in ('inc', 'dec', 'set', 'observe') and not self.label_names:
+            return getattr(self.labels(), name)
+        raise AttributeError(name)
+
+    def samples(self):
+        with self.lock:
+            return list(self.children.items())
+
+
+class Counter(Metric):
+    kind = "counter"
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def time(self, *values):
+        """Context manager that observes the seconds spent in its block."""
+        return _Timer(self.labels(*values))
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(monotonic() - self.started)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Registry:
+    """
+    Holds the metrics and renders them in the Prometheus text format or as a dict.
+    Collectors are callables for values that live elsewhere (retry counters, connection
+    stats); they are asked for them at render time.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = []
+        self.collectors = []
+        self.started_at = time()
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name, help, buckets, labels=()):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def add_collector(self, name, help, kind, label, collect):
+        """
+        Args:
+            name (str): Metric name (without the prefix).
+            help (str): Description.
+            kind (str): "counter" or "gauge".
+            label (str): Name of the label the keys of `collect()`'s dict go in.
+            collect (callable): Returns {label_value: number}.
+        """
+        metric = Metric(name, help, (label,))
+        metric.kind = kind
+        with self.lock:
+            self.collectors.append((metric, collect))
+
+    def collect(self):
+        """Returns (metric, [(label_values, value)]) for every metric."""
+        with self.lock:
+            metrics = list(self.metrics)
+            collectors = list(self.collectors)
+        result = [(metric, metric.samples()) for metric in metrics]
+        for metric, collect in collectors:
+            try:
+                values = collect()
+            except Exception:
+                continue  # A broken collector must not take the endpoint down
+            result.append((metric, [((str(key),), value) for key, value in values.items()]))
+        return result
+
+    def exposition(self):
+        """Renders every metric in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric, samples in self.collect():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for values, sample in samples:
+                if metric.kind != "histogram":
+                    value = sample.value if isinstance(sample, _CounterValue) else sample
+                    lines.append(f"{metric.name}{_format_labels(metric.label_names, values)} {value}")
+                    continue
+                counts, count, total = sample.state()
+                cumulative = 0
+                for bound, bucket_count in zip(metric.buckets, counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(metric.label_names, values, [('le', f"{bound:g}")])
+                    lines.append(f"{metric.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(metric.label_names, values, [('le', "+Inf")])
+                lines.append(f"{metric.name}_bucket{labels} {count}")
+                labels = _format_labels(metric.label_names, values)
+                lines.append(f"{metric.name}_sum{labels} {total}")
+                lines.append(f"{metric.name}_count{labels} {count}")
+        return "\n".join(lines) + "\n"
+
+    def as_dict(self):
+        """
+        Returns:
+            dict: {metric name: {label string: value}}, where a histogram's value is a dict
+                  with 'count', 'sum', 'mean' and cumulative 'buckets'.
+        """
+        summary = {}
+        for metric, samples in self.collect():
+            entries = summary.setdefault(metric.name, {})
+            for values, sample in samples:
+                key = ",".join(f"{name}={value}" for name, value in zip(metric.label_names, values))
+                if metric.kind != "histogram":
+                    entries[key] = sample.value if isinstance(sample, _CounterValue) else sample
+                    continue
+                counts, count, total = sample.state()
+                buckets, cumulative = {}, 0
+                for bound, bucket_count in zip(metric.buckets, counts):
+                    cumulative += bucket_count
+                    buckets[f"{bound:g}"] = cumulative
+                entries[key] = {'count': count, 'sum': total, 'mean': total / count if count else None,
+                                'buckets': buckets}
+        return summary
+
+    def write_summary(self, path, **extra):
+        """Writes the metrics, plus any `extra` fields, as a JSON summary of the run."""
+        finished_at = time()
+        summary = dict(extra)
+        summary.update({
+            'started_at': self.started_at,
+            'finished_at': finished_at,
+            'elapsed_seconds': finished_at - self.started_at,
+            'metrics': self.as_dict()
+        })
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        os.replace(tmp_path, path)
+
+
+def start_server(port, host=METRICS_HOST, target=None):
+    """
+    Serves the registry on http://host:port/metrics (Prometheus text) and /metrics.json,
+    from a daemon thread.
+
+    Returns:
+        ThreadingHTTPServer: The running server (call shutdown() to stop it).
+    """
+    target = target or registry
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split('?', 1)[0]
+            if path in ('/', '/metrics'):
+                body = target.exposition().encode('utf-8')
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            elif path == '/metrics.json':
+                body = json.dumps(target.as_dict()).encode('utf-8')
+                content_type = "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Scrapes every few seconds would drown the download output
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def instrument(duration, results=None, active=None, cancelled=(), succeeded=bool):
+    """
+    Decorator recording how long each call takes and how it ended: 'success' for a truthy
+    result, 'failed' for a falsy one, 'cancelled' for the `cancelled` exceptions and
+    'error' for any other exception.
+    Args:
+        duration (Histogram): Observes the seconds per call, labelled with the result.
+        results (Counter): Counts the calls per result.
+        active (Gauge): Number of calls currently running.
+        cancelled (tuple): Exception types that mean the call was cancelled.
+        succeeded (callable): Tells a successful return value from a failed one.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = monotonic()
+            result = 'error'
+            if active is not None:
+                active.inc()
+            try:
+                value = func(*args, **kwargs)
+                result = 'success' if succeeded(value) else 'failed'
+                return value
+            except cancelled:
+                result = 'cancelled'
+                raise
+            finally:
+                if active is not None:
+                    active.dec()
+                duration.labels(result).observe(monotonic() - started)
+                if results is not None:
+                    results.labels(result).inc()
+        return wrapper
+    return decorate
+
+
+registry = Registry()
+
+# Instruments used by the core
+resolve_seconds = registry.histogram(
+    "cobalt_resolve_seconds", "Time for cobalt to hand back a tunnel", LATENCY_BUCKETS, ('result',))
+video_seconds = registry.histogram(
+    "video_seconds", "Time to download one resolved video, re-resolving and recording it included", DURATION_BUCKETS, ('result',))
+download_seconds = registry.histogram(
+    "download_seconds", "Time to download one file, retries included", DURATION_BUCKETS, ('result',))
+downloads = registry.counter("downloads_total", "Downloads finished, by result", ('result',))
+downloads_active = registry.gauge("downloads_active", "Downloads in progress")
+first_byte_seconds = registry.histogram(
+    "tunnel_first_byte_seconds", "Time from a tunnel request to its response headers", LATENCY_BUCKETS)
+throughput = registry.histogram(
+    "download_throughput_bytes_per_second", "Average speed of each completed download", THROUGHPUT_BUCKETS)
+bytes_written = registry.counter("bytes_written_total", "Bytes received from tunnels and written to disk")
+api_pages = registry.counter("youtube_api_pages_total", "Playlist pages requested from the YouTube API", ('result',))
+playlist_seconds = registry.histogram(
+    "playlist_fetch_seconds", "Time spent on the API listing a whole playlist", DURATION_BUCKETS, ('result',))
+store_links = registry.counter("store_links_total", "Videos put in place from the content store, by method", ('method',))
+store_bytes_saved = registry.counter("store_bytes_saved_total", "Bytes not downloaded thanks to the content store")
+videos_skipped = registry.counter("videos_skipped_total", "Playlist entries left out before download", ('reason',))
+postprocess_seconds = registry.histogram(
+    "postprocess_seconds", "Time from queueing a file for post-processing to its result", DURATION_BUCKETS, ('result',))
+postprocess_pending = registry.gauge("postprocess_pending", "Files queued or being post-processed")
+postprocess_wait_seconds = registry.histogram(
+    "postprocess_wait_seconds", "Time downloads were held back waiting for room in the post-processing queue",
+    LATENCY_BUCKETS)
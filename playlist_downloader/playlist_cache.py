@@ -0,0 +1,62 @@
+import json
+import os
+from time import time
+
+# Default directory the playlist listings are cached in
+PLAYLIST_CACHE_DIR = ".playlist_cache"
+
+
+class PlaylistCache:
+    """
+    On-disk cache of playlistItems listings, one JSON file per playlist.
+    Each cached page keeps the ETag of the response it came from so the next sync can
+    send a conditional request and reuse the page when YouTube answers 304 Not Modified.
+    """
+    def __init__(self, cache_dir=PLAYLIST_CACHE_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, playlist_id):
+        return os.path.join(self.cache_dir, f"{playlist_id}.json")
+
+    def load(self, playlist_id):
+        """
+        Returns the cached listing of a playlist, or None if it was never synced.
+        The listing is a dict with 'playlist_id', 'updated_at' and 'pages', where every page
+        has 'page_token', 'etag', 'next_page_token' and 'items' ({'id', 'title', 'url'} dicts).
+        """
+        try:
+            with open(self._path(playlist_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None  # Missing or corrupt cache files just mean a full fetch
+
+    def save(self, playlist_id, pages):
+        """Stores the pages of a playlist listing, replacing any earlier copy atomically."""
+        path = self._path(playlist_id)
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({'playlist_id': playlist_id, 'updated_at': time(), 'pages': pages}, f)
+        os.replace(temp_path, path)
+
+
+def listing_videos(pages):
+    """Flattens the pages of a cached listing into a list of video entries."""
+    return [item for page in pages for item in page['items']]
+
+
+def listing_delta(old_videos, new_videos):
+    """
+    Compares two listings of the same playlist.
+    Args:
+        old_videos (list): Entries from the previous sync.
+        new_videos (list): Entries from the current sync.
+
+    Returns:
+        tuple: (added, removed) lists of entries, each in playlist order.
+    """
+    old_ids = {video['id'] for video in old_videos}
+    new_ids = {video['id'] for video in new_videos}
+    added = [video for video in new_videos if video['id'] not in old_ids]
+    removed = [video for video in old_videos if video['id'] not in new_ids]
+    return added, removed
@@ -0,0 +1,297 @@
+"""
+Post-processing of finished downloads - remuxing, transcoding, audio extraction, tagging and
+thumbnail embedding with ffmpeg, or any function of your own - run in a pool of worker
+processes while the next videos are still downloading.
+
+A step is a module-level function `step(path, arg, video)` that returns the path of the file
+the next step should work on (the same path when it changed the file in place). It runs in a
+worker process, so it must be importable there: the built-in steps are named (see STEPS), your
+own are given as 'package.module:function'. Either takes an argument after '=':
+
+    --postprocess remux=mkv tag thumbnail
+    --postprocess extract-audio=mp3 mytools.tagging:add_lyrics=en
+"""
+import importlib
+import multiprocessing
+import os
+import shutil
+import subprocess
+import threading
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from time import monotonic
+from . import metrics
+from .http_client import get_session
+from .integrity import hash_file, manifest_for
+from .storage import commit_file
+
+FFMPEG = "ffmpeg"  # Looked up on PATH
+FFPROBE = "ffprobe"  # Used by the thumbnail step
+POSTPROCESS_WORKERS = max(1, (os.cpu_count() or 2) // 2)  # Processes running steps at the same time
+POSTPROCESS_NICE = 10  # Workers (and their ffmpeg) run at a lower priority than the downloads
+THUMBNAIL_URL = "https://i.ytimg.com/vi/{id}/hqdefault.jpg"
+
+# extract-audio format -> file extension and ffmpeg codec options
+AUDIO_FORMATS = {
+    'm4a': ('m4a', ['-c:a', 'copy']),  # The AAC track cobalt's h264 MP4s carry, as is
+    'mp3': ('mp3', ['-c:a', 'libmp3lame', '-q:a', '2']),
+    'opus': ('opus', ['-c:a', 'libopus', '-b:a', '160k']),
+    'flac': ('flac', ['-c:a', 'flac'])
+}
+
+
+class PostProcessError(Exception):
+    pass
+
+
+def run_ffmpeg(args, tool=FFMPEG):
+    result = subprocess.run([tool, '-hide_banner', '-loglevel', 'error', *args],
+                            stdin=subprocess.DEVNULL, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise PostProcessError(f"{tool} failed: {result.stderr.strip()[-500:] or f'exit status {result.returncode}'}")
+    return result.stdout
+
+
+def ffmpeg_to(output, args):
+    """Runs ffmpeg into a temporary file next to `output`, then puts it in place atomically."""
+    root, ext = os.path.splitext(output)
+    temp = f"{root}.part{ext}"  # ffmpeg picks the container from the extension
+    try:
+        run_ffmpeg(['-nostdin', '-y', *args, temp])
+        commit_file(temp, output)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+    return output
+
+
+def remux(path, container, video):
+    """Copies the streams into another container (default mkv) without re-encoding."""
+    container = (container or 'mkv').lstrip('.')
+    root, ext = os.path.splitext(path)
+    if ext[1:].lower() == container.lower():
+        return path
+    output = ffmpeg_to(f"{root}.{container}", ['-i', path, '-map', '0', '-c', 'copy'])
+    os.remove(path)
+    return output
+
+
+def transcode(path, codec, video):
+    """Re-encodes the video track (default libx265) in place; the audio is copied."""
+    threads = max(1, (os.cpu_count() or 1) // POSTPROCESS_WORKERS)  # Don't oversubscribe the other workers
+    return ffmpeg_to(path, ['-i', path, '-map', '0', '-c', 'copy', '-c:v', codec or 'libx265',
+                            '-threads', str(threads)])
+
+
+def extract_audio(path, audio_format, video):
+    """Writes the audio track to its own file (default m4a) next to the video, which is kept."""
+    audio_format = (audio_format or 'm4a').lower()
+    if audio_format not in AUDIO_FORMATS:
+        raise PostProcessError(f"unknown audio format '{audio_format}' (one of {', '.join(AUDIO_FORMATS)})")
+    extension, codec = AUDIO_FORMATS[audio_format]
+    root, _ = os.path.splitext(path)
+    return ffmpeg_to(f"{root}.{extension}", ['-i', path, '-vn', '-map', '0:a:0', *codec])
+
+
+def tag(path, arg, video):
+    """Writes the title, channel, date and video URL into the file's metadata."""
+    tags = {'title': video.get('title'), 'artist': video.get('channel'),
+            'date': (video.get('published_at') or '')[:10] or None, 'comment': video.get('url')}
+    metadata = [option for key, value in tags.items() if value
+                for option in ('-metadata', f"{key}={value}")]
+    return ffmpeg_to(path, ['-i', path, '-map', '0', '-c', 'copy', *metadata])
+
+
+def thumbnail(path, arg, video):
+    """Embeds the video's YouTube thumbnail as cover art (MP4, M4A, MP3 or MKV)."""
+    if not video.get('id'):
+        raise PostProcessError("no video ID to fetch the thumbnail of")
+    response = get_session().get(THUMBNAIL_URL.format(id=video['id']))  # Runs in a worker: its own session
+    response.raise_for_status()
+    root, ext = os.path.splitext(path)
+    image = f"{root}.thumbnail.jpg"
+    with open(image, "wb") as f:
+        f.write(response.content)
+    try:
+        if ext.lower() == '.mkv':
+            args = ['-i', path, '-map', '0', '-c', 'copy', '-attach', image,
+                    '-metadata:s:t', 'mimetype=image/jpeg', '-metadata:s:t', 'filename=cover.jpg']
+        elif ext.lower() in ('.mp4', '.m4a', '.m4v', '.mov', '.mp3'):
+            # The picture becomes the stream after the existing ones
+            streams = len(run_ffmpeg(['-v', 'error', '-show_entries', 'stream=index', '-of', 'csv=p=0', path],
+                                     tool=FFPROBE).split())
+            args = ['-i', path, '-i', image, '-map', '0', '-map', '1', '-c', 'copy',
+                    f'-disposition:{streams}', 'attached_pic']
+        else:
+            raise PostProcessError(f"can't embed a thumbnail in a {ext or 'extensionless'} file")
+        return ffmpeg_to(path, args)
+    finally:
+        os.remove(image)
+
+
+# Built-in steps by name; all of them need ffmpeg
+STEPS = {
+    'remux': remux,
+    'transcode': transcode,
+    'extract-audio': extract_audio,
+    'tag': tag,
+    'thumbnail': thumbnail
+}
+
+
+def parse_steps(specs):
+    """
+    Turns step specs ('name', 'name=arg', 'module:function', 'module:function=arg') into
+    (function, arg) pairs.
+    Raises:
+        ValueError: On an unknown step, a function that can't be imported or a missing ffmpeg.
+    """
+    steps = []
+    for spec in specs:
+        name, _, arg = spec.partition('=')
+        if ':' in name:
+            module_name, _, function_name = name.partition(':')
+            try:
+                func = getattr(importlib.import_module(module_name), function_name)
+            except (ImportError, AttributeError) as e:
+                raise ValueError(f"post-processing step '{name}' can't be imported: {e}")
+        elif name in STEPS:
+            func = STEPS[name]
+        else:
+            raise ValueError(f"unknown post-processing step '{name}' (built in: {', '.join(STEPS)})")
+        steps.append((func, arg or None))
+    if any(func in STEPS.values() for func, _ in steps) and not shutil.which(FFMPEG):
+        raise ValueError(f"post-processing needs {FFMPEG}, which is not on the PATH")
+    return steps
+
+
+def lower_priority():
+    if hasattr(os, 'nice'):
+        os.nice(POSTPROCESS_NICE)
+
+
+def run_steps(path, steps, video):
+    """
+    Runs the steps on one file, in a worker process.
+
+    Returns:
+        tuple: (final_path, files, removed, error) - the file the last successful step returned,
+               (path, size, sha256) of every file the steps left behind and the paths they
+               removed, so the parent process can bring the manifest up to date even when a
+               step failed part way, and the error of the failed step (None if all succeeded).
+    """
+    touched = [path]
+    error = None
+    for func, arg in steps:
+        try:
+            path = func(path, arg, video)
+        except Exception as e:
+            error = f"{getattr(func, '__name__', func)}: {e}"
+            break
+        touched.append(path)
+    files, removed = [], []
+    for candidate in dict.fromkeys(touched):
+        if os.path.exists(candidate):
+            files.append((candidate, os.path.getsize(candidate), hash_file(candidate).hexdigest()))
+        else:
+            removed.append(candidate)
+    return path, files, removed, error
+
+
+class PostProcessor:
+    """
+    Runs the post-processing steps on finished downloads in a pool of worker processes.
+    At most `max_pending` files are queued or being processed; submit() blocks beyond that,
+    which holds the download worker that called it, so a slow ffmpeg slows the downloads down
+    instead of piling up work (and disk space) without limit.
+    """
+    def __init__(self, steps, workers=POSTPROCESS_WORKERS, max_pending=None):
+        self.steps = list(steps)
+        self.workers = max(1, workers)
+        self.max_pending = max_pending or self.workers * 2
+        self.slots = threading.BoundedSemaphore(self.max_pending)
+        self.lock = threading.RLock()  # Cancelling a future runs its callback in the cancelling thread
+        self.idle = threading.Condition(self.lock)
+        self.executor = None
+        self.futures = set()
+        self.failures = []
+
+    def submit(self, video, path, on_done=None):
+        """
+        Queues a finished download, waiting for room in the queue first.
+        Args:
+            video (dict): The playlist entry, passed to every step.
+            path (str): The downloaded file.
+            on_done (callable): Called as on_done(final_path, sha256) with the file the steps
+                                left (the last good one if a step failed).
+        """
+        started = monotonic()
+        self.slots.acquire()
+        metrics.postprocess_wait_seconds.observe(monotonic() - started)
+        try:
+            with self.lock:
+                if self.executor is None:
+                    # spawn - forking a process full of download threads is asking for deadlocks
+                    self.executor = ProcessPoolExecutor(self.workers, multiprocessing.get_context('spawn'),
+                                                        initializer=lower_priority)
+                future = self.executor.submit(run_steps, path, self.steps, video)
+                self.futures.add(future)
+        except Exception:
+            self.slots.release()
+            raise
+        metrics.postprocess_pending.inc()
+        future.add_done_callback(lambda future: self.finished(future, video, path, on_done, started))
+
+    def finished(self, future, video, path, on_done, started):
+        try:
+            self.record(future, video, path, on_done, started)
+        finally:
+            self.slots.release()
+            metrics.postprocess_pending.dec()
+            with self.idle:
+                self.futures.discard(future)
+                self.idle.notify_all()
+
+    def record(self, future, video, path, on_done, started):
+        try:
+            final_path, files, removed, error = future.result()
+        except CancelledError:
+            metrics.postprocess_seconds.labels('cancelled').observe(monotonic() - started)
+            return
+        except Exception as e:  # The worker itself died
+            final_path, files, removed, error = path, [], [], str(e)
+        metrics.postprocess_seconds.labels('failed' if error else 'success').observe(monotonic() - started)
+
+        # Files changed in place have a new size and checksum; without a new record the next
+        # run would take them for damaged downloads
+        checksum = None
+        for file_path, size, sha256 in files:
+            manifest_for(file_path).record(file_path, size, sha256)
+            if file_path == final_path:
+                checksum = sha256
+        for file_path in removed:
+            manifest_for(file_path).forget(file_path)
+        if error:
+            print(f"❌ Post-processing failed for {path}: {error} (kept as {os.path.basename(final_path)})")
+            with self.lock:
+                self.failures.append({"title": video.get('title'), "url": video.get('url'), "error": error})
+        else:
+            print(f"🛠️ Post-processed {os.path.basename(path)}"
+                  + (f" -> {os.path.basename(final_path)}" if final_path != path else ""))
+        if on_done and checksum:
+            on_done(final_path, checksum)
+
+    def join(self, cancel_event=None):
+        """Waits for every queued file; with `cancel_event` set, the ones not started are dropped."""
+        with self.idle:
+            while self.futures:
+                if cancel_event is not None and cancel_event.is_set():
+                    for future in list(self.futures):
+                        future.cancel()
+                self.idle.wait(0.5)
+
+    def close(self):
+        self.join()
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown()
@@ -0,0 +1,215 @@
+import sys
+import threading
+from time import monotonic, sleep
+
+REPORT_INTERVAL = 0.5  # Seconds between two renders of the progress display
+LOG_INTERVAL = 10  # Seconds between two progress lines when stdout is not a terminal
+SPEED_SMOOTHING = 0.3  # Weight of the newest sample in the moving average of the speed
+
+
+class DownloadProgress:
+    """
+    Byte counters of one download. The download loop only calls add(); everything
+    else (speed, ETA, drawing) is worked out by the reporter from periodic samples.
+    """
+    def __init__(self, name, total=None, downloaded=0):
+        self.name = name
+        self.total = total
+        self.downloaded = downloaded
+        self.baseline = downloaded  # Bytes already there when counting started (resumed downloads)
+        self.written = 0  # Bytes added by this process over every attempt, never reset
+        self.started_at = monotonic()
+        self.created_at = self.started_at  # Unlike started_at, not reset when an attempt starts over
+        self.first_byte_at = None
+        self.finished = False
+        self.success = None
+        self.lock = threading.Lock()
+
+    def add(self, amount):
+        with self.lock:  # Segments of one file add from several threads
+            self.downloaded += amount
+            self.written += amount
+            if self.first_byte_at is None:
+                self.first_byte_at = monotonic()
+
+    def set_total(self, total, downloaded=None):
+        self.total = total
+        if downloaded is not None:
+            self.downloaded = downloaded
+            self.baseline = downloaded
+            self.started_at = monotonic()
+
+
+class ProgressTracker:
+    """
+    Registry of the running downloads plus a reporter thread that samples their counters
+    at a fixed rate. Each sample is rendered as one aggregate line on the terminal and
+    handed to listeners as a list of plain dicts, which they may keep or pass to other
+    threads (e.g. the GUI's event queue).
+    """
+    def __init__(self, interval=REPORT_INTERVAL, render=True, stream=None):
+        """
+        Args:
+            interval (float): Seconds between samples.
+            render (bool): Draw the aggregate progress line on `stream`.
+            stream: Where to draw (default sys.stdout, looked up at render time).
+        """
+        self.interval = interval
+        self.render = render
+        self.stream = stream
+        self.lock = threading.Lock()
+        self.downloads = []
+        self.listeners = []
+        self.speeds = {}
+        self.samples = {}
+        self.reporter = None
+        self.line_width = 0
+        self.last_log = 0
+
+    def start(self, name, total=None, downloaded=0):
+        """Registers a download and returns the DownloadProgress its loop should add() to."""
+        progress = DownloadProgress(name, total, downloaded)
+        with self.lock:
+            self.downloads.append(progress)
+            if self.reporter is None:
+                self.reporter = threading.Thread(target=self._run, daemon=True)
+                self.reporter.start()
+        return progress
+
+    def finish(self, progress, success=True):
+        """Marks a download as done; it is reported once more and then dropped."""
+        progress.finished = True
+        progress.success = success
+
+    def add_listener(self, callback):
+        """Calls `callback(snapshot)` from the reporter thread after every sample."""
+        with self.lock:
+            self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self.lock:
+            if callback in self.listeners:
+                self.listeners.remove(callback)
+
+    def snapshot(self):
+        """
+        Samples every registered download.
+        Returns:
+            list: One dict per download with 'name', 'downloaded', 'total', 'speed'
+                  (bytes/s), 'eta' (seconds or None), 'first_byte' (seconds from the start
+                  to the first byte over every attempt, None before it), 'finished' and 'success'.
+        """
+        now = monotonic()
+        with self.lock:
+            downloads = list(self.downloads)
+            # Finished downloads are reported one last time, then forgotten
+            self.downloads = [progress for progress in self.downloads if not progress.finished]
+
+        snapshot = []
+        for progress in downloads:
+            key = id(progress)
+            downloaded = progress.downloaded
+            last_time, last_downloaded = self.samples.get(key, (progress.started_at, progress.baseline))
+            elapsed = now - last_time
+            if elapsed > 0:
+                sample = (downloaded - last_downloaded) / elapsed
+                speed = self.speeds.get(key)
+                self.speeds[key] = sample if speed is None else speed + SPEED_SMOOTHING * (sample - speed)
+            self.samples[key] = (now, downloaded)
+            speed = self.speeds.get(key, 0)
+            eta = (progress.total - downloaded) / speed if progress.total and speed > 0 else None
+            snapshot.append({
+                'name': progress.name,
+                'downloaded': downloaded,
+                'total': progress.total,
+                'speed': speed,
+                'eta': eta,
+                'first_byte': (progress.first_byte_at - progress.created_at
+                               if progress.first_byte_at is not None else None),
+                'finished': progress.finished,
+                'success': progress.success
+            })
+            if progress.finished:
+                self.samples.pop(key, None)
+                self.speeds.pop(key, None)
+        return snapshot
+
+    def _run(self):
+        while True:
+            sleep(self.interval)
+            snapshot = self.snapshot()
+            if not snapshot:
+                continue
+            if self.render:
+                self._render(snapshot)
+            with self.lock:
+                listeners = list(self.listeners)
+            for listener in listeners:
+                try:
+                    listener(snapshot)
+                except Exception as e:
+                    print(f"⚠️ Progress listener failed: {str(e)}")
+
+    def _render(self, snapshot):
+        stream = self.stream or sys.stdout
+        active = [download for download in snapshot if not download['finished']]
+        if not active:
+            return
+        line = format_progress_line(active)
+
+        if getattr(stream, 'isatty', lambda: False)():
+            # Redraw in place, padding over whatever the previous line left behind
+            stream.write(f"\r{line:<{self.line_width}}")
+            self.line_width = len(line)
+        else:
+            # Logs (cron, systemd) get a plain line every LOG_INTERVAL seconds instead
+            now = monotonic()
+            if now - self.last_log < LOG_INTERVAL:
+                return
+            self.last_log = now
+            stream.write(line + "\n")
+        stream.flush()
+
+
+def format_size(amount):
+    """Formats a byte count (or bytes per second) with a readable unit."""
+    for unit in ("B", "KB", "MB", "GB"):
+        if amount < 1024 or unit == "GB":
+            return f"{amount:.1f} {unit}" if unit != "B" else f"{int(amount)} B"
+        amount /= 1024
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "--:--"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02}:{seconds:02}" if hours else f"{minutes:02}:{seconds:02}"
+
+
+def format_progress_line(active):
+    """
+    Renders the running downloads as a single line: the classic bar for one download,
+    an aggregate with a short entry per file for several.
+    """
+    if len(active) == 1:
+        download = active[0]
+        if download['total']:
+            percent = min(download['downloaded'] / download['total'] * 100, 100)
+            bar = f"[{'=' * int(percent // 2):50}] {percent:5.1f}%"
+        else:
+            bar = f"[{'=' * 50}] downloading..."
+        return (f"{bar} ({download['downloaded'] // 1024} KB) "
+                f"{format_size(download['speed'])}/s ETA {format_eta(download['eta'])}")
+
+    speed = sum(download['speed'] for download in active)
+    entries = []
+    for download in active[:4]:
+        name = download['name'] if len(download['name']) <= 20 else download['name'][:19] + "…"
+        if download['total']:
+            entries.append(f"{name} {download['downloaded'] / download['total'] * 100:.0f}%")
+        else:
+            entries.append(f"{name} {format_size(download['downloaded'])}")
+    if len(active) > 4:
+        entries.append(f"+{len(active) - 4} more")
+    return f"⬇️ {len(active)} active, {format_size(speed)}/s | " + " | ".join(entries)
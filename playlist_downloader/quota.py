@@ -0,0 +1,65 @@
+import threading
+
+DAILY_QUOTA = 10000  # Units a Google Cloud project gets per day unless it asked for more
+
+# Units charged per call (https://developers.google.com/youtube/v3/determine_quota_cost).
+# The charge is per request, whatever its `part`s or result count - a 304 included
+QUOTA_COSTS = {
+    'playlistItems.list': 1,
+    'videos.list': 1,
+    'channels.list': 1,
+    'search.list': 100
+}
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+class QuotaTracker:
+    """
+    Counts the YouTube Data API units a run spends, per API method. With a `limit`, a call
+    that would go past it is refused (QuotaExceeded) before it is made, so one run can't eat
+    the whole day's quota; optional work such as enrichment checks can_spend() first and
+    skips itself instead.
+    """
+    def __init__(self, limit=None):
+        self.lock = threading.Lock()
+        self.limit = limit
+        self.units = {}
+
+    @property
+    def spent(self):
+        with self.lock:
+            return sum(self.units.values())
+
+    def can_spend(self, method, calls=1):
+        cost = QUOTA_COSTS.get(method, 1) * calls
+        return self.limit is None or self.spent + cost <= self.limit
+
+    def spend(self, method, calls=1):
+        """
+        Records `calls` calls of an API method; call it right before the request.
+        Raises:
+            QuotaExceeded: If the calls would take the run past its limit.
+        """
+        cost = QUOTA_COSTS.get(method, 1) * calls
+        with self.lock:
+            spent = sum(self.units.values())
+            if self.limit is not None and spent + cost > self.limit:
+                raise QuotaExceeded(f"YouTube API quota limit of {self.limit} units reached "
+                                    f"({spent} spent, {method} needs {cost})")
+            self.units[method] = self.units.get(method, 0) + cost
+        return cost
+
+    def snapshot(self):
+        """Returns {method: units spent}."""
+        with self.lock:
+            return dict(self.units)
+
+    def summary(self):
+        units = self.snapshot()
+        total = sum(units.values())
+        details = ", ".join(f"{method} {spent}" for method, spent in sorted(units.items()))
+        limit = f" of the {self.limit} allowed" if self.limit is not None else f" ({total / DAILY_QUOTA:.2%} of a default day)"
+        return f"{total} units{limit}" + (f": {details}" if details else "")
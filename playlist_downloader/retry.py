@@ -0,0 +1,300 @@
+import errno
+import random
+import threading
+from email.utils import parsedate_to_datetime
+from time import monotonic, sleep, time
+from urllib.parse import urlparse
+import requests
+
+# Retry policy settings - shared by every request of a batch through core.retry_policy
+MAX_ATTEMPTS = 5  # Attempts per operation (download, segment or cobalt request)
+BACKOFF_BASE = 1.0  # Seconds before the first retry, doubled on every further retry
+BACKOFF_MAX = 60.0  # Cap on the exponential backoff, in seconds
+RETRY_AFTER_MAX = 300.0  # Longest Retry-After wait honoured, in seconds
+RETRY_BUDGET_MIN = 20  # Retries available to the batch before any operation has run
+RETRY_BUDGET_RATIO = 0.2  # Retries added to the budget per operation started (20% extra load at most)
+BREAKER_THRESHOLD = 5  # Consecutive failures that open a host's circuit
+BREAKER_COOLDOWN = 30.0  # Seconds an open circuit rejects requests before letting one probe through
+
+# Error classes
+RETRYABLE = "retryable"  # Network drops, timeouts, 5xx, short reads
+RATE_LIMITED = "rate_limited"  # 429 / 503 with Retry-After - the host is busy, not broken
+NON_RETRYABLE = "non_retryable"  # Other 4xx, a full disk - trying again won't help
+
+RETRYABLE_STATUSES = (408, 500, 502, 503, 504)
+# Local failures that no retry can fix
+NON_RETRYABLE_ERRNOS = {errno.ENOSPC, errno.EROFS, getattr(errno, 'EDQUOT', errno.ENOSPC)}
+
+
+def parse_retry_after(value):
+    """
+    Parses a Retry-After header, either delay-seconds or an HTTP date.
+    Returns:
+        float: Seconds to wait (never negative), or None if the header is missing or invalid.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(error):
+    """
+    Sorts an exception raised by a request or a download into an error class.
+    Args:
+        error (Exception): The exception.
+
+    Returns:
+        tuple: (error_class, retry_after) - one of RETRYABLE, RATE_LIMITED or NON_RETRYABLE,
+               and the Retry-After delay in seconds when the server sent one.
+    """
+    response = getattr(error, 'response', None)
+    if isinstance(error, requests.HTTPError) and response is not None:
+        status = response.status_code
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        if status == 429 or (status == 503 and retry_after is not None):
+            return RATE_LIMITED, retry_after
+        if status in RETRYABLE_STATUSES:
+            return RETRYABLE, retry_after
+        return NON_RETRYABLE, None
+    if isinstance(error, requests.RequestException):
+        return RETRYABLE, None  # Connection errors, timeouts, broken chunked responses
+    if isinstance(error, OSError) and error.errno in NON_RETRYABLE_ERRNOS:
+        return NON_RETRYABLE, None
+    return RETRYABLE, None  # Anything else (short reads, size mismatches) gets another try
+
+
+class RetryBudget:
+    """
+    Caps the retries of a whole batch: every operation started adds `ratio` retries to the
+    budget and every retry spends one, so when a host is failing across the board the batch
+    stops multiplying its load instead of retrying each video to the limit.
+    """
+    def __init__(self, ratio=RETRY_BUDGET_RATIO, minimum=RETRY_BUDGET_MIN):
+        self.lock = threading.Lock()
+        self.ratio = ratio
+        self.tokens = float(minimum)
+
+    def record_operation(self):
+        with self.lock:
+            self.tokens += self.ratio
+
+    def try_spend(self):
+        """Takes one retry from the budget; returns False when it is used up."""
+        with self.lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class CircuitBreaker:
+    """
+    Per-host circuit breaker. After `threshold` consecutive failures the circuit opens and
+    requests wait `cooldown` seconds; then a single probe goes through (half-open) and its
+    outcome closes the circuit or opens it again. Rate limits hold the circuit open for the
+    Retry-After delay so every worker backs off together.
+    """
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.lock = threading.Lock()
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self.probe_started = None
+
+    def wait_time(self):
+        """Returns 0 if a request may go out now, otherwise the seconds to wait before asking again."""
+        with self.lock:
+            now = monotonic()
+            if now < self.open_until:
+                return self.open_until - now
+            if self.failures >= self.threshold:
+                # Half-open - one probe at a time; a probe that never reported back is replaced
+                if self.probe_started is not None and now - self.probe_started < self.cooldown:
+                    return min(1.0, self.cooldown)
+                self.probe_started = now
+            return 0.0
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.probe_started = None
+
+    def record_failure(self):
+        """Returns True if this failure opened the circuit."""
+        with self.lock:
+            self.failures += 1
+            self.probe_started = None
+            if self.failures >= self.threshold:
+                self.open_until = monotonic() + self.cooldown
+                return self.failures == self.threshold
+            return False
+
+    def hold(self, seconds):
+        with self.lock:
+            self.open_until = max(self.open_until, monotonic() + seconds)
+
+
+class RetryPolicy:
+    """
+    Decides whether and when a failed operation is tried again. Thread-safe; one instance is
+    shared by the whole batch so the retry budget and the circuit breakers see every request.
+
+    Typical use, for a loop that needs its own bookkeeping between attempts:
+
+        attempt = 1
+        while True:
+            policy.wait_for_host(url, attempt)
+            try:
+                ...
+                policy.record_success(url)
+                break
+            except Exception as e:
+                delay = policy.next_delay(url, e, attempt)
+                if delay is None:
+                    raise
+                sleep(delay)
+                attempt += 1
+
+    or `policy.call(func, url)` for a plain function.
+    """
+    def __init__(self, max_attempts=MAX_ATTEMPTS, backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX,
+                 retry_after_max=RETRY_AFTER_MAX, budget=None, breaker_threshold=BREAKER_THRESHOLD,
+                 breaker_cooldown=BREAKER_COOLDOWN):
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_after_max = retry_after_max
+        self.budget = budget or RetryBudget()
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.breakers = {}
+        self.lock = threading.Lock()
+        self.counters = {'retries': 0, 'rate_limited': 0, 'gave_up': 0, 'budget_exhausted': 0, 'circuits_opened': 0}
+
+    def breaker(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            breaker = self.breakers.get(host)
+            if breaker is None:
+                breaker = CircuitBreaker(self.breaker_threshold, self.breaker_cooldown)
+                self.breakers[host] = breaker
+            return breaker
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def backoff(self, attempt):
+        """Exponential backoff with equal jitter: half the delay is fixed, half random."""
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def wait_for_host(self, url, attempt=1, cancel_event=None):
+        """
+        Blocks while the circuit of `url`'s host is open. Call before every attempt; the first
+        attempt of an operation also adds to the retry budget.
+        Args:
+            url (str): The URL about to be requested.
+            attempt (int): 1-based attempt number.
+            cancel_event (threading.Event): Ends the wait early when set.
+
+        Returns:
+            bool: False if `cancel_event` was set while waiting.
+        """
+        if attempt == 1:
+            self.budget.record_operation()
+        breaker = self.breaker(url)
+        announced = False
+        while True:
+            delay = breaker.wait_time()
+            if delay <= 0:
+                return True
+            if not announced:
+                print(f"🚧 {urlparse(url).netloc} is backing off, waiting {delay:.0f}s before the next request")
+                announced = True
+            if cancel_event is not None:
+                if cancel_event.wait(delay):
+                    return False
+            else:
+                sleep(delay)
+
+    def record_success(self, url):
+        self.breaker(url).record_success()
+
+    def next_delay(self, url, error, attempt, max_attempts=None):
+        """
+        Records a failed attempt and decides what to do next.
+        Args:
+            url (str): The URL that failed.
+            error (Exception): The exception it failed with.
+            attempt (int): 1-based number of the attempt that failed.
+            max_attempts (int): Overrides the policy's attempt limit for this operation.
+
+        Returns:
+            float: Seconds to wait before the next attempt, or None to give up.
+        """
+        error_class, retry_after = classify_error(error)
+        breaker = self.breaker(url)
+        if error_class == NON_RETRYABLE:
+            breaker.record_success()  # The host answered; the request itself is at fault
+            return None
+
+        if error_class == RATE_LIMITED:
+            self.count('rate_limited')
+            delay = max(retry_after if retry_after is not None else 0, self.backoff(attempt))
+            breaker.hold(min(delay, self.retry_after_max))  # Other workers wait too
+        else:
+            if breaker.record_failure():
+                self.count('circuits_opened')
+                print(f"🚧 {urlparse(url).netloc} failed {self.breaker_threshold} times in a row, "
+                      f"pausing requests to it for {self.breaker_cooldown:.0f}s")
+            delay = max(retry_after or 0, self.backoff(attempt))
+
+        if attempt >= (max_attempts or self.max_attempts):
+            self.count('gave_up')
+            return None
+        if not self.budget.try_spend():
+            self.count('budget_exhausted')
+            print("⚠️ Retry budget for this batch is used up, not retrying")
+            return None
+        self.count('retries')
+        return min(delay, self.retry_after_max)
+
+    def call(self, func, url, max_attempts=None):
+        """
+        Calls `func()` until it returns, retrying the failures the policy allows.
+        Args:
+            func (callable): The operation; raises on failure.
+            url (str): The URL it requests, for the circuit breaker.
+            max_attempts (int): Overrides the policy's attempt limit.
+
+        Returns:
+            The result of `func()`; the last exception is re-raised when giving up.
+        """
+        attempt = 1
+        while True:
+            self.wait_for_host(url, attempt)
+            try:
+                result = func()
+            except Exception as e:
+                delay = self.next_delay(url, e, attempt, max_attempts)
+                if delay is None:
+                    raise
+                print(f"⚠️ {e} - retrying in {delay:.1f}s")
+                sleep(delay)
+                attempt += 1
+            else:
+                self.record_success(url)
+                return result
+
+    def snapshot(self):
+        """Returns the counters (retries, rate_limited, gave_up, budget_exhausted, circuits_opened)."""
+        with self.lock:
+            return dict(self.counters)
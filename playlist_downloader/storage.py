@@ -0,0 +1,164 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import shutil
+import sys
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+FREE_SPACE_MARGIN = 64 * 1024 * 1024  # Space (64 MB) left free on top of what a download needs
+FSYNC_BEFORE_RENAME = True  # Flush a finished file to disk before it gets its real name
+
+FALLOC_FL_KEEP_SIZE = 0x01  # Reserve blocks without changing the file size
+FICLONE = 0x40049409  # Linux ioctl sharing a file's blocks copy-on-write (btrfs, XFS, bcachefs...)
+LINK_METHODS = ('hardlink', 'reflink', 'copy')
+
+_fallocate = None
+if sys.platform.startswith('linux'):
+    try:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        _fallocate = _libc.fallocate
+        _fallocate.argtypes = (ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64)
+        _fallocate.restype = ctypes.c_int
+    except (OSError, AttributeError):
+        _fallocate = None
+
+
+def preallocate(fd, offset, length, keep_size=False):
+    """
+    Reserves disk blocks for `length` bytes at `offset` of an open file, so a large
+    download is laid out contiguously and a full disk shows up now rather than halfway.
+
+    Uses the fallocate system call directly: unlike posix_fallocate it fails instead of
+    writing zeros on filesystems that can't allocate (NFS before 4.2, SMB, FAT), which is
+    when this quietly does nothing - or, without `keep_size`, extends the file sparsely.
+    Args:
+        fd (int): The open file descriptor.
+        offset (int): Start of the range.
+        length (int): Bytes to reserve.
+        keep_size (bool): Leave the file size as it is (so a .part file's size still tells
+                          how much has been downloaded).
+
+    Returns:
+        bool: True if the blocks were actually reserved.
+
+    Raises:
+        OSError: ENOSPC if the disk doesn't have room.
+    """
+    if length <= 0:
+        return False
+    if _fallocate is not None:
+        if _fallocate(fd, FALLOC_FL_KEEP_SIZE if keep_size else 0, offset, length) == 0:
+            return True
+        error = ctypes.get_errno()
+        if error in (errno.ENOSPC, getattr(errno, 'EDQUOT', errno.ENOSPC)):
+            raise OSError(error, os.strerror(error))
+        # EOPNOTSUPP and friends - the filesystem can't do it, fall through
+    if not keep_size and os.fstat(fd).st_size < offset + length:
+        os.ftruncate(fd, offset + length)  # Sparse, but at least the size is right
+    return False
+
+
+def ensure_free_space(path, needed, margin=FREE_SPACE_MARGIN):
+    """
+    Checks that the filesystem holding `path` can take `needed` more bytes.
+    Raises:
+        OSError: ENOSPC (never retried) if it can't.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    free = shutil.disk_usage(directory).free
+    if needed + margin > free:
+        raise OSError(errno.ENOSPC, f"Not enough free space in {directory}: "
+                                    f"{needed // (1024 * 1024)} MB needed, {free // (1024 * 1024)} MB free")
+
+
+def commit_file(temp_path, final_path):
+    """
+    Atomically gives a finished temporary file its real name. The data is flushed first,
+    so after a crash the real name holds either nothing or the complete file.
+    """
+    if FSYNC_BEFORE_RENAME:
+        with open(temp_path, "rb+") as f:
+            os.fsync(f.fileno())
+    os.replace(temp_path, final_path)
+    if FSYNC_BEFORE_RENAME and hasattr(os, 'O_DIRECTORY'):
+        # Make the rename itself durable (POSIX; Windows has no directory handles)
+        fd = os.open(os.path.dirname(os.path.abspath(final_path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass  # Some filesystems (e.g. certain network mounts) refuse directory fsync
+        finally:
+            os.close(fd)
+
+
+def reflink(source, target):
+    """
+    Makes `target` a copy-on-write clone of `source`: no data is copied and the two files
+    only diverge when one of them is written to.
+    Raises:
+        OSError: If the filesystem (or platform) can't clone files.
+    """
+    if fcntl is None or not sys.platform.startswith('linux'):
+        raise OSError(errno.EOPNOTSUPP, "reflinks are only supported on Linux")
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(target)
+            raise
+
+
+def link_file(source, target, prefer='hardlink'):
+    """
+    Puts the contents of `source` at `target` as cheaply as the filesystem allows: a hard link
+    (same inode), a reflink (shared blocks) or, across filesystems, a plain copy. `target` is
+    replaced atomically if it exists.
+    Args:
+        prefer (str): The method tried first ('hardlink', 'reflink' or 'copy'); only the
+                      methods after it in LINK_METHODS are fallbacks, so a reflink never
+                      turns into a hard link that shares later writes.
+
+    Returns:
+        str: The method that worked.
+    """
+    if os.path.exists(target) and os.path.samefile(source, target):
+        return 'hardlink'  # Already linked (renaming a link over itself would do nothing anyway)
+    methods = LINK_METHODS[LINK_METHODS.index(prefer):]
+    temp = target + ".link.part"
+    for method in methods:
+        if os.path.lexists(temp):
+            os.remove(temp)
+        try:
+            if method == 'hardlink':
+                os.link(source, temp)
+            elif method == 'reflink':
+                reflink(source, temp)
+            else:
+                shutil.copyfile(source, temp)
+        except OSError:
+            if method == methods[-1]:
+                raise
+            continue  # EXDEV, EPERM, EOPNOTSUPP... - try the next method
+        os.replace(temp, target)
+        return method
+
+
+def break_link(path):
+    """
+    Gives a hard-linked file its own copy, so changing it in place leaves the other names
+    (e.g. a content store blob) alone.
+    Returns:
+        bool: True if there was a link to break.
+    """
+    if os.stat(path).st_nlink < 2:
+        return False
+    temp = path + ".unlink.part"
+    shutil.copyfile(path, temp)
+    os.replace(temp, path)
+    return True
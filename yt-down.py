@@ -1,5 +1,5 @@
-import requests
 from time import time
+from playlist_downloader.http_client import get_session
 
 # Simulated API response
 response_data = {
@@ -20,7 +20,7 @@ def download_file_from_response(data):
     print(f"📥 Starting download: {filename}")
     print(f"🔗 URL: {download_url}")
 
-    response = requests.get(download_url, stream=True)
+    response = get_session().get(download_url, stream=True)
     response.raise_for_status()
 
     total = int(response.headers.get("content-length", 0))